@@ -0,0 +1,257 @@
+import atexit
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+from context_window import estimate_tokens
+from storage_backend import open_catalog
+from user_storage import USER_OPEN_STORES
+
+# ------------------------------
+# Automatic chat titles
+# ------------------------------
+# A new chat is listed at once under a placeholder: the first words of its
+# first message. After the reply has been shown, a background thread finds
+# a better title. It writes all titles found since its last write in one
+# catalog transaction per data directory. The sidebar shows the new title
+# on the next run. A chat renamed by hand in the meantime keeps its name.
+#
+#   AUTO_TITLE        keywords, model or off                         (default keywords)
+#   AUTO_TITLE_MODEL  model asked for titles with AUTO_TITLE=model   (default gemini-2.5-flash-lite)
+#   AUTO_TITLE_WORDS  most words in a title                          (default 5)
+#
+#   keywords  the words of the first message and reply that say the most
+#             about them, leaving out common English, Croatian and Italian
+#             words; computed locally in well under a millisecond
+#   model     one short request to AUTO_TITLE_MODEL under the shared rate
+#             limiter; the keyword title is used if the request fails
+#
+# A failed catalog write is logged, and those chats keep their placeholder.
+
+AUTO_TITLE = os.environ.get("AUTO_TITLE", "keywords")
+AUTO_TITLE_MODEL = os.environ.get("AUTO_TITLE_MODEL", "gemini-2.5-flash-lite")
+AUTO_TITLE_WORDS = int(os.environ.get("AUTO_TITLE_WORDS", 5))
+MODES = ("keywords", "model", "off")
+
+TITLE_MAX_CHARS = 50  # the rename box takes no more
+MODEL_INPUT_CHARS = 2000  # of the message and of the reply, sent to the model
+
+TITLE_PROMPT = (
+    "Write a title of at most {words} words for a conversation that starts with "
+    "the message and reply below. Use the language of the message and answer "
+    "with the title only.\n\nMessage: {prompt}\n\nReply: {reply}"
+)
+
+# Words that say nothing about what a chat is about
+STOPWORDS = frozenset("""
+    about above after again all also and any are because been before being below
+    between both but can could did does doing down during each few for from further
+    had has have having her here hers herself him himself his how into its itself
+    just more most myself nor not now off once only other our ours ourselves out over
+    own same she should some such than that the their theirs them themselves then
+    there these they this those through too under until very was were what when where
+    which while who whom why will with would you your yours yourself yourselves
+    hello thanks thank please tell give explain write show make want need know like
+    let get use using one two three four five many much well way example examples
+    sure here's it's i'm can't don't i've you're that's there's what's let's
+    ali ako bez biti bio bila bilo bili čak dok gdje iako ili između jer još kad
+    kada kako koja koje koji kojeg kojem kojim kroz među mene meni mogu može možeš
+    moj moja moje molim nad nakon nam nas naš naša naše neki neka neko nije niti
+    oko ona one oni ono ova ove ovaj ovo pod prema pri reci objasni napiši daj
+    sam samo sebe smo ste što svoj svoja svoje tako također tebe tebi tko vam vas
+    već vrlo zašto bok hvala
+    alla alle agli anche ancora che chi come con cosa dai dal dalla dalle degli
+    del della delle dei dove essere gli hai hanno per più poi può puoi quale
+    quali quando questo questa questi queste quello quella sono sei siamo siete
+    sul sulla sulle suo sua suoi tra una uno però perché dimmi spiega scrivi
+    mostra fammi ciao grazie favore molto tutto tutti nel nella nelle negli
+""".split())
+
+_WORD = re.compile(r"[^\W\d_][\w'’-]*")
+
+log = logging.getLogger("chat.titles")
+
+
+def keyword_title(prompt, reply="", words=None):
+    """Title made of the words that say the most about a chat's first turn, or None.
+
+    Words of the message count twice as much as words of the reply; the
+    chosen words keep the order and spelling they first appeared with.
+    """
+    words = AUTO_TITLE_WORDS if words is None else words
+    scores, first_seen, spelling = {}, {}, {}
+    for weight, text in ((2.0, prompt), (1.0, reply)):
+        for match in _WORD.finditer(text or ""):
+            word = match.group().strip("'’-")
+            key = word.lower()
+            if len(key) < 3 or key in STOPWORDS:
+                continue
+            scores[key] = scores.get(key, 0.0) + weight
+            if key not in first_seen:
+                first_seen[key] = len(first_seen)
+                spelling[key] = word
+    if not scores:
+        return None
+    best = sorted(scores, key=lambda key: (-scores[key], first_seen[key]))[:words]
+    best.sort(key=first_seen.get)
+    return _clean(" ".join(spelling[key] for key in best))
+
+
+def _clean(title):
+    """First line of `title` without quotes or markup, capitalized, at most TITLE_MAX_CHARS."""
+    lines = (title or "").strip().splitlines()
+    title = lines[0].strip(" \t\"'“”«»*#.:") if lines else ""
+    if len(title) > TITLE_MAX_CHARS:
+        title = title[:TITLE_MAX_CHARS].rsplit(" ", 1)[0]
+    return title[:1].upper() + title[1:] if title else None
+
+
+class TitleQueue:
+    """Background thread giving new chats a better title than their placeholder."""
+
+    def __init__(self, mode=None, model=None, words=None):
+        self.mode = mode or AUTO_TITLE
+        if self.mode not in MODES:
+            raise ValueError(f"AUTO_TITLE must be one of {', '.join(MODES)}, not {self.mode!r}")
+        self.model = model or AUTO_TITLE_MODEL
+        self.words = AUTO_TITLE_WORDS if words is None else words
+        self._cond = threading.Condition()
+        self._pending = []  # (data_dir, chat_id, placeholder, prompt, reply, sender)
+        self._busy = False
+        self._closed = False
+        self._counters = dict(submitted=0, renamed=0, kept=0, model_errors=0, writes=0, errors=0)
+        self._title_seconds = 0.0
+        self._titled = 0
+        self._thread = threading.Thread(target=self._run, name="titles", daemon=True)
+        self._thread.start()
+
+    def submit(self, data_dir, chat_id, placeholder, prompt, reply, sender=None):
+        """Queue a new chat; `sender` (see rate_limit.py) is needed with AUTO_TITLE=model."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The title queue is closed")
+            self._pending.append((data_dir, chat_id, placeholder, prompt, reply, sender))
+            self._counters["submitted"] += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout=30):
+        """Wait until every queued chat has its title. False after `timeout` seconds."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def close(self, timeout=30):
+        """Title everything still queued and stop the thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def title(self, prompt, reply, sender=None):
+        """The title for a chat whose first turn is `prompt` and `reply`, or None."""
+        if self.mode == "model" and sender is not None:
+            try:
+                return self._model_title(prompt, reply, sender)
+            except Exception:
+                log.warning("Asking %s for a title failed, using keywords", self.model, exc_info=True)
+                with self._cond:
+                    self._counters["model_errors"] += 1
+        return keyword_title(prompt, reply, self.words)
+
+    def _model_title(self, prompt, reply, sender):
+        request = TITLE_PROMPT.format(
+            words=self.words, prompt=prompt[:MODEL_INPUT_CHARS], reply=reply[:MODEL_INPUT_CHARS]
+        )
+        sender.limiter.acquire(estimate_tokens(request))
+        response = sender.client.models.generate_content(
+            model=self.model,
+            contents=request,
+            config={"temperature": 0.2, "max_output_tokens": 4 * self.words + 8},
+        )
+        return _clean(response.text) or keyword_title(prompt, reply, self.words)
+
+    def stats(self):
+        with self._cond:
+            return dict(
+                self._counters,
+                mode=self.mode,
+                queued=len(self._pending),
+                avg_title_ms=round(self._title_seconds * 1000 / self._titled, 3) if self._titled else None,
+            )
+
+    def prometheus(self):
+        """Title metrics in Prometheus text format (added to METRICS_FILE)."""
+        stats = self.stats()
+        return "\n".join([
+            "# HELP chat_titles_queued New chats waiting for a title.",
+            "# TYPE chat_titles_queued gauge",
+            f"chat_titles_queued {stats['queued']}",
+            "# HELP chat_titles_renamed_total Chats given a title in the background.",
+            "# TYPE chat_titles_renamed_total counter",
+            f"chat_titles_renamed_total {stats['renamed']}",
+            "# HELP chat_titles_catalog_writes_total Catalog transactions writing titles.",
+            "# TYPE chat_titles_catalog_writes_total counter",
+            f"chat_titles_catalog_writes_total {stats['writes']}",
+        ]) + "\n"
+
+    # ------------------------------
+    # Background thread
+    # ------------------------------
+    def _run(self):
+        catalogs = OrderedDict()  # the USER_OPEN_STORES data directories written most recently
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return  # closed and nothing left
+                batch, self._pending = self._pending, []
+                self._busy = True
+
+            started = time.perf_counter()
+            titles = {}  # data_dir -> {chat_id: (placeholder, title)}
+            kept = 0
+            for data_dir, chat_id, placeholder, prompt, reply, sender in batch:
+                title = self.title(prompt, reply, sender)
+                if title and title != placeholder:
+                    titles.setdefault(data_dir, {})[chat_id] = (placeholder, title)
+                else:
+                    kept += 1
+            elapsed = time.perf_counter() - started
+
+            renamed = writes = errors = 0
+            for data_dir, changes in titles.items():
+                try:
+                    catalog = catalogs.pop(data_dir, None) or open_catalog(data_dir)
+                    catalogs[data_dir] = catalog
+                    while len(catalogs) > USER_OPEN_STORES:
+                        catalogs.popitem(last=False)
+                    renamed += catalog.replace_titles(changes)
+                    writes += 1
+                except Exception:
+                    log.exception("Saving %d chat title(s) failed", len(changes))
+                    errors += 1
+
+            with self._cond:
+                self._counters["renamed"] += renamed
+                self._counters["kept"] += kept + sum(map(len, titles.values())) - renamed
+                self._counters["writes"] += writes
+                self._counters["errors"] += errors
+                self._title_seconds += elapsed
+                self._titled += len(batch)
+                self._busy = False
+                self._cond.notify_all()
+
+
+@st.cache_resource(show_spinner=False)
+def get_title_queue():
+    """The process-wide title queue, or None when AUTO_TITLE is off."""
+    if AUTO_TITLE == "off":
+        return None
+    title_queue = TitleQueue()
+    atexit.register(title_queue.close)
+    return title_queue
@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from chat_core import MODEL_NAME
+from context_window import ContextWindowManager
+from gemini_client import build_client
+from rate_limit import RateLimiter, ResilientSender
+from response_cache import RESPONSE_CACHE, ResponseCache, turn_contents
+from send_executor import GEMINI_WORKERS
+
+# ------------------------------
+# Batch mode
+# ------------------------------
+# Runs a JSONL file of prompts through the same chat logic as the app
+# (context window, rate limiter, retries, response cache) without the UI:
+#
+#   python batch_chat.py prompts.jsonl results.jsonl [--workers 8] [--cache]
+#
+# Each input line is one conversation, either a single prompt or several
+# turns sent in order in the same chat:
+#
+#   {"id": "q1", "prompt": "What is HTTP keep-alive?"}
+#   {"id": "c7", "turns": ["Suggest a name for a cat", "Now one for a dog"]}
+#
+# Conversations run concurrently on --workers threads (default
+# GEMINI_WORKERS) and each one is appended to the output file as soon as it
+# finishes:
+#
+#   {"id": "q1", "turns": [{"prompt": ..., "reply": ..., "cached": false,
+#    "seconds": 1.9}], "error": null, "seconds": 1.9}
+#
+# The output file is also the checkpoint: rerunning the same command skips
+# the ids that already have a result without an error, so an interrupted run
+# resumes where it stopped and failed conversations are tried again. A line
+# that is not valid JSON or has no prompt gets an error result of its own
+# instead of stopping the run. A last
+# line cut short by a crash is removed before anything is appended. With
+# --cache (or RESPONSE_CACHE=1) replies are read from and written to the
+# app's response cache in data/, which pre-warms it for the UI.
+
+
+def read_conversations(path):
+    """Yield (id, [prompts], error) for every line of the input file.
+
+    A line that is not a conversation yields no prompts and the reason as
+    `error`; its id is "line-N" unless the line has one.
+    """
+    # Read as bytes: a line that is not UTF-8 is reported like any other bad line
+    with open(path, "rb") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            conversation_id = f"line-{number}"
+            try:
+                item = json.loads(line.decode("utf-8"))
+                conversation_id = str(item.get("id", conversation_id))
+                turns = item.get("turns")
+                if turns is None:
+                    turns = [item["prompt"]]
+                if not isinstance(turns, list) or not all(isinstance(turn, str) for turn in turns):
+                    raise ValueError("turns must be a list of strings")
+            except (ValueError, AttributeError, KeyError) as e:
+                yield conversation_id, [], f"Invalid input line {number}: {type(e).__name__}: {e}"
+                continue
+            yield conversation_id, turns, None
+
+
+def completed_ids(path):
+    """Ids that already have a successful result in the output file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    # Read as bytes: a line cut short by a crash may end inside a UTF-8 character
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                continue  # cut short, removed by ResultWriter
+            try:
+                result = json.loads(line)
+                if not result.get("error"):
+                    done.add(result["id"])
+            except (ValueError, AttributeError, KeyError):
+                continue  # not a result line (UnicodeDecodeError is a ValueError)
+    return done
+
+
+def _drop_torn_line(f):
+    """Truncate `f` (binary) after its last newline, if it does not end with one."""
+    end = f.seek(0, os.SEEK_END)
+    if end == 0:
+        return
+    f.seek(end - 1)
+    if f.read(1) == b"\n":
+        return
+    block_start = end
+    while block_start > 0:
+        block_end, block_start = block_start, max(block_start - 65536, 0)
+        f.seek(block_start)
+        newline = f.read(block_end - block_start).rfind(b"\n")
+        if newline >= 0:
+            f.truncate(block_start + newline + 1)
+            return
+    f.truncate(0)
+
+
+class ResultWriter:
+    """Appends results to the output file, one flushed line each."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, "ab+")
+        # A line the previous run died in the middle of is not a result
+        _drop_torn_line(self._file)
+
+    def write(self, result):
+        line = (json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class BatchRunner:
+    """Sends conversations the way the app does, one chat per conversation."""
+
+    def __init__(self, client, model, sender, cache=None):
+        self.client = client
+        self.model = model
+        self.sender = sender
+        self.cache = cache
+        self.context_window = ContextWindowManager()
+
+    def run(self, conversation_id, prompts):
+        started = time.monotonic()
+        history = []
+        turns = []
+        error = None
+        for prompt in prompts:
+            turn_started = time.monotonic()
+            window = self.context_window.apply(history)
+            try:
+                reply, cached = self._send(prompt, window)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                break
+            history.extend(turn_contents(prompt, reply))
+            turns.append({
+                "prompt": prompt,
+                "reply": reply,
+                "cached": cached,
+                "seconds": round(time.monotonic() - turn_started, 3),
+            })
+        return {
+            "id": conversation_id,
+            "turns": turns,
+            "error": error,
+            "seconds": round(time.monotonic() - started, 3),
+        }
+
+    def _send(self, prompt, window):
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(self.model, prompt, window.history, window.config)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached, True
+
+        chat = self.client.chats.create(
+            model=self.model, history=window.history, config=window.config
+        )
+        stream = self.sender.stream(chat, prompt, window.sent_tokens, window.config)
+        reply = "".join(chunk.text or "" for chunk in stream)
+        if self.cache is not None:
+            self.cache.put(key, reply)
+        return reply, False
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a JSONL file of prompts through Gemini without the UI."
+    )
+    parser.add_argument("input", help="JSONL file, one conversation per line")
+    parser.add_argument("output", help="JSONL results file (appended, used to resume)")
+    parser.add_argument("--workers", type=int, default=GEMINI_WORKERS)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--cache", action="store_true", default=RESPONSE_CACHE,
+                        help="use and fill the app's response cache in data/")
+    args = parser.parse_args()
+
+    load_dotenv()
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        sys.exit("GOOGLE_API_KEY environment variable not found. Check your .env file.")
+
+    client = build_client(api_key)
+    sender = ResilientSender(client, args.model, RateLimiter())
+    cache = ResponseCache("data") if args.cache else None
+    runner = BatchRunner(client, args.model, sender, cache)
+
+    done = completed_ids(args.output)
+    writer = ResultWriter(args.output)
+    # At most two conversations per worker are read ahead of the pool
+    slots = threading.BoundedSemaphore(args.workers * 2)
+    counts = dict(ok=0, failed=0, skipped=0)
+    counts_lock = threading.Lock()
+
+    def finish(result):
+        writer.write(result)
+        with counts_lock:
+            counts["failed" if result["error"] else "ok"] += 1
+            print(f"{result['id']}: {result['error'] or 'ok'} "
+                  f"({result['seconds']:.1f} s)", file=sys.stderr)
+
+    def work(conversation_id, prompts):
+        try:
+            finish(runner.run(conversation_id, prompts))
+        except Exception as e:
+            # Not in the output file, so it is run again next time
+            with counts_lock:
+                counts["failed"] += 1
+                print(f"{conversation_id}: not saved: {type(e).__name__}: {e}", file=sys.stderr)
+        finally:
+            slots.release()
+
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(args.workers, thread_name_prefix="batch") as pool:
+            for conversation_id, prompts, error in read_conversations(args.input):
+                if conversation_id in done:
+                    counts["skipped"] += 1
+                    continue
+                if error is not None:
+                    finish({"id": conversation_id, "turns": [], "error": error, "seconds": 0.0})
+                    continue
+                slots.acquire()
+                pool.submit(work, conversation_id, prompts)
+    finally:
+        writer.close()
+
+    print(f"{counts['ok']} done, {counts['failed']} failed, {counts['skipped']} already "
+          f"done in {args.output}, {time.monotonic() - started:.1f} s; "
+          f"{sender.stats()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Load test of the chat app against the fake Gemini backend.
+
+Replays a JSONL workload (one {"prompt": ...} per line) through the real
+app script with Streamlit's AppTest: every simulated session is its own
+AppTest, sessions run concurrently in threads inside one process (like one
+Streamlit server), and replies come from benchmarks/fake_gemini.py, so no
+API credits are used. Each scenario combines a number of concurrent
+sessions with a history length (turns already in every session's chat)
+and reports turn latency percentiles, throughput and memory per session
+(growth of the process RSS while the sessions are alive).
+
+    python benchmarks/bench_load.py [--workload benchmarks/workload.jsonl]
+                                    [--sessions 1,4,16] [--history 0,100,500]
+                                    [--turns 5] [--reply-words 200]
+                                    [--chunk-words 20] [--first-delay 0.3]
+                                    [--chunk-delay 0.02]
+
+The app runs in a temporary working directory, so the repo's data/ folder
+is not touched.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import fake_gemini  # noqa: E402
+from chat_catalog import ChatCatalog  # noqa: E402
+from chat_store import TranscriptStore  # noqa: E402
+from response_cache import turn_contents  # noqa: E402
+
+
+def load_workload(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["prompt"] for line in f if line.strip()]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def rss_bytes():
+    # Current resident set size; falls back to the peak where /proc is missing
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def seed_chat(chat_id, turns, reply_words):
+    """Write a chat that already has `turns` turns, as the app would."""
+    transcripts = TranscriptStore("data")
+    reply = " ".join(f"w{i}" for i in range(reply_words))
+    for i in range(turns):
+        prompt = f"earlier question {i}"
+        messages = [
+            dict(role="user", content=prompt),
+            dict(role="ai", content=reply, avatar="✨"),
+        ]
+        transcripts.append_turn(chat_id, messages, turn_contents(prompt, reply))
+    ChatCatalog("data").create(chat_id, f"seeded {chat_id}", message_count=2 * turns)
+
+
+def run_session(script, chat_id, prompts, latencies, app_turns, errors):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(script, default_timeout=120)
+    if chat_id is not None:
+        at.session_state["chat_id"] = chat_id
+    at.run()
+    for prompt in prompts:
+        started = time.perf_counter()
+        at.chat_input[0].set_value(prompt).run()
+        latencies.append(time.perf_counter() - started)
+        if at.exception:
+            errors.append(at.exception[0].value)
+            return at
+    app_turns.extend(at.session_state["recent_turns"] if "recent_turns" in at.session_state else [])
+    return at
+
+
+def run_scenario(args, script, prompts, sessions, history):
+    latencies, app_turns, errors, apps = [], [], [], []
+    chat_ids = []
+    for s in range(sessions):
+        chat_id = None
+        if history:
+            chat_id = f"load-{sessions}-{history}-{s}"
+            seed_chat(chat_id, history, args.reply_words)
+        chat_ids.append(chat_id)
+
+    gc.collect()
+    rss_before = rss_bytes()
+
+    def worker(s):
+        # Sessions start at different prompts, like independent users
+        offset = s % len(prompts)
+        mine = (prompts[offset:] + prompts[:offset])[:args.turns]
+        apps.append(run_session(script, chat_ids[s], mine, latencies, app_turns, errors))
+
+    threads = [threading.Thread(target=worker, args=(s,)) for s in range(sessions)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    gc.collect()
+    rss_growth = max(0, rss_bytes() - rss_before)
+    ttft = [t["ttft"] for t in app_turns if t.get("ttft") is not None]
+    result = {
+        "sessions": sessions,
+        "history": history,
+        "turns": len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "ttft_p50": statistics.median(ttft) if ttft else 0.0,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "mem_per_session": rss_growth / sessions,
+        "errors": errors,
+    }
+    del apps
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workload", default=os.path.join(ROOT, "benchmarks", "workload.jsonl"))
+    parser.add_argument("--script", default=os.path.join(ROOT, "app_chat.py"))
+    parser.add_argument("--sessions", default="1,4,16")
+    parser.add_argument("--history", default="0,100,500")
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--reply-words", type=int, default=200)
+    parser.add_argument("--chunk-words", type=int, default=20)
+    parser.add_argument("--first-delay", type=float, default=0.3)
+    parser.add_argument("--chunk-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    prompts = load_workload(args.workload)
+    script = os.path.abspath(args.script)
+    fake_gemini.install(
+        reply_words=args.reply_words,
+        chunk_words=args.chunk_words,
+        first_delay=args.first_delay,
+        chunk_delay=args.chunk_delay,
+    )
+    os.environ.setdefault("GOOGLE_API_KEY", "fake")
+    # Session threads have no script context; Streamlit warns about it on every run
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+
+    workdir = tempfile.mkdtemp(prefix="chat-load-")
+    os.chdir(workdir)
+    os.makedirs("data", exist_ok=True)
+    print(f"workload {os.path.basename(args.workload)}: {len(prompts)} prompts, "
+          f"{args.turns} turns per session, fake replies of {args.reply_words} words "
+          f"(first chunk {args.first_delay:g} s, then {args.chunk_delay:g} s per chunk)")
+    print(f"working directory {workdir}\n")
+
+    # Imports, the shared client and the caches are set up once per process;
+    # keep that out of the first scenario
+    run_session(script, None, prompts[:1], [], [], [])
+
+    header = (f"{'sessions':>8} {'history':>8} {'turns':>6} {'p50 s':>7} {'p95 s':>7} "
+              f"{'p99 s':>7} {'ttft s':>7} {'turns/s':>8} {'MB/session':>11}")
+    print(header)
+    print("-" * len(header))
+    for history in (int(h) for h in args.history.split(",")):
+        for sessions in (int(s) for s in args.sessions.split(",")):
+            r = run_scenario(args, script, prompts, sessions, history)
+            print(f"{r['sessions']:>8} {r['history']:>8} {r['turns']:>6} {r['p50']:>7.3f} "
+                  f"{r['p95']:>7.3f} {r['p99']:>7.3f} {r['ttft_p50']:>7.3f} "
+                  f"{r['throughput']:>8.2f} {r['mem_per_session'] / 2**20:>11.2f}")
+            for error in r["errors"][:3]:
+                print(f"    error: {error}")
+
+
+if __name__ == "__main__":
+    main()
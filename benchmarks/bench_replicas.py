@@ -0,0 +1,163 @@
+"""Several app replicas serving the same chats, per storage backend.
+
+Starts --replicas processes that each save --turns turns to --chats shared
+chats picked at random, the way a load balancer without sticky sessions
+spreads them: every turn opens the chat as the replica currently sees it,
+queues the turn (PERSIST_MODE=sync) and now and then searches. With files
+and sqlite the replicas share one data directory, as they would on a
+shared volume; with redis each has a directory of its own and only the
+Redis server is shared. The server is fakeredis's TCP server unless
+--redis-url is given.
+
+Afterwards every replica checks what it sees: every turn saved by any
+replica must be in its chat exactly once and found by its search index,
+and the catalog counts must add up.
+
+    python benchmarks/bench_replicas.py [--replicas 4] [--chats 5] [--turns 200]
+                                        [--backends files,sqlite,redis] [--redis-url URL]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def replica(number, backend, redis_url, directory, replicas, chats, turns, barrier, results):
+    # The storage modules read their settings when imported
+    os.environ.update(STORAGE_BACKEND=backend, REDIS_URL=redis_url or "", PERSIST_MODE="sync")
+    os.chdir(directory)
+    sys.path.insert(0, ROOT)
+    from persist_queue import PersistQueue
+    from response_cache import turn_contents
+    from search_index import SearchIndex
+    from storage_backend import open_catalog, open_transcripts
+
+    rng = random.Random(number)
+    transcripts, catalog = open_transcripts(), open_catalog()
+    index = SearchIndex()
+    queue = PersistQueue()
+    for chat_id in chats:
+        catalog.create(chat_id, chat_id)
+
+    load_times, save_times, search_times = [], [], []
+    for turn in range(turns):
+        chat_id = rng.choice(chats)
+        started = time.perf_counter()
+        messages, _ = transcripts.load(chat_id)
+        load_times.append(time.perf_counter() - started)
+
+        prompt, reply = f"r{number}t{turn}x", "reply " * rng.randint(5, 100)
+        new = [dict(role="user", content=prompt), dict(role="ai", content=reply)]
+        started = time.perf_counter()
+        queue.submit(chat_id, new, turn_contents(prompt, reply), start=len(messages))
+        save_times.append(time.perf_counter() - started)
+
+        if turn % 5 == 0:
+            started = time.perf_counter()
+            index.search(f"r{rng.randrange(replicas)}t{rng.randrange(turn + 1)}x")
+            search_times.append(time.perf_counter() - started)
+    queue.close()
+    barrier.wait()
+
+    # Everything every replica saved, as this one sees it
+    expected = {f"r{r}t{t}x" for r in range(replicas) for t in range(turns)}
+    in_chats = Counter()
+    for chat_id in chats:
+        messages, _ = transcripts.load(chat_id)
+        in_chats.update(m["content"] for m in messages if m["role"] == "user")
+    found = sum(bool(index.search(token)) for token in expected)
+    results.put(dict(
+        load=statistics.median(load_times), save=statistics.median(save_times),
+        search=statistics.median(search_times),
+        missing=len(expected - set(in_chats)), duplicated=sum(n > 1 for n in in_chats.values()),
+        found=found, expected=len(expected),
+        counted=sum(catalog.get(chat_id)["message_count"] for chat_id in chats),
+    ))
+
+
+def fake_redis_server():
+    from fakeredis import TcpFakeServer
+
+    class Server(TcpFakeServer):
+        def get_request(self):
+            # Without this, answers to pipelined commands wait ~40 ms (Nagle)
+            conn, address = super().get_request()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return conn, address
+
+    server = Server(("127.0.0.1", 0), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"redis://{host}:{port}/0"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replicas", type=int, default=4)
+    parser.add_argument("--chats", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--backends", default="files,sqlite,redis")
+    parser.add_argument("--redis-url", help="a Redis server to use instead of fakeredis")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    chats = [f"chat{c}" for c in range(args.chats)]
+    print(f"{args.replicas} replicas x {args.turns} turns over {args.chats} chats, medians")
+    for backend in args.backends.split(","):
+        server, redis_url = None, args.redis_url
+        if backend == "redis" and redis_url is None:
+            server, redis_url = fake_redis_server()
+        directory = tempfile.mkdtemp(prefix="chat-replicas-")
+        try:
+            barrier, results = context.Barrier(args.replicas), context.Queue()
+            workers = []
+            for number in range(args.replicas):
+                # Only the redis replicas have directories of their own
+                replica_dir = os.path.join(directory, str(number) if backend == "redis" else "shared")
+                os.makedirs(replica_dir, exist_ok=True)
+                workers.append(context.Process(target=replica, args=(
+                    number, backend, redis_url, replica_dir, args.replicas, chats, args.turns,
+                    barrier, results,
+                )))
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            reports = [results.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            shutil.rmtree(directory)
+            if server is not None:
+                server.shutdown()
+
+        total = args.replicas * args.turns
+        print(f"  {backend:<7} {total / elapsed:7.0f} turns/s   "
+              f"load {statistics.median(r['load'] for r in reports) * 1000:6.2f} ms   "
+              f"save {statistics.median(r['save'] for r in reports) * 1000:6.2f} ms   "
+              f"search {statistics.median(r['search'] for r in reports) * 1000:6.2f} ms")
+        ok = all(
+            not r["missing"] and not r["duplicated"] and r["found"] == r["expected"]
+            and r["counted"] == 2 * total
+            for r in reports
+        )
+        print(f"          every replica sees all {total} turns once, finds them and counts them: "
+              f"{'yes' if ok else 'NO'}")
+        if not ok:
+            for number, r in enumerate(reports):
+                print(f"          replica {number}: {r['missing']} missing, {r['duplicated']} duplicated, "
+                      f"{r['found']}/{r['expected']} found, {r['counted']} messages counted")
+
+
+if __name__ == "__main__":
+    main()
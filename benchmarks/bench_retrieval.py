@@ -0,0 +1,96 @@
+"""Indexing cost, lookup latency and hit rate of the retrieval memory.
+
+Fills a fresh retrieval index turn by turn, the way the app does on every
+save, with synthetic chats. One user message in every chat states a fact
+made of rare words; each lookup asks for one of those facts in other words
+of the same sentence and counts a hit when that message is among the
+passages returned. It also compares the tokens the passages add to a
+request with the tokens of the whole chat they were taken from.
+
+    python benchmarks/bench_retrieval.py [--chats 1000] [--turns 10] [--queries 200]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_window import estimate_tokens  # noqa: E402
+from retrieval_memory import RetrievalMemory  # noqa: E402
+
+# Zipf-like vocabulary: a few common words and a long tail of rare ones
+VOCABULARY = [f"word{i}" for i in range(20000)]
+WEIGHTS = [1 / (i + 1) for i in range(len(VOCABULARY))]
+
+
+def sentence(rng, words):
+    return " ".join(rng.choices(VOCABULARY, WEIGHTS, k=words))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    directory = tempfile.mkdtemp(prefix="chat-retrieval-")
+    try:
+        memory = RetrievalMemory(directory)
+        facts = []  # (chat, position, the fact's rare words)
+        chat_tokens = {}
+        save_times = []
+        started = time.perf_counter()
+        for chat in range(args.chats):
+            fact_turn = rng.randrange(args.turns)
+            for turn in range(args.turns):
+                prompt = sentence(rng, 15)
+                if turn == fact_turn:
+                    rare = rng.sample(VOCABULARY[10000:], 6)
+                    prompt = f"{prompt} remember {' '.join(rare)}"
+                    facts.append((str(chat), turn * 2, rare))
+                messages = [dict(role="user", content=prompt), dict(role="ai", content=sentence(rng, 120))]
+                chat_tokens[str(chat)] = chat_tokens.get(str(chat), 0) + sum(
+                    estimate_tokens(m["content"]) for m in messages
+                )
+                t = time.perf_counter()
+                memory.add_messages(str(chat), turn * 2, messages)
+                save_times.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - started
+        print(f"indexed {args.chats} chats, {args.chats * args.turns * 2} messages in {elapsed:.1f} s")
+        print(f"  per saved turn: median {statistics.median(save_times) * 1000:.2f} ms, "
+              f"max {max(save_times) * 1000:.2f} ms")
+
+        t = time.perf_counter()
+        memory.search("word1")
+        print(f"  first lookup (reads the index): {(time.perf_counter() - t) * 1000:.0f} ms")
+
+        times, hits, added, full = [], 0, [], []
+        for chat, position, rare in rng.sample(facts, min(args.queries, len(facts))):
+            query = f"{sentence(rng, 6)} {' '.join(rng.sample(rare, 3))}"
+            t = time.perf_counter()
+            results = memory.search(query)
+            times.append(time.perf_counter() - t)
+            hits += any(e["chat_id"] == chat and e["position"] == position for _, e in results)
+            added.append(estimate_tokens(memory.recall(query) or ""))
+            full.append(chat_tokens[chat])
+        times.sort()
+        stats = memory.stats()
+        print(f"  {stats['passages']} passages, {stats['resident_bytes'] / 2**20:.1f} MiB in memory")
+        print(f"  lookup p50 {statistics.median(times) * 1000:.2f} ms   "
+              f"p95 {times[int(len(times) * 0.95) - 1] * 1000:.2f} ms")
+        print(f"  hit rate (fact in top {memory.top_k}): {hits / len(times):.0%}")
+        print(f"  tokens added per request {statistics.mean(added):.0f}, "
+              f"whole chat {statistics.mean(full):.0f}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Indexing cost and query latency of the full-text chat search.
+
+Fills a fresh search index turn by turn, the way the app does on every
+save, with synthetic chats, then times searches for single words, two-word
+queries and prefixes.
+
+    python benchmarks/bench_search.py [--chats 20000] [--turns 5] [--queries 200]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import SearchIndex  # noqa: E402
+
+# Zipf-like vocabulary: a few common words and a long tail of rare ones
+VOCABULARY = [f"word{i}" for i in range(20000)]
+WEIGHTS = [1 / (i + 1) for i in range(len(VOCABULARY))]
+
+
+def sentence(rng, words):
+    return " ".join(rng.choices(VOCABULARY, WEIGHTS, k=words))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=20000)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    directory = tempfile.mkdtemp(prefix="chat-search-")
+    try:
+        index = SearchIndex(directory)
+        save_times = []
+        started = time.perf_counter()
+        for chat in range(args.chats):
+            for turn in range(args.turns):
+                messages = [
+                    dict(role="user", content=sentence(rng, 15)),
+                    dict(role="ai", content=sentence(rng, 120)),
+                ]
+                t = time.perf_counter()
+                index.add_messages(str(chat), turn * 2, messages)
+                save_times.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(index.path) + os.path.getsize(index.path + "-wal")
+        print(f"indexed {args.chats} chats, {args.chats * args.turns * 2} messages "
+              f"in {elapsed:.1f} s; index {size / 2**20:.0f} MiB")
+        print(f"  per saved turn: median {statistics.median(save_times) * 1000:.2f} ms, "
+              f"max {max(save_times) * 1000:.2f} ms")
+
+        kinds = {
+            "common word": lambda: rng.choice(VOCABULARY[:50]),
+            "rare word": lambda: rng.choice(VOCABULARY[5000:]),
+            "two words": lambda: f"{rng.choice(VOCABULARY[:500])} {rng.choice(VOCABULARY[:500])}",
+            "prefix": lambda: rng.choice(VOCABULARY[:2000])[:6],
+        }
+        for name, make_query in kinds.items():
+            times = []
+            for _ in range(args.queries):
+                _, ms = index.timed_search(make_query())
+                times.append(ms)
+            times.sort()
+            print(f"  {name:<12} p50 {statistics.median(times):7.2f} ms   "
+                  f"p95 {times[int(len(times) * 0.95) - 1]:7.2f} ms")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
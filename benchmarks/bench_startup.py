@@ -0,0 +1,127 @@
+"""Cold start and rerun time of the chat app.
+
+Every run starts a fresh Python process that imports the app and draws its
+first page with Streamlit's AppTest (the browser shows nothing until that
+first script run is over), then times:
+
+    import        process start until the app module is imported
+    first run     the first script run of a new session (new chat)
+    first paint   process start until the end of that run
+    rerun         later script runs with nothing sent (median)
+    open chat     first run of a session opening a chat with --history turns
+    rerun chat    later script runs in that chat (median)
+    sdk import    importing the Gemini SDK (done by the fake backend here)
+    first send    the run that sends the first message (fake backend)
+
+It also reports whether the SDK was already imported when the first page
+was drawn.
+
+    python benchmarks/bench_startup.py [--runs 5] [--reruns 20] [--history 200]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PHASES = ("import", "first run", "first paint", "rerun", "open chat", "rerun chat",
+          "sdk import", "first send")
+
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def child(started, history, reruns):
+    """One cold start, run in a fresh process; prints the timings as JSON."""
+    result = {}
+    sys.path.insert(0, ROOT)
+    import chat_core  # noqa: F401
+    result["import"] = time.time() - started
+
+    import logging
+    from streamlit.testing.v1 import AppTest
+
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+
+    script = os.path.join(ROOT, "app_chat.py")
+    at = AppTest.from_file(script, default_timeout=60)
+    result["first run"] = timed(at.run)
+    result["first paint"] = time.time() - started
+    result["sdk imported at first paint"] = "google.genai" in sys.modules
+    result["rerun"] = statistics.median(timed(at.run) for _ in range(reruns))
+
+    def install_fake():
+        from benchmarks import fake_gemini
+        fake_gemini.install(reply_words=50)
+
+    result["sdk import"] = timed(install_fake)
+    result["first send"] = timed(lambda: at.chat_input[0].set_value("hello").run())
+    assert not at.exception, at.exception
+
+    # A session opening a long chat, written the way the app saves turns
+    from chat_catalog import ChatCatalog
+    from chat_store import TranscriptStore
+
+    transcripts = TranscriptStore("data")
+    reply = " ".join(f"w{i}" for i in range(200))
+    for i in range(history):
+        messages = [dict(role="user", content=f"question {i}"), dict(role="ai", content=reply)]
+        transcripts.append_turns("seeded", [(messages, [
+            {"role": "user", "parts": [{"text": f"question {i}"}]},
+            {"role": "model", "parts": [{"text": reply}]},
+        ])])
+    ChatCatalog("data").create("seeded", "seeded", message_count=2 * history)
+    chat = AppTest.from_file(script, default_timeout=60)
+    chat.session_state["chat_id"] = "seeded"
+    result["open chat"] = timed(chat.run)
+    result["rerun chat"] = statistics.median(timed(chat.run) for _ in range(reruns))
+
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--history", type=int, default=200)
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child is not None:
+        child(args.child, args.history, args.reruns)
+        return
+
+    results = []
+    for _ in range(args.runs):
+        directory = tempfile.mkdtemp(prefix="chat-startup-")
+        try:
+            # The app reads data/ and the logo relative to the working directory
+            os.symlink(os.path.join(ROOT, "docs"), os.path.join(directory, "docs"))
+            env = dict(os.environ, GOOGLE_API_KEY="bench", PYTHONDONTWRITEBYTECODE="1")
+            started = time.time()
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", str(started),
+                 "--history", str(args.history), "--reruns", str(args.reruns)],
+                cwd=directory, env=env, capture_output=True, text=True, check=True,
+            ).stdout
+        finally:
+            shutil.rmtree(directory)
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{args.runs} cold starts, median (history {args.history} turns)")
+    for phase in PHASES:
+        print(f"  {phase:<12} {statistics.median(r[phase] for r in results) * 1000:8.1f} ms")
+    imported = sum(r["sdk imported at first paint"] for r in results)
+    print(f"  SDK imported before the first paint in {imported} of {args.runs} runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Disk usage and load time of the chat file formats.
+
+Writes the same synthetic chats in every layout the app has used and
+measures the bytes on disk, the time to load a chat (both views rebuilt)
+and the time to save one more turn:
+
+    pickles  data/<id>-st_messages + -gemini_messages (joblib, whole chat per save)
+    jsonl    data/<id>.jsonl, one JSON line per turn
+    chat     data/<id>.chat with CHAT_COMPRESSION none / zlib / zstd
+
+    python benchmarks/bench_storage.py [--turns 50,500] [--reply-words 250]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import joblib  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from chat_store import TranscriptStore, zstandard  # noqa: E402
+from response_cache import turn_contents  # noqa: E402
+
+WORDS = (
+    "the model answer python list tuple function value request server cache "
+    "memory token stream chat history window user question example because "
+    "however which would could should about there their other first second "
+    "data file format time load save turn message text reply context"
+).split()
+
+
+def make_turns(turns, reply_words, seed=1):
+    rng = random.Random(seed)
+    result = []
+    for i in range(turns):
+        prompt = " ".join(rng.choice(WORDS) for _ in range(12)) + "?"
+        reply = " ".join(rng.choice(WORDS) for _ in range(reply_words)) + "."
+        messages = [
+            dict(role="user", content=prompt),
+            dict(role="ai", content=reply, avatar="✨"),
+        ]
+        result.append((messages, turn_contents(prompt, reply)))
+    return result
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_pickles(directory, chat):
+    messages = [m for turn, _ in chat for m in turn]
+    history = [c for _, contents in chat for c in contents]
+    st_path = os.path.join(directory, "c-st_messages")
+    gemini_path = os.path.join(directory, "c-gemini_messages")
+
+    def save():
+        joblib.dump(messages, st_path)
+        joblib.dump(history, gemini_path)
+
+    save()
+    size = os.path.getsize(st_path) + os.path.getsize(gemini_path)
+    load = timed(lambda: (joblib.load(st_path), joblib.load(gemini_path)))
+    # The old app rewrote both pickles after every turn
+    return size, load, timed(save)
+
+
+def bench_jsonl(directory, chat):
+    path = os.path.join(directory, "c.jsonl")
+
+    def line(messages, contents):
+        record = {
+            "messages": messages,
+            "history": [c.model_dump(mode="json", exclude_none=True) for c in contents],
+        }
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+    with open(path, "w", encoding="utf-8") as f:
+        for messages, contents in chat:
+            f.write(line(messages, contents))
+    size = os.path.getsize(path)
+
+    def load():
+        messages, history = [], []
+        with open(path, encoding="utf-8") as f:
+            for text in f:
+                record = json.loads(text)
+                messages.extend(record["messages"])
+                history.extend(types.Content.model_validate(c) for c in record["history"])
+
+    def append():
+        with open(path + ".extra", "a", encoding="utf-8") as f:
+            f.write(line(*chat[-1]))
+
+    return size, timed(load), timed(append)
+
+
+def bench_chat(directory, chat, codec):
+    store = TranscriptStore(directory, compression=codec)
+    for messages, contents in chat:
+        store.append_turn("c", messages, contents)
+    store.load("c")  # compacts the frames, as the app does on open
+    size = os.path.getsize(os.path.join(directory, "c.chat"))
+    load = timed(lambda: store.load("c"))
+    append = timed(lambda: store.append_turn("extra", *chat[-1]))
+    return size, load, append
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", default="50,500")
+    parser.add_argument("--reply-words", type=int, default=250)
+    args = parser.parse_args()
+
+    layouts = [("pickles", bench_pickles), ("jsonl", bench_jsonl)]
+    codecs = ["none", "zlib"] + (["zstd"] if zstandard else [])
+    for codec in codecs:
+        layouts.append((f"chat/{codec}", lambda d, c, codec=codec: bench_chat(d, c, codec)))
+
+    for turns in (int(t) for t in args.turns.split(",")):
+        chat = make_turns(turns, args.reply_words)
+        text_bytes = sum(len(m["content"].encode("utf-8")) for messages, _ in chat for m in messages)
+        print(f"{turns} turns, {text_bytes / 1024:.0f} KiB of message text")
+        print(f"  {'layout':<10} {'on disk':>10} {'vs text':>8} {'load ms':>9} {'save turn ms':>13}")
+        for name, bench in layouts:
+            directory = tempfile.mkdtemp(prefix="chat-storage-")
+            try:
+                size, load, append = bench(directory, chat)
+            finally:
+                shutil.rmtree(directory)
+            print(f"  {name:<10} {size / 1024:>8.0f} K {size / text_bytes:>7.2f}x "
+                  f"{load * 1000:>9.2f} {append * 1000:>13.3f}")
+        print()
+    if not zstandard:
+        print("zstandard is not installed, so chat/zstd was skipped")
+
+
+if __name__ == "__main__":
+    main()
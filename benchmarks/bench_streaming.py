@@ -0,0 +1,93 @@
+"""Time-to-last-token of the old per-word streaming loop vs StreamRenderer.
+
+Replays a synthetic reply (2000 words by default) in Gemini-sized chunks
+through both code paths with a placeholder that only counts what would be
+sent to the browser.
+
+    python benchmarks/bench_streaming.py [--words 2000] [--chunk-words 40]
+                                         [--chunk-delay-ms 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import StreamRenderer  # noqa: E402
+
+
+class Placeholder:
+    """Stand-in for st.empty() that records redraws and payload size."""
+
+    def __init__(self):
+        self.writes = 0
+        self.bytes_sent = 0
+
+    def write(self, text):
+        self.writes += 1
+        self.bytes_sent += len(text.encode("utf-8"))
+
+
+def make_chunks(words, chunk_words):
+    text = " ".join(f"word{i}" for i in range(words))
+    tokens = text.split(" ")
+    return [
+        " ".join(tokens[i:i + chunk_words]) + " "
+        for i in range(0, len(tokens), chunk_words)
+    ]
+
+
+def upstream(chunks, delay):
+    # Simulated network gap between streamed chunks
+    for chunk in chunks:
+        time.sleep(delay)
+        yield chunk
+
+
+def legacy_loop(chunks, container):
+    # The loop previously inlined in app_chat.py
+    full_text = ""
+    for chunk in chunks:
+        for word in chunk.split(" "):
+            full_text += word + " "
+            container.write(full_text + "▌")
+            time.sleep(0.01)
+    container.write(full_text)
+
+
+def renderer_loop(chunks, container):
+    renderer = StreamRenderer(container)
+    for chunk in chunks:
+        renderer.write(chunk)
+    renderer.finish()
+
+
+def run(name, loop, chunks, delay):
+    container = Placeholder()
+    start = time.perf_counter()
+    loop(upstream(chunks, delay), container)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<10} time-to-last-token {elapsed * 1000:9.1f} ms   "
+        f"redraws {container.writes:6d}   sent {container.bytes_sent / 1e6:8.2f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=2000)
+    parser.add_argument("--chunk-words", type=int, default=40)
+    parser.add_argument("--chunk-delay-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.words, args.chunk_words)
+    delay = args.chunk_delay_ms / 1000
+    print(f"{args.words} words in {len(chunks)} chunks, {args.chunk_delay_ms:g} ms apart")
+    print(f"upstream alone: {len(chunks) * delay * 1000:.1f} ms")
+    run("before", legacy_loop, chunks, delay)
+    run("after", renderer_loop, chunks, delay)
+
+
+if __name__ == "__main__":
+    main()
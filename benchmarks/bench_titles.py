@@ -0,0 +1,101 @@
+"""Cost of chat titles on the reply path, and how the title queue batches them.
+
+Prints the placeholder and the keyword title of every prompt in
+workload.jsonl, then times, per new chat:
+
+    placeholder   first words of the message plus the catalog insert (kept inline)
+    keywords      the keyword title, had it been computed inline
+    model         a title request to the fake backend with --model-latency
+    submit        queuing the chat for the background thread (what the turn pays)
+
+Finally --chats new chats arrive at once, spread over --dirs data
+directories, and the queue titles them: one catalog transaction per
+directory and batch instead of one per chat.
+
+    python benchmarks/bench_titles.py [--chats 2000] [--dirs 20] [--model-latency 0.3]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auto_title import TitleQueue, keyword_title  # noqa: E402
+from benchmarks.fake_gemini import FakeClient  # noqa: E402
+from chat_catalog import ChatCatalog  # noqa: E402
+from rate_limit import RateLimiter, ResilientSender  # noqa: E402
+
+WORKLOAD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "workload.jsonl")
+
+
+def median_ms(fn, runs):
+    times = []
+    for i in range(runs):
+        started = time.perf_counter()
+        fn(i)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--dirs", type=int, default=20)
+    parser.add_argument("--model-latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    with open(WORKLOAD, encoding="utf-8") as f:
+        prompts = [json.loads(line)["prompt"] for line in f if line.strip()]
+    client = FakeClient(reply_words=150)
+    replies = [client.reply_for(prompt) for prompt in prompts]
+    for prompt in prompts:
+        print(f"  {' '.join(prompt.split()[:5]) + '...':<38} -> {keyword_title(prompt)}")
+
+    directory = tempfile.mkdtemp(prefix="chat-titles-")
+    try:
+        catalog = ChatCatalog(os.path.join(directory, "inline"))
+        n = len(prompts)
+
+        def placeholder(i):
+            catalog.create(f"chat{i}", " ".join(prompts[i % n].split()[:5]) + "...")
+
+        sender = ResilientSender(FakeClient(first_delay=args.model_latency), "fake", RateLimiter())
+        model_queue = TitleQueue(mode="model")
+        queue = TitleQueue()
+        queue_dir = os.path.join(directory, "queued")
+        ChatCatalog(queue_dir)
+        print("per new chat, median")
+        print(f"  placeholder {median_ms(placeholder, 200):8.3f} ms")
+        print(f"  keywords    {median_ms(lambda i: keyword_title(prompts[i % n], replies[i % n]), 200):8.3f} ms")
+        print(f"  model       {median_ms(lambda i: model_queue.title(prompts[i % n], replies[i % n], sender), 5):8.3f} ms")
+        print(f"  submit      {median_ms(lambda i: queue.submit(queue_dir, f'x{i}', 'x', prompts[i % n], replies[i % n]), 200):8.3f} ms")
+        queue.flush()
+        model_queue.close()
+
+        dirs = [os.path.join(directory, f"user{d}") for d in range(args.dirs)]
+        for d in dirs:
+            ChatCatalog(d)
+        chats = [(dirs[i % args.dirs], f"chat{i}", prompts[i % n], replies[i % n]) for i in range(args.chats)]
+        for data_dir, chat_id, prompt, _ in chats:
+            ChatCatalog(data_dir).create(chat_id, " ".join(prompt.split()[:5]) + "...")
+        queue = TitleQueue()
+        started = time.perf_counter()
+        for data_dir, chat_id, prompt, reply in chats:
+            queue.submit(data_dir, chat_id, " ".join(prompt.split()[:5]) + "...", prompt, reply)
+        queue.flush()
+        elapsed = time.perf_counter() - started
+        stats = queue.stats()
+        queue.close()
+        print(f"{args.chats} new chats in {args.dirs} directories titled in {elapsed * 1000:.0f} ms: "
+              f"{stats['renamed']} renamed with {stats['writes']} catalog transactions")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
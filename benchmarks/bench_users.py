@@ -0,0 +1,95 @@
+"""Chat list and search time for one user, flat layout vs per-user directories.
+
+Saves --chats chats of --turns turns for each of --users users, once all
+into one data directory (as without USER_NAMESPACES) and once into each
+user's sharded directory, then times what a session of one user does on
+every run: list its newest chats and search them. In the flat layout the
+list and the search results are those of all users together.
+
+    python benchmarks/bench_users.py [--users 200] [--chats 20] [--turns 3] [--queries 200]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_catalog import ChatCatalog  # noqa: E402
+from search_index import SearchIndex  # noqa: E402
+from user_storage import user_dir, user_key  # noqa: E402
+
+# Zipf-like vocabulary: a few common words and a long tail of rare ones
+VOCABULARY = [f"word{i}" for i in range(20000)]
+WEIGHTS = [1 / (i + 1) for i in range(len(VOCABULARY))]
+
+
+def sentence(rng, words):
+    return " ".join(rng.choices(VOCABULARY, WEIGHTS, k=words))
+
+
+def fill(directory, chats, turns, rng):
+    catalog, index = ChatCatalog(directory), SearchIndex(directory)
+    for chat_id in chats:
+        catalog.create(chat_id, chat_id, message_count=2 * turns)
+        index.add_many([
+            (chat_id, turn * 2, [dict(role="user", content=sentence(rng, 15)),
+                                 dict(role="ai", content=sentence(rng, 120))])
+            for turn in range(turns)
+        ])
+
+
+def timed(rng, catalog, index, queries):
+    list_times, search_times = [], []
+    for _ in range(queries):
+        t = time.perf_counter()
+        catalog.recent(20)
+        catalog.count()
+        list_times.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        index.search(rng.choice(VOCABULARY[:200]))
+        search_times.append(time.perf_counter() - t)
+    return statistics.median(list_times) * 1000, statistics.median(search_times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    directory = tempfile.mkdtemp(prefix="chat-users-")
+    try:
+        users = [f"user{u}" for u in range(args.users)]
+        chats = {user: [f"{user}-chat{c}" for c in range(args.chats)] for user in users}
+
+        flat = os.path.join(directory, "flat")
+        started = time.perf_counter()
+        fill(flat, [chat for user in users for chat in chats[user]], args.turns, rng)
+        print(f"flat: {args.users * args.chats} chats saved in {time.perf_counter() - started:.1f} s")
+
+        root = os.path.join(directory, "sharded")
+        started = time.perf_counter()
+        for user in users:
+            fill(user_dir(user_key("token", user), root), chats[user], args.turns, rng)
+        print(f"per user: {args.users} x {args.chats} chats saved in {time.perf_counter() - started:.1f} s")
+
+        one = user_dir(user_key("token", users[0]), root)
+        for name, data_dir in (("flat", flat), ("per user", one)):
+            catalog, index = ChatCatalog(data_dir), SearchIndex(data_dir)
+            list_ms, search_ms = timed(rng, catalog, index, args.queries)
+            print(f"  {name:<9} chats listed {catalog.count():>6}   list p50 {list_ms:6.2f} ms   "
+                  f"search p50 {search_ms:6.2f} ms")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Local stand-in for `genai.Client` that streams canned replies.
+
+It implements the small part of the SDK the app uses (`client.chats.create`,
+`chat.send_message_stream`, `chat.get_history`,
+`client.models.generate_content_stream` and `client.models.generate_content`)
+with configurable chunk sizes and latencies, and can inject 429/500 errors
+before or in the middle of a stream. Nothing leaves the machine and no API credits are used.
+
+    from benchmarks.fake_gemini import FakeClient
+    client = FakeClient(reply_words=300, chunk_delay=0.02, error_rate=0.1)
+"""
+import random
+import threading
+import time
+
+from google.genai import errors, types
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+def _error(code):
+    status = "RESOURCE_EXHAUSTED" if code == 429 else "INTERNAL"
+    body = {"error": {"code": code, "status": status, "message": "injected by fake_gemini"}}
+    if code < 500:
+        return errors.ClientError(code, body)
+    return errors.ServerError(code, body)
+
+
+def _text_of(content):
+    return "".join(part.text or "" for part in (content.parts or []))
+
+
+class FakeClient:
+    """Drop-in replacement for `genai.Client` (see module docstring).
+
+    reply_words     words in every reply
+    chunk_words     words per streamed chunk
+    first_delay     seconds before the first chunk (time to first token)
+    chunk_delay     seconds between chunks
+    error_rate      probability a request fails before streaming (429 or 500)
+    midstream_rate  probability a stream fails after its first chunk (500)
+    """
+
+    def __init__(self, *args, reply_words=200, chunk_words=20, first_delay=0.0,
+                 chunk_delay=0.0, error_rate=0.0, midstream_rate=0.0, seed=None,
+                 **kwargs):
+        self.reply_words = reply_words
+        self.chunk_words = chunk_words
+        self.first_delay = first_delay
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.midstream_rate = midstream_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors_injected = 0
+        self.chats = _FakeChats(self)
+        self.models = _FakeModels(self)
+
+    def reply_for(self, prompt):
+        """The full reply the fake gives to `prompt`."""
+        seed = sum(map(ord, prompt))
+        return " ".join(f"w{(seed + i) % 997}" for i in range(self.reply_words))
+
+    def _roll(self, rate):
+        with self._lock:
+            return self._rng.random() < rate
+
+    def _stream(self, text):
+        with self._lock:
+            self.requests += 1
+        if self._roll(self.error_rate):
+            with self._lock:
+                self.errors_injected += 1
+            raise _error(self._rng.choice([429, 500]))
+        fail_midstream = self._roll(self.midstream_rate)
+
+        words = text.split(" ")
+        time.sleep(self.first_delay)
+        for i in range(0, len(words), self.chunk_words):
+            if i and fail_midstream:
+                with self._lock:
+                    self.errors_injected += 1
+                raise _error(500)
+            if i:
+                time.sleep(self.chunk_delay)
+            end = i + self.chunk_words
+            yield FakeChunk(" ".join(words[i:end]) + (" " if end < len(words) else ""))
+
+
+class _FakeChats:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, model, config=None, history=None):
+        return FakeChat(self._client, history)
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content_stream(self, model, contents, config=None):
+        # Used to continue an interrupted reply: the last three contents are
+        # the prompt, the partial answer and the request to continue
+        prompt, partial = _text_of(contents[-3]), _text_of(contents[-2])
+        full = self._client.reply_for(prompt)
+        return self._client._stream(full[len(partial):])
+
+    def generate_content(self, model, contents, config=None):
+        # Used for chat titles: a few words of the reply, in one response
+        words = self._client.reply_for(contents).split(" ")[:4]
+        return FakeChunk("".join(chunk.text for chunk in self._client._stream(" ".join(words))))
+
+
+class FakeChat:
+    def __init__(self, client, history=None):
+        self._client = client
+        self._history = list(history or [])
+
+    def get_history(self, curated=False):
+        return list(self._history)
+
+    def send_message_stream(self, message, config=None):
+        reply = self._client.reply_for(message)
+        stream = self._client._stream(reply)
+
+        def record():
+            received = []
+            for chunk in stream:
+                received.append(chunk.text)
+                yield chunk
+            # Like the SDK, history is only updated once the stream completes
+            self._history.append(types.Content(role="user", parts=[types.Part(text=message)]))
+            self._history.append(
+                types.Content(role="model", parts=[types.Part(text="".join(received))])
+            )
+
+        return record()
+
+
+def install(**options):
+    """Patch `google.genai.Client` so the app builds FakeClients."""
+    from google import genai
+
+    genai.Client = lambda *args, **kwargs: FakeClient(**options)
@@ -0,0 +1,139 @@
+"""Several processes saving turns to the same chats at once.
+
+Every worker appends numbered turns to a few shared chats, bumps their
+catalog counts and now and then loads a chat (which compacts it, since
+CHAT_COMPACT_FRAMES is set low here). Some workers are killed with SIGKILL
+in the middle of the run. Afterwards every chat must load without errors,
+every turn a worker finished must be in its chat exactly once, and the
+catalog count of each chat must cover the finished turns and never exceed
+what is on disk. --backend sqlite runs the same test against chat logs
+stored in SQLite (see storage_backend.py).
+
+    python benchmarks/stress_persistence.py [--workers 8] [--chats 3] [--turns 300] [--kill 3]
+                                            [--backend files|sqlite]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat_store  # noqa: E402
+from response_cache import turn_contents  # noqa: E402
+from storage_backend import open_catalog, open_transcripts  # noqa: E402
+
+
+def worker(number, directory, chats, turns, compact_frames, backend):
+    chat_store.CHAT_COMPACT_FRAMES = compact_frames
+    rng = random.Random(number)
+    store = open_transcripts(directory, backend=backend)
+    catalog = open_catalog(directory, backend=backend)
+    acks = open(os.path.join(directory, f"acks-{number}.txt"), "a", encoding="utf-8")
+    for turn in range(turns):
+        chat_id = rng.choice(chats)
+        prompt = f"w{number}-t{turn}"
+        reply = "reply " * rng.randint(1, 400)
+        messages = [dict(role="user", content=prompt), dict(role="ai", content=reply)]
+        store.append_turn(chat_id, messages, turn_contents(prompt, reply))
+        catalog.record_turn(chat_id, len(messages))
+        # Only turns listed here must survive
+        acks.write(f"{chat_id} {prompt}\n")
+        acks.flush()
+        if rng.random() < 0.1:
+            store.load(rng.choice(chats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--chats", type=int, default=3)
+    parser.add_argument("--turns", type=int, default=300)
+    parser.add_argument("--kill", type=int, default=3, help="workers to SIGKILL mid-run")
+    parser.add_argument("--compact-frames", type=int, default=4)
+    parser.add_argument("--backend", choices=("files", "sqlite"), default="files")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="chat-stress-")
+    chats = [f"chat{i}" for i in range(args.chats)]
+    catalog = open_catalog(directory, backend=args.backend)
+    for chat_id in chats:
+        catalog.create(chat_id, chat_id)
+
+    started = time.perf_counter()
+    processes = [
+        multiprocessing.Process(
+            target=worker, args=(n, directory, chats, args.turns, args.compact_frames, args.backend)
+        )
+        for n in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    rng = random.Random(0)
+    for process in rng.sample(processes, min(args.kill, len(processes))):
+        time.sleep(rng.uniform(0.05, 0.5))
+        os.kill(process.pid, signal.SIGKILL)
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    acked = Counter()
+    for n in range(args.workers):
+        path = os.path.join(directory, f"acks-{n}.txt")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                acked.update(tuple(line.split()) for line in f if line.endswith("\n"))
+
+    failures = []
+    store = open_transcripts(directory, backend=args.backend)
+    saved_turns = 0
+    for chat_id in chats:
+        try:
+            messages, history = store.load(chat_id)
+        except Exception as e:
+            failures.append(f"{chat_id}: load failed: {type(e).__name__}: {e}")
+            continue
+        saved_turns += len(messages) // 2
+        prompts = Counter(m["content"] for m in messages if m["role"] == "user")
+        if len(history) != len(messages):
+            failures.append(f"{chat_id}: {len(messages)} messages but {len(history)} history entries")
+        for prompt, count in prompts.items():
+            if count > 1:
+                failures.append(f"{chat_id}: {prompt} saved {count} times")
+        acked_here = [prompt for (chat, prompt) in acked if chat == chat_id]
+        missing = [prompt for prompt in acked_here if prompt not in prompts]
+        if missing:
+            failures.append(f"{chat_id}: {len(missing)} finished turns missing, e.g. {missing[0]}")
+        count = catalog.get(chat_id)["message_count"]
+        if not 2 * len(acked_here) <= count <= len(messages):
+            failures.append(
+                f"{chat_id}: catalog count {count}, {2 * len(acked_here)} acknowledged, "
+                f"{len(messages)} on disk"
+            )
+    leftovers = [name for name in os.listdir(directory) if ".corrupt-" in name]
+    if leftovers:
+        failures.append(f"damaged chat files: {leftovers}")
+
+    killed = sum(1 for p in processes if p.exitcode == -signal.SIGKILL)
+    crashed = sum(1 for p in processes if p.exitcode not in (0, -signal.SIGKILL))
+    if crashed:
+        failures.append(f"{crashed} workers exited with an error")
+    print(f"{args.workers} workers ({killed} killed), {sum(acked.values())} turns acknowledged, "
+          f"{saved_turns} saved in {args.chats} chats, {elapsed:.1f} s")
+    shutil.rmtree(directory)
+    if failures:
+        print("FAILED")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import threading
+import time
+
+# ------------------------------
+# Chat catalog (SQLite)
+# ------------------------------
+# Titles and bookkeeping for every chat live in "data/chats.db", indexed by
+# chat ID and by last update, so the sidebar only ever asks for the most
+# recent page of chats and a rename touches a single row. Every change is
+# one SQLite transaction, so several app processes can share the file; a
+# writer waits up to SQLITE_BUSY_TIMEOUT seconds for another to finish.
+
+DATA_DIR = "data"
+SQLITE_BUSY_TIMEOUT = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id       TEXT PRIMARY KEY,
+    title         TEXT NOT NULL,
+    created_at    REAL NOT NULL,
+    updated_at    REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS chats_updated_at ON chats (updated_at DESC);
+"""
+
+
+class ChatCatalog:
+    """Persistent index of chats: title, timestamps and message count."""
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.path = os.path.join(self.data_dir, "chats.db")
+        # One connection shared by every session of the process, used under a lock
+        self._conn = sqlite3.connect(
+            self.path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False
+        )
+        self._lock = threading.RLock()
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate_legacy()
+
+    def recent(self, limit, offset=0):
+        """Return [(chat_id, title), ...] ordered by most recent activity."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chat_id, title FROM chats ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [(row["chat_id"], row["title"]) for row in rows]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+    def get(self, chat_id):
+        """Return the catalog row for a chat as a dict, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM chats WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def title(self, chat_id, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT title FROM chats WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        return row["title"] if row else default
+
+    def __contains__(self, chat_id):
+        return self.title(chat_id) is not None
+
+    def create(self, chat_id, title, message_count=0):
+        """Register a new chat. Does nothing if the chat already exists."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO chats VALUES (?, ?, ?, ?, ?)",
+                (chat_id, title, now, now, message_count),
+            )
+
+    def rename(self, chat_id, title):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE chats SET title = ? WHERE chat_id = ?", (title, chat_id)
+            )
+
+    def replace_titles(self, titles):
+        """Rename {chat_id: (old title, new title), ...} in one transaction.
+
+        Chats no longer called by their old title (renamed meanwhile) are
+        left alone. Returns the number of chats renamed.
+        """
+        with self._lock, self._conn:
+            return self._conn.executemany(
+                "UPDATE chats SET title = ? WHERE chat_id = ? AND title = ?",
+                [(new, chat_id, old) for chat_id, (old, new) in titles.items()],
+            ).rowcount
+
+    def record_turn(self, chat_id, new_messages):
+        """Bump the update time and message count after a saved turn."""
+        self.record_turns({chat_id: new_messages})
+
+    def record_turns(self, new_messages):
+        """record_turn for {chat_id: new message count, ...} in one transaction."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE chats SET updated_at = ?, message_count = message_count + ? "
+                "WHERE chat_id = ?",
+                [(now, count, chat_id) for chat_id, count in new_messages.items()],
+            )
+
+    # ------------------------------
+    # One-time migration from data/past_chats_list
+    # ------------------------------
+    def _migrate_legacy(self):
+        legacy_path = os.path.join(self.data_dir, "past_chats_list")
+        if not os.path.exists(legacy_path):
+            return
+        with self._conn:
+            # Another process may have done it while this one was starting
+            self._conn.execute("BEGIN IMMEDIATE")
+            if not os.path.exists(legacy_path):
+                return
+            import joblib  # only needed for this one-time import
+
+            past_chats = joblib.load(legacy_path)
+
+            rows = []
+            for chat_id, title in past_chats.items():
+                # Chat IDs are creation timestamps
+                try:
+                    created_at = float(chat_id)
+                except ValueError:
+                    created_at = time.time()
+                rows.append((chat_id, title, created_at, created_at, 0))
+
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chats VALUES (?, ?, ?, ?, ?)", rows
+            )
+            os.replace(legacy_path, legacy_path + ".migrated")
+
@@ -0,0 +1,808 @@
+import time
+import os
+import uuid
+import streamlit as st
+from dotenv import load_dotenv
+from auto_title import get_title_queue
+from chat_registry import history_bytes
+from chat_render import RENDER_WINDOW, first_visible, prepared
+from chat_store import CorruptChatError
+from context_window import ContextWindowManager, estimate_tokens
+from gemini_client import get_client, pool_stats
+from persist_queue import get_persist_queue
+from rate_limit import get_sender
+from response_cache import get_response_cache, turn_contents
+from retrieval_memory import get_retrieval_memory
+from search_index import get_search_index
+from send_executor import get_send_executor
+from session_memory import HISTORY_TRIM_POLICIES, get_session_memory
+from storage_backend import get_catalog, open_transcripts
+from streaming import StreamRenderer
+from turn_metrics import METRICS_RECENT, TurnTimer, get_turn_metrics
+from user_storage import session_data_dir
+
+# ------------------------------
+# Chat app shared by every language
+# ------------------------------
+# app_chat.py, app_chat_cro.py and app_chat_italian.py all call run(), so one
+# Streamlit process (one client, one worker pool, one cache) can serve every
+# language. The language of a session is picked in this order:
+#
+#   1. the `lang` query parameter (?lang=hr), which also switches it later
+#   2. the language the script was started for (app_chat_cro.py -> "hr")
+#   3. the browser's preferred languages
+#   4. English
+
+# --- LOGO PATH ---
+# Ensure this path is correct relative to your main script
+LOGO_PATH = "docs/Orizon-com.jpg"
+# ---------------------
+
+# --- NEW LOGO SETTINGS ---
+LOGO_URL = "https://orizon-aix.com" # The destination URL
+LOGO_WIDTH = 140 # Set the logo width in pixels (e.g., 100px)
+# -----------------------------
+
+# ------------------------------
+# Chat Settings
+# ------------------------------
+MODEL_NAME = "gemini-2.5-flash"
+AI_AVATAR_ICON = "✨"
+MODEL_ROLE = "ai"
+CHAT_LIST_PAGE_SIZE = 20
+
+# ------------------------------
+# UI strings per language
+# ------------------------------
+DEFAULT_LOCALE = "en"
+
+LOCALES = {
+    "en": {
+        "page_title": "🤖 Gemini Chatbot",
+        "missing_key": "❌ Error: GOOGLE_API_KEY environment variable not found. Check your .env file.",
+        "user_unknown": "❌ You are not signed in, so your chats cannot be shown. Sign in and reload the page.",
+        "client_error": "Client initialization error: {error}",
+        "chat_history": "## 📜 Chat History",
+        "new_chat_option": "➕ New Chat",
+        "select_chat": "Select or create a chat",
+        "search": "🔍 Search chats",
+        "search_results": "{count} results in {ms:.1f} ms",
+        "older_chats": "Show older chats",
+        "new_chat": "New Chat",
+        "rename": "✏️ Rename Chat",
+        "renamed": "Chat renamed to '{title}'",
+        "model": "**Model:** `{model}`",
+        "debug_pool": "Connection pool",
+        "debug_context": "Context window",
+        "debug_cache": "Response cache",
+        "debug_retrieval": "Retrieval memory",
+        "debug_live_chats": "Live chats",
+        "debug_memory": "Session memory",
+        "debug_send_queue": "Send queue",
+        "debug_retries": "Retries and rate limit",
+        "debug_disk": "Disk I/O",
+        "debug_turns": "Turn timings",
+        "logo_link": "Go to Orizon AI",
+        "logo_missing": "⚠️ Logo not found. Ensure the file exists at path: `{path}`",
+        "title": "🤖 Chat with Gemini",
+        "caption": "You are using the **{model}** model.",
+        "load_earlier": "Load earlier messages ({hidden} hidden)",
+        "chat_input": "Write your message here...",
+        "send_error": "API Error while sending message: {error}",
+        "chat_corrupt": "⚠️ Part of this chat was damaged and could not be read. The original file was kept at `{path}`.",
+        "chat_unreadable": "This chat could not be loaded: {error}",
+        "chat_saving": "⏳ Your latest messages are still being saved and are not shown yet. They will appear when the page is refreshed.",
+    },
+    "hr": {
+        "page_title": "🤖 Gemini Chatbot",
+        "missing_key": "❌ Greška: Varijabla okoline GOOGLE_API_KEY nije pronađena. Provjerite svoju .env datoteku.",
+        "user_unknown": "❌ Niste prijavljeni pa se vaši chatovi ne mogu prikazati. Prijavite se i ponovno učitajte stranicu.",
+        "client_error": "Greška pri inicijalizaciji klijenta: {error}",
+        "chat_history": "## 📜 Povijest chatova",
+        "new_chat_option": "➕ Novi Chat",
+        "select_chat": "Odaberite ili kreirajte chat",
+        "search": "🔍 Pretraži chatove",
+        "search_results": "Rezultata: {count} ({ms:.1f} ms)",
+        "older_chats": "Prikaži starije chatove",
+        "new_chat": "Novi Chat",
+        "rename": "✏️ Preimenuj Chat",
+        "renamed": "Chat preimenovan u '{title}'",
+        "model": "**Model:** `{model}`",
+        "debug_pool": "Skup veza",
+        "debug_context": "Kontekstni prozor",
+        "debug_cache": "Predmemorija odgovora",
+        "debug_retrieval": "Memorija ranijih razgovora",
+        "debug_live_chats": "Aktivni chatovi",
+        "debug_memory": "Memorija sesije",
+        "debug_send_queue": "Red slanja",
+        "debug_retries": "Ponovni pokušaji i ograničenje",
+        "debug_disk": "Diskovni U/I",
+        "debug_turns": "Trajanje poteza",
+        "logo_link": "Idi na Orizon AI",
+        "logo_missing": "⚠️ Logo nije pronađen. Provjerite da datoteka postoji na putanji: `{path}`",
+        "title": "🤖 Chat s Geminijem",
+        "caption": "Koristite model **{model}**.",
+        "load_earlier": "Učitaj starije poruke ({hidden} skrivenih)",
+        "chat_input": "Napišite svoju poruku ovdje...",
+        "send_error": "API greška prilikom slanja poruke: {error}",
+        "chat_corrupt": "⚠️ Dio ovog razgovora je oštećen i nije ga bilo moguće pročitati. Izvorna datoteka sačuvana je na putanji `{path}`.",
+        "chat_unreadable": "Ovaj razgovor nije bilo moguće učitati: {error}",
+        "chat_saving": "⏳ Vaše posljednje poruke još se spremaju i zato još nisu prikazane. Pojavit će se kad osvježite stranicu.",
+    },
+    "it": {
+        "page_title": "🤖 Chatbot Gemini",
+        "missing_key": "❌ Errore: Variabile d'ambiente GOOGLE_API_KEY non trovata. Controlla il tuo file .env.",
+        "user_unknown": "❌ Non hai effettuato l'accesso, quindi le tue chat non possono essere mostrate. Accedi e ricarica la pagina.",
+        "client_error": "Errore di inizializzazione del client: {error}",
+        "chat_history": "## 📜 Storico Chat",
+        "new_chat_option": "➕ Nuova Chat",
+        "select_chat": "Seleziona o crea una chat",
+        "search": "🔍 Cerca nelle chat",
+        "search_results": "{count} risultati in {ms:.1f} ms",
+        "older_chats": "Mostra chat precedenti",
+        "new_chat": "Nuova Chat",
+        "rename": "✏️ Rinomina Chat",
+        "renamed": "Chat rinominata in '{title}'",
+        "model": "**Modello:** `{model}`",
+        "debug_pool": "Pool di connessioni",
+        "debug_context": "Finestra di contesto",
+        "debug_cache": "Cache delle risposte",
+        "debug_retrieval": "Memoria delle conversazioni precedenti",
+        "debug_live_chats": "Chat attive",
+        "debug_memory": "Memoria della sessione",
+        "debug_send_queue": "Coda di invio",
+        "debug_retries": "Tentativi e limite di frequenza",
+        "debug_disk": "I/O su disco",
+        "debug_turns": "Tempi dei turni",
+        "logo_link": "Vai a Orizon AI",
+        "logo_missing": "⚠️ Logo non trovato. Assicurati che il file esista al percorso: `{path}`",
+        "title": "🤖 Chat con Gemini",
+        "caption": "Stai usando il modello **{model}**.",
+        "load_earlier": "Carica messaggi precedenti ({hidden} nascosti)",
+        "chat_input": "Scrivi qui il tuo messaggio...",
+        "send_error": "Errore API durante l'invio del messaggio: {error}",
+        "chat_corrupt": "⚠️ Parte di questa chat era danneggiata e non è stato possibile leggerla. Il file originale è stato conservato in `{path}`.",
+        "chat_unreadable": "Impossibile caricare questa chat: {error}",
+        "chat_saving": "⏳ I tuoi ultimi messaggi sono ancora in fase di salvataggio e non sono ancora visibili. Compariranno quando aggiorni la pagina.",
+    },
+}
+
+
+def _supported(tag):
+    """Locale key for a language tag such as "hr-HR" or "it", or None."""
+    if not tag:
+        return None
+    language = tag.strip().replace("_", "-").split("-")[0].lower()
+    return language if language in LOCALES else None
+
+
+def _query_locale():
+    try:
+        return _supported(st.query_params.get("lang"))
+    except AttributeError:
+        # Streamlit < 1.30
+        values = st.experimental_get_query_params().get("lang") or [None]
+        return _supported(values[0])
+
+
+def _browser_locale():
+    context = getattr(st, "context", None)  # Streamlit >= 1.37
+    if context is None:
+        return None
+    locale = _supported(getattr(context, "locale", None))
+    if locale:
+        return locale
+    # Accept-Language: "hr-HR,hr;q=0.9,en;q=0.8", most preferred first
+    header = context.headers.get("Accept-Language") or ""
+    ranked = []
+    for position, item in enumerate(header.split(",")):
+        tag, _, params = item.partition(";")
+        try:
+            quality = float(params.strip()[2:]) if params.strip().startswith("q=") else 1.0
+        except ValueError:
+            quality = 0.0
+        ranked.append((-quality, position, tag))
+    for _, _, tag in sorted(ranked):
+        locale = _supported(tag)
+        if locale:
+            return locale
+    return None
+
+
+def session_locale(default_locale=None):
+    """The language for this session (see the order at the top of the file)."""
+    locale = _query_locale()
+    if locale:
+        st.session_state.locale = locale
+    elif "locale" not in st.session_state:
+        st.session_state.locale = (
+            _supported(default_locale) or _browser_locale() or DEFAULT_LOCALE
+        )
+    return st.session_state.locale
+
+
+def api_key():
+    """GOOGLE_API_KEY; .env is only read until the key has been found."""
+    key = os.environ.get("GOOGLE_API_KEY")
+    if not key:
+        # load_dotenv never overrides variables that are already set
+        load_dotenv()
+        key = os.environ.get("GOOGLE_API_KEY")
+    return key
+
+
+def gemini(key, text):
+    """(client, sender), both shared by the process (see gemini_client.py)."""
+    try:
+        client = get_client(key)
+    except Exception as e:
+        st.error(text["client_error"].format(error=e))
+        st.stop()
+    # Sent under the shared rate limiter, with retries (see rate_limit.py)
+    return client, get_sender(client, MODEL_NAME)
+
+
+@st.cache_resource(show_spinner=False)
+def logo_bytes(path):
+    """The logo file, read once per process; None if it is missing."""
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def run(default_locale=None):
+    """Draw the chat app for one script run."""
+    text = LOCALES[session_locale(default_locale)]
+
+    # ------------------------------
+    # Streamlit Initial Configuration
+    # ------------------------------
+    st.set_page_config(
+        page_title=text["page_title"],
+        page_icon="✨",
+        layout="wide"
+    )
+
+    # ------------------------------
+    # Load API Key
+    # ------------------------------
+    GOOGLE_API_KEY = api_key()
+
+    if not GOOGLE_API_KEY:
+        st.error(text["missing_key"])
+        st.stop()
+
+    # Each user's chats live in a directory of their own (see user_storage.py)
+    data_dir = session_data_dir()
+    if data_dir is None:
+        st.error(text["user_unknown"])
+        st.stop()
+
+    send_executor = get_send_executor()
+    turn_metrics = get_turn_metrics()
+
+    # A reply still streaming from an interrupted run (another chat was selected
+    # or a new message was sent) is cancelled
+    if st.session_state.get("pending_request") is not None:
+        st.session_state.pending_request.cancel()
+        st.session_state.pending_request = None
+
+    # ------------------------------
+    # Data Preparation
+    # ------------------------------
+    # Chat logs and catalog are kept by STORAGE_BACKEND (see storage_backend.py)
+    transcripts = open_transcripts(data_dir, avatars={MODEL_ROLE: AI_AVATAR_ICON})
+    # Turns of every user are saved by one background thread (see persist_queue.py)
+    persist_queue = get_persist_queue("data", avatars={MODEL_ROLE: AI_AVATAR_ICON})
+    if persist_queue.prometheus not in turn_metrics.collectors:
+        turn_metrics.collectors.append(persist_queue.prometheus)
+    # New chats get a better title in the background (see auto_title.py)
+    title_queue = get_title_queue()
+    if title_queue is not None and title_queue.prometheus not in turn_metrics.collectors:
+        turn_metrics.collectors.append(title_queue.prometheus)
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
+    # Messages, history and live chats held in memory (see session_memory.py)
+    session_memory = get_session_memory()
+    if session_memory.prometheus not in turn_metrics.collectors:
+        turn_metrics.collectors.append(session_memory.prometheus)
+    memory_slot = session_memory.slot(st.session_state.session_id)
+    if st.session_state.get("memory_slot") is not memory_slot:
+        # First run, or this idle session was released: read the chat again
+        st.session_state.memory_slot = memory_slot
+        st.session_state.pop("loaded_chat", None)
+    # One response cache for all users: replies are keyed by everything sent with them
+    response_cache = get_response_cache("data")
+    retrieval_memory = get_retrieval_memory(data_dir)
+
+    # Load past chats (one catalog and one search index per user directory and process)
+    catalog = get_catalog(data_dir)
+    search_index = get_search_index(data_dir)
+
+    if "chat_list_limit" not in st.session_state:
+        st.session_state.chat_list_limit = CHAT_LIST_PAGE_SIZE
+    past_chats = dict(catalog.recent(st.session_state.chat_list_limit))
+
+    # Unique chat ID for new session
+    new_chat_id = str(time.time())
+
+    # ------------------------------
+    # Sidebar Chat List + Rename Functionality
+    # ------------------------------
+    with st.sidebar:
+
+        st.write(text["chat_history"]) # The header is here
+
+        # Full-text search over every chat (see search_index.py); a hit opens
+        # its chat at the matching message
+        search_query = st.text_input(text["search"], key="search_query")
+        if search_query.strip():
+            hits, elapsed_ms = search_index.timed_search(search_query)
+            st.caption(text["search_results"].format(count=len(hits), ms=elapsed_ms))
+            for i, (hit_chat_id, position, _, snippet) in enumerate(hits):
+                st.button(
+                    f"**{catalog.title(hit_chat_id, hit_chat_id)}** · {snippet}",
+                    key=f"search_hit_{i}",
+                    on_click=lambda c=hit_chat_id, p=position: st.session_state.update(
+                        chat_id=c, search_jump=(c, p)
+                    ),
+                )
+
+        options = [new_chat_id] + list(past_chats.keys())
+
+        if "chat_id" not in st.session_state:
+            st.session_state.chat_id = options[0]
+
+        # Keep the selected chat in the list even if it is on an older page
+        if st.session_state.chat_id not in past_chats:
+            selected_title = catalog.title(st.session_state.chat_id)
+            if selected_title is not None:
+                past_chats[st.session_state.chat_id] = selected_title
+                options.append(st.session_state.chat_id)
+
+        # The selectbox follows chat_id and picking a chat updates chat_id, because
+        # the list is reordered as chats are used
+        if st.session_state.chat_id not in options:
+            st.session_state.chat_id = new_chat_id
+        st.session_state.selectbox_chat = st.session_state.chat_id
+
+        # Streamlit tells options apart by their label, so repeated titles get a number
+        labels, seen = {}, {}
+        for option in options:
+            label = past_chats.get(option, text["new_chat_option"])
+            seen[label] = seen.get(label, 0) + 1
+            labels[option] = label if seen[label] == 1 else f"{label} ({seen[label]})"
+
+        selected_chat_id = st.selectbox(
+            text["select_chat"],
+            options=options,
+            format_func=lambda x: labels[x],
+            key="selectbox_chat", # Adding a key
+            on_change=lambda: st.session_state.update(
+                chat_id=st.session_state.selectbox_chat
+            ),
+        )
+
+        st.session_state.chat_id = selected_chat_id
+
+        # Only the most recent chats are listed; the button loads the next page
+        if catalog.count() > st.session_state.chat_list_limit:
+            if st.button(text["older_chats"], key="more_chats"):
+                st.session_state.chat_list_limit += CHAT_LIST_PAGE_SIZE
+                st.rerun()
+
+        # Update the title of the selected chat
+        if st.session_state.chat_id == new_chat_id:
+             st.session_state.chat_title = text["new_chat"]
+        elif st.session_state.chat_id in past_chats:
+             st.session_state.chat_title = past_chats[st.session_state.chat_id]
+
+        # --- Rename Chat Functionality ---
+        if st.session_state.chat_id != new_chat_id:
+            st.markdown("---")
+
+            # The box shows the catalog title again when the chat is switched or its
+            # title was changed elsewhere (another tab, auto_title.py), so a title
+            # the box still holds is never saved back over the new one
+            shown = (st.session_state.chat_id, st.session_state.chat_title)
+            if st.session_state.get("rename_shown") != shown:
+                st.session_state.rename_input = st.session_state.chat_title
+                st.session_state.rename_shown = shown
+
+            new_title = st.text_input(
+                text["rename"],
+                max_chars=50,
+                key="rename_input"
+            )
+
+            # Logic to save the new name
+            if new_title and new_title != st.session_state.chat_title:
+                catalog.rename(st.session_state.chat_id, new_title)
+                st.session_state.chat_title = new_title
+                st.session_state.rename_shown = (st.session_state.chat_id, new_title)
+
+                # Necessary to immediately update the selectbox and title
+                st.toast(text["renamed"].format(title=new_title), icon='✅')
+
+                st.rerun() # Reruns the script to show the new name
+
+        st.markdown("---")
+        st.markdown(text["model"].format(model=MODEL_NAME))
+
+        # Pool utilisation, only shown when CHAT_DEBUG is set
+        if os.environ.get("CHAT_DEBUG"):
+            client, sender = gemini(GOOGLE_API_KEY, text)
+            with st.expander(text["debug_pool"]):
+                st.json(pool_stats(client))
+            with st.expander(text["debug_context"]):
+                st.json(dict(
+                    st.session_state.get("context_stats", {}),
+                    total_saved_tokens=st.session_state.get("context_tokens_saved", 0),
+                ))
+            if response_cache is not None:
+                with st.expander(text["debug_cache"]):
+                    st.json(response_cache.stats())
+            if retrieval_memory is not None:
+                with st.expander(text["debug_retrieval"]):
+                    st.json(retrieval_memory.stats())
+            with st.expander(text["debug_live_chats"]):
+                st.json(memory_slot.live_chats.stats())
+            with st.expander(text["debug_memory"]):
+                st.json(dict(
+                    memory_slot.resident_bytes(),
+                    messages_on_disk_only=st.session_state.get("messages_offset", 0),
+                    process=session_memory.stats(),
+                ))
+            with st.expander(text["debug_send_queue"]):
+                st.json(send_executor.stats())
+            with st.expander(text["debug_retries"]):
+                st.json(sender.stats())
+
+        # --- LOGO PLACEMENT AT THE BOTTOM LEFT (LAST ELEMENT) ---
+        st.markdown("---") # Visual separator
+
+        logo = logo_bytes(LOGO_PATH)
+        if logo is not None:
+
+            # 1. Use st.image to show the image (read from disk once per process)
+            # st.image is not clickable, so we just display it:
+            st.image(logo, width=LOGO_WIDTH)
+
+            # 2. Use st.markdown to create a clickable link RIGHT AFTER
+            # (Ideally we want the image to be clickable, but this is a good compromise)
+            st.markdown(
+                f'<div style="text-align: center; margin-top: -10px; margin-bottom: 5px;">'
+                f'<a href="{LOGO_URL}" target="_blank" style="font-size:16px; color: grey; text-decoration: none;">{text["logo_link"]}</a>'
+                f'</div>',
+                unsafe_allow_html=True
+            )
+
+            # If you want the image *and* the "Powered by Gemini" text:
+            st.markdown(f'<p style="font-size: 10px; color: grey; text-align: center;">Powered by Gemini</p>', unsafe_allow_html=True)
+        else:
+            st.warning(text["logo_missing"].format(path=LOGO_PATH))
+        # -----------------------------------------------------------------
+
+
+    # ------------------------------
+    # Main Area
+    # ------------------------------
+    st.title(text["title"])
+    st.caption(text["caption"].format(model=MODEL_NAME))
+
+    # ------------------------------
+    # Load chat history for the selected ID
+    # ------------------------------
+    # Read from disk only when another chat is selected or its log has changed
+    if st.session_state.get("loaded_chat") == (st.session_state.chat_id, None):
+        # This session's last turn was queued; once written, the file it left is what the session holds
+        saved_version = persist_queue.saved_version(
+            st.session_state.chat_id, st.session_state.session_id, data_dir=data_dir
+        )
+        if saved_version is not None:
+            st.session_state.loaded_chat = (st.session_state.chat_id, saved_version)
+    chat_version = transcripts.version(st.session_state.chat_id)
+    if st.session_state.get("loaded_chat") not in (
+        (st.session_state.chat_id, chat_version),
+        (st.session_state.chat_id, None),
+    ):
+        # Turns still queued for this chat are written first
+        saved = persist_queue.flush(st.session_state.chat_id, data_dir=data_dir)
+        if not saved:
+            st.warning(text["chat_saving"])
+        try:
+            st.session_state.messages, st.session_state.gemini_history = transcripts.load(
+                st.session_state.chat_id
+            )
+        except CorruptChatError as e:
+            # The damaged frames are gone, the rest of the chat is usable
+            st.warning(text["chat_corrupt"].format(path=e.backup_path))
+            st.session_state.messages, st.session_state.gemini_history = e.messages, e.history
+        except Exception as e:
+            st.error(text["chat_unreadable"].format(error=e))
+            st.session_state.messages = []
+            st.session_state.gemini_history = []
+        # Without its queued turns the chat is read again on the next run
+        st.session_state.loaded_chat = (
+            st.session_state.chat_id,
+            transcripts.version(st.session_state.chat_id),
+        ) if saved else None
+        # Messages and history entries before the ones in memory (kept on disk only)
+        st.session_state.messages_offset = 0
+        st.session_state.history_offset = 0
+
+    # Disk loads in this run, only shown when CHAT_DEBUG is set
+    st.session_state.disk_loads_total = (
+        st.session_state.get("disk_loads_total", 0) + transcripts.loads
+    )
+    if os.environ.get("CHAT_DEBUG"):
+        with st.sidebar.expander(text["debug_disk"]):
+            st.json({
+                "loads_this_run": transcripts.loads,
+                "loads_total": st.session_state.disk_loads_total,
+                "write_behind": persist_queue.stats(),
+                "auto_title": title_queue.stats() if title_queue is not None else None,
+            })
+
+    # Only the most recent messages are drawn; older ones are loaded on request
+    if st.session_state.get("render_chat_id") != st.session_state.chat_id:
+        st.session_state.render_chat_id = st.session_state.chat_id
+        st.session_state.render_limit = RENDER_WINDOW
+
+    # Opened from a search hit: make sure the matching message is drawn
+    total_messages = st.session_state.messages_offset + len(st.session_state.messages)
+    jump = st.session_state.pop("search_jump", None)
+    if jump is not None and jump[0] == st.session_state.chat_id:
+        st.session_state.render_limit = max(
+            st.session_state.render_limit, total_messages - jump[1]
+        )
+
+    # Earlier messages asked for that are only on disk are read back, once the
+    # turns still queued are written (until then the ones in memory are kept)
+    if (
+        st.session_state.messages_offset
+        and st.session_state.render_limit > len(st.session_state.messages)
+        and persist_queue.flush(st.session_state.chat_id, data_dir=data_dir)
+    ):
+        try:
+            st.session_state.messages, st.session_state.gemini_history = transcripts.load(
+                st.session_state.chat_id
+            )
+        except CorruptChatError as e:
+            st.session_state.messages, st.session_state.gemini_history = e.messages, e.history
+        st.session_state.messages_offset = 0
+        st.session_state.history_offset = 0
+
+    # ------------------------------
+    # Initialize chat session (Client)
+    # ------------------------------
+    # Only the part of the history chosen by CONTEXT_POLICY is sent (see context_window.py)
+    context_window = ContextWindowManager()
+    window = context_window.apply(st.session_state.gemini_history)
+
+    # Beyond SESSION_MAX_BYTES the oldest turns are kept on disk only: messages
+    # that are not drawn, and history that is never sent
+    memory_slot.attach(st.session_state.messages, st.session_state.gemini_history)
+    messages_cut, history_cut = session_memory.trim(
+        memory_slot,
+        keep_messages=st.session_state.render_limit,
+        history_limit=window.dropped if context_window.policy in HISTORY_TRIM_POLICIES else 0,
+    )
+    st.session_state.messages_offset += messages_cut
+    st.session_state.history_offset += history_cut
+    if history_cut:
+        window = context_window.apply(st.session_state.gemini_history)
+    # Positions in the whole chat, as the live chat registry keeps them
+    window_start = st.session_state.history_offset + window.dropped
+    synced_len = st.session_state.history_offset + len(st.session_state.gemini_history)
+
+    # ------------------------------
+    # Display past messages
+    # ------------------------------
+    # Earlier messages not read back yet (their chat is still being saved) are
+    # not in memory: drawing starts at the first one that is
+    hidden = max(
+        first_visible(total_messages, st.session_state.render_limit),
+        st.session_state.messages_offset,
+    )
+    if hidden:
+        if st.button(text["load_earlier"].format(hidden=hidden), key="load_earlier"):
+            st.session_state.render_limit += RENDER_WINDOW
+            st.rerun()
+
+    for message in st.session_state.messages[hidden - st.session_state.messages_offset:]:
+        role, avatar, body = prepared(message, AI_AVATAR_ICON)
+        with st.chat_message(name=role, avatar=avatar):
+            st.markdown(body)
+
+    # ------------------------------
+    # User Input and Response Generation
+    # ------------------------------
+    if prompt := st.chat_input(text["chat_input"]):
+
+        # The client is created, and the SDK imported, on the first send
+        client, sender = gemini(GOOGLE_API_KEY, text)
+
+        # Live chat sessions are kept per chat_id (see chat_registry.py) and reused
+        # when they hold exactly the history that would be sent
+        live_chats = memory_slot.live_chats
+
+        chat = live_chats.get(st.session_state.chat_id, synced_len, window_start)
+        if chat is None:
+            chat = client.chats.create(
+                model=MODEL_NAME,
+                history=window.history,
+                config=window.config,
+            )
+            if st.session_state.gemini_history:
+                live_chats.put(
+                    st.session_state.chat_id,
+                    chat,
+                    synced_len,
+                    window_start,
+                    history_bytes(window.history),
+                )
+
+        # Phase timings of this turn (see turn_metrics.py)
+        timer = TurnTimer()
+
+        # 1. Display the user's message; it is kept only once the reply has
+        # streamed, so a failed or interrupted send leaves the chat as it was
+        with st.chat_message("user", avatar="👤"):
+            st.markdown(prompt)
+
+        # 2. Send the message in streaming
+        with st.chat_message(name=MODEL_ROLE, avatar=AI_AVATAR_ICON):
+
+            with timer.span("history"):
+                history_len = len(chat.get_history())
+
+            # Passages of earlier chats relevant to the prompt go with this
+            # request as system instruction (see retrieval_memory.py)
+            config = window.config
+            if retrieval_memory is not None:
+                with timer.span("retrieval"):
+                    config = window.with_instruction(retrieval_memory.recall(
+                        prompt,
+                        # The part of this chat that the window sends is not repeated
+                        exclude=(st.session_state.chat_id, total_messages - 2 * window.turns),
+                    ))
+
+            # Context window counters for this turn
+            st.session_state.context_stats = window.stats()
+            st.session_state.context_tokens_saved = (
+                st.session_state.get("context_tokens_saved", 0) + window.saved_tokens
+            )
+
+            # The same prompt with the same context can be answered from the cache
+            cached_text = None
+            send_stream = None
+            if response_cache is not None:
+                with timer.span("cache"):
+                    cache_key = response_cache.key(
+                        MODEL_NAME, prompt, window.history, config
+                    )
+                    cached_text = response_cache.get(cache_key)
+
+            renderer = StreamRenderer(st.empty())
+
+            timer.mark("sent")
+            try:
+                if cached_text is not None:
+                    stream = [cached_text]
+                else:
+                    # The request runs on the shared worker pool (see send_executor.py)
+                    send_stream = sender.stream(
+                        chat, prompt, window.sent_tokens, config
+                    )
+                    # Cancelling it cuts the connection, even while waiting for a chunk
+                    st.session_state.pending_request = send_executor.submit(
+                        iter, send_stream, on_cancel=send_stream.cancel
+                    )
+                    stream = st.session_state.pending_request.chunks()
+
+                # 3. Process the streaming chunks (typing effect)
+                for chunk_text in stream:
+                    timer.mark("first_token")
+                    if chunk_text:
+                        renderer.write(chunk_text)
+                timer.mark("last_token")
+            except Exception as e:
+                st.error(text["send_error"].format(error=e))
+                st.stop()
+            request = st.session_state.pending_request
+            if request is not None and request.started_at is not None:
+                timer.add("queue", request.started_at - request.submitted_at)
+            st.session_state.pending_request = None
+
+            full_text = renderer.finish()
+            timer.add("render", renderer.render_seconds)
+
+
+        # 4. Save the user's message and the assistant's
+        st.session_state.messages.append(
+            dict(role="user", content=prompt)
+        )
+        st.session_state.messages.append(
+            dict(
+                role=MODEL_ROLE,
+                content=full_text,
+                avatar=AI_AVATAR_ICON,
+            )
+        )
+
+        # 5. Update and save Gemini history
+        if send_stream is None or send_stream.resumed:
+            new_history = turn_contents(prompt, full_text)
+            # A cached or resumed reply is not in the live chat's own history; rebuild it on the next run
+            live_chats.discard(st.session_state.chat_id)
+        else:
+            with timer.span("history"):
+                new_history = chat.get_history()[history_len:]
+            # The live chat now holds this turn as well
+            live_chats.put(
+                st.session_state.chat_id,
+                chat,
+                synced_len + len(new_history),
+                window_start,
+                history_bytes(window.history) + history_bytes(new_history),
+            )
+        st.session_state.gemini_history.extend(new_history)
+        if response_cache is not None and cached_text is None:
+            response_cache.put(cache_key, full_text)
+
+        # 6. Save the session (Storage)
+        is_new_chat = st.session_state.chat_id not in catalog
+        if is_new_chat:
+            # When a New Chat receives the first message, it is listed at once under a
+            # placeholder title; the title queue replaces it after this run
+            new_title = " ".join(prompt.split()[:5]) + "..."
+            catalog.create(st.session_state.chat_id, new_title)
+            st.session_state.chat_title = new_title
+
+        # Save messages and history (log, catalog count and search index) in the background
+        with timer.span("persist"):
+            persist_queue.submit(
+                st.session_state.chat_id,
+                st.session_state.messages[-2:],
+                new_history,
+                st.session_state.messages_offset + len(st.session_state.messages) - 2,
+                owner=st.session_state.session_id,
+                data_dir=data_dir,
+            )
+        st.session_state.loaded_chat = (
+            st.session_state.chat_id,
+            persist_queue.saved_version(
+                st.session_state.chat_id, st.session_state.session_id, data_dir=data_dir
+            ),
+        )
+
+        if is_new_chat and title_queue is not None:
+            title_queue.submit(
+                data_dir, st.session_state.chat_id, new_title, prompt, full_text, sender=sender
+            )
+
+        # Report the turn (log, metrics file, debug panel)
+        turn = timer.finish(
+            output_tokens=estimate_tokens(full_text),
+            chat_id=st.session_state.chat_id,
+            source="api" if cached_text is None else "cache",
+            resumed=bool(send_stream is not None and send_stream.resumed),
+            context_tokens=window.sent_tokens,
+        )
+        turn_metrics.observe(turn)
+        st.session_state.recent_turns = (
+            st.session_state.get("recent_turns", []) + [turn]
+        )[-METRICS_RECENT:]
+
+        # Rerun only to show a new chat's title in the sidebar
+        if is_new_chat:
+            st.rerun()
+
+    # Last turns of this session, only shown when CHAT_DEBUG is set
+    if os.environ.get("CHAT_DEBUG") and st.session_state.get("recent_turns"):
+        with st.sidebar.expander(text["debug_turns"]):
+            st.dataframe(st.session_state.recent_turns, hide_index=True)
@@ -0,0 +1,93 @@
+import os
+from collections import OrderedDict
+
+from context_window import content_text
+
+# ------------------------------
+# Live chat registry
+# ------------------------------
+# Keeps the `client.chats` objects of the chats a session has used recently,
+# keyed by chat_id, so switching back to one of them reuses it instead of
+# re-marshalling its whole history into a new chat. Each entry remembers
+# which slice of the stored history it holds; an entry that no longer
+# matches (history changed on disk, different context window) is rebuilt.
+#
+#   LIVE_CHATS            chats kept per session          (default 8)
+#   LIVE_CHATS_MAX_BYTES  approx. history text kept alive (default 8 MB)
+
+LIVE_CHATS = int(os.environ.get("LIVE_CHATS", 8))
+LIVE_CHATS_MAX_BYTES = int(os.environ.get("LIVE_CHATS_MAX_BYTES", 8 * 1024 * 1024))
+
+
+def history_bytes(history):
+    return sum(len(content_text(c).encode("utf-8")) for c in history)
+
+
+class _Entry:
+    def __init__(self, chat, synced_len, window_start, size):
+        self.chat = chat
+        self.synced_len = synced_len
+        self.window_start = window_start
+        self.size = size
+
+
+class ChatRegistry:
+    """Per-session LRU of live chat objects with an entry and memory cap."""
+
+    def __init__(self, max_chats=None, max_bytes=None):
+        self.max_chats = LIVE_CHATS if max_chats is None else max_chats
+        self.max_bytes = LIVE_CHATS_MAX_BYTES if max_bytes is None else max_bytes
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, chat_id, synced_len, window_start):
+        """Live chat holding history[window_start:synced_len], or None."""
+        entry = self._entries.get(chat_id)
+        if (
+            entry is not None
+            and entry.synced_len == synced_len
+            and entry.window_start == window_start
+        ):
+            self._entries.move_to_end(chat_id)
+            self.hits += 1
+            return entry.chat
+        self.misses += 1
+        return None
+
+    def put(self, chat_id, chat, synced_len, window_start, size):
+        """Register (or refresh) the live chat for `chat_id`."""
+        self._entries[chat_id] = _Entry(chat, synced_len, window_start, size)
+        self._entries.move_to_end(chat_id)
+        self._evict(keep=chat_id)
+
+    def discard(self, chat_id):
+        self._entries.pop(chat_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    @property
+    def resident_bytes(self):
+        return sum(e.size for e in self._entries.values())
+
+    def stats(self):
+        return {
+            "live_chats": len(self._entries),
+            "resident_bytes": self.resident_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _evict(self, keep):
+        # Least recently used first; the chat in use is never evicted
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_chats or self.resident_bytes > self.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                break
+            del self._entries[oldest]
+            self.evictions += 1
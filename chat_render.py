@@ -0,0 +1,26 @@
+import os
+
+# ------------------------------
+# Chat history rendering helpers
+# ------------------------------
+# Only the last RENDER_WINDOW messages are drawn on each rerun; older ones
+# are loaded on demand. Markdown is parsed by the browser, so a message that
+# is not drawn costs the server nothing.
+
+RENDER_WINDOW = int(os.environ.get("RENDER_WINDOW", 50))
+
+USER_AVATAR_ICON = "👤"
+
+
+def first_visible(total, limit):
+    """Index of the first message shown when at most `limit` are drawn."""
+    return max(total - limit, 0)
+
+
+def prepared(message, ai_avatar):
+    """(role, avatar, markdown) for a stored message."""
+    role = message["role"]
+    avatar = message.get("avatar")
+    if avatar is None:
+        avatar = USER_AVATAR_ICON if role == "user" else ai_avatar
+    return role, avatar, message["content"]
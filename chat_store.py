@@ -0,0 +1,415 @@
+import json
+import logging
+import os
+import shutil
+import struct
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional, zlib is used instead
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# ------------------------------
+# Append-only chat transcript store
+# ------------------------------
+# Every chat lives in a single "data/<chat_id>.chat" file: a small header
+# (magic, format version, codec) followed by compressed frames. Saving a
+# turn appends one frame, so the cost does not grow with the length of the
+# conversation; when a chat has collected more than CHAT_COMPACT_FRAMES
+# frames it is rewritten as a single frame the next time it is loaded.
+#
+# A turn normally stores each message's text once, with its role as a
+# number. The avatar and the Gemini `Content` entries are derived from it
+# on load. Turns whose history is more than plain text (or messages with
+# other fields) keep the full history next to the text.
+#
+#   CHAT_COMPRESSION     zstd, zlib or none     (default zstd if installed, else zlib)
+#   CHAT_COMPACT_FRAMES  frames before a rewrite (default 32)
+#
+# Chats saved as "data/<chat_id>.jsonl" or as the old joblib pickles are
+# converted the first time they are opened.
+#
+# Several sessions or processes may write the same chat. Every read and
+# write of a chat holds its lock (an exclusive file lock in data/.locks,
+# shared by the chats that hash to the same one of LOCK_STRIPES files),
+# rewrites go to a temporary file that replaces the chat file atomically,
+# and every frame carries a CRC32. On load, a frame cut short by a crash is
+# dropped. A damaged frame is skipped: the original file is kept next to the
+# chat as "<chat_id>.chat.corrupt-<time>", the chat is rewritten from the
+# good frames and CorruptChatError reports what was recovered. A file whose
+# header is damaged has nothing readable: it is moved to the same kind of
+# backup and the chat starts over empty.
+
+DATA_DIR = "data"
+
+CHAT_COMPRESSION = os.environ.get("CHAT_COMPRESSION") or ("zstd" if zstandard else "zlib")
+CHAT_COMPACT_FRAMES = int(os.environ.get("CHAT_COMPACT_FRAMES", 32))
+
+MAGIC = b"GCHT"
+FORMAT_VERSION = 2  # 1: frames without checksum
+LOCK_STRIPES = 64
+CODECS = {"none": 0, "zlib": 1, "zstd": 2}
+CODEC_NAMES = {number: name for name, number in CODECS.items()}
+
+# Role enum: the index is what is stored
+ROLES = ("user", "ai")
+GEMINI_ROLES = {"user": "user", "ai": "model"}
+DEFAULT_AVATARS = {"ai": "✨"}
+
+_ZstdError = zstandard.ZstdError if zstandard else ValueError
+
+_HEADER = struct.Struct(">4sBB")  # magic, version, codec
+_FRAME_HEADERS = {
+    1: struct.Struct(">I"),  # length of the compressed frame that follows
+    2: struct.Struct(">II"),  # length, CRC32 of the compressed frame
+}
+
+
+log = logging.getLogger("chat.store")
+
+
+class CorruptChatError(Exception):
+    """A chat had damaged frames, or a damaged header (skipped=0); the readable part is attached."""
+
+    def __init__(self, chat_id, messages, history, skipped, backup_path):
+        damage = f"{skipped} damaged frame(s)" if skipped else "a damaged header"
+        super().__init__(f"{damage} in chat {chat_id}, original kept as {backup_path}")
+        self.chat_id = chat_id
+        self.messages = messages
+        self.history = history
+        self.skipped = skipped
+        self.backup_path = backup_path
+
+
+class TranscriptStore:
+    """Per-chat compressed log of display messages and Gemini history."""
+
+    def __init__(self, data_dir=DATA_DIR, compression=None, avatars=None):
+        self.data_dir = data_dir
+        self.codec = CHAT_COMPRESSION if compression is None else compression
+        if self.codec not in CODECS or (self.codec == "zstd" and zstandard is None):
+            raise ValueError(f"Unsupported chat compression: {self.codec}")
+        self.avatars = DEFAULT_AVATARS if avatars is None else avatars
+        os.makedirs(self.data_dir, exist_ok=True)
+        # Number of transcripts read from disk by this store
+        self.loads = 0
+
+    def _path(self, chat_id):
+        return os.path.join(self.data_dir, f"{chat_id}.chat")
+
+    def _jsonl_path(self, chat_id):
+        return os.path.join(self.data_dir, f"{chat_id}.jsonl")
+
+    def _legacy_paths(self, chat_id):
+        return (
+            os.path.join(self.data_dir, f"{chat_id}-st_messages"),
+            os.path.join(self.data_dir, f"{chat_id}-gemini_messages"),
+        )
+
+    def version(self, chat_id):
+        """Cheap change marker for a chat's log: (mtime_ns, size), or None."""
+        try:
+            stat = os.stat(self._path(chat_id))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self, chat_id):
+        """Rebuild (messages, gemini_history) for a chat.
+
+        Returns two empty lists if the chat has never been saved. Raises
+        CorruptChatError (holding the readable messages) if frames had to
+        be skipped.
+        """
+        path = self._path(chat_id)
+        with self._lock(chat_id):
+            if not os.path.exists(path):
+                self._migrate(chat_id)
+            if not os.path.exists(path):
+                return [], []
+
+            self.loads += 1
+            with open(path, "rb") as f:
+                data = f.read()
+            if len(data) < _HEADER.size:
+                return [], []  # nothing saved yet, or a header cut short by a crash
+            try:
+                version, codec = _parse_header(data)
+            except ValueError:
+                backup_path = _backup_path(path)
+                os.replace(path, backup_path)
+                raise CorruptChatError(chat_id, [], [], 0, backup_path) from None
+            frames, end = _read_frames(data, version)
+            if end < len(data):
+                # A frame cut short by a crash: drop it so the next append is readable
+                os.truncate(path, end)
+
+            records, skipped = [], 0
+            for frame in frames:
+                try:
+                    records.extend(json.loads(_decompress(codec, frame)))
+                except (ValueError, zlib.error, _ZstdError):
+                    skipped += 1
+
+            backup_path = None
+            if skipped:
+                backup_path = _backup_path(path)
+                shutil.copyfile(path, backup_path)
+            if skipped or len(frames) > CHAT_COMPACT_FRAMES:
+                self._write(chat_id, records)
+
+        messages, history = [], []
+        for record in records:
+            self._decode_turn(record, messages, history)
+        if skipped:
+            raise CorruptChatError(chat_id, messages, history, skipped, backup_path)
+        return messages, history
+
+    def append_turn(self, chat_id, new_messages, new_history):
+        """Append the messages and Gemini contents produced by one turn."""
+        self.append_turns(chat_id, [(new_messages, new_history)])
+
+    def append_turns(self, chat_id, turns):
+        """Append several (messages, history) turns as a single frame."""
+        records = [self._encode_turn(messages, history) for messages, history in turns]
+        path = self._path(chat_id)
+        with self._lock(chat_id), open(path, "ab+") as f:
+            f.seek(0)
+            header = f.read(_HEADER.size)
+            version = None
+            if len(header) == _HEADER.size:
+                try:
+                    version, codec = _parse_header(header)
+                except ValueError:
+                    # Unreadable whatever is appended: keep it and start the chat over
+                    backup_path = _backup_path(path)
+                    shutil.copyfile(path, backup_path)
+                    log.warning("Chat %s had a damaged header, original kept as %s", chat_id, backup_path)
+            if version is not None:
+                # Drop a frame cut short by a process killed while appending
+                end = _frames_end(f, version)
+                if end < f.seek(0, os.SEEK_END):
+                    f.truncate(end)
+            else:
+                # New chat (or a header cut short by a crash, or damaged)
+                f.truncate(0)
+                version, codec = FORMAT_VERSION, self.codec
+                f.write(_HEADER.pack(MAGIC, version, CODECS[codec]))
+            f.write(_frame(version, codec, records))
+
+    def _lock(self, chat_id):
+        stripe = zlib.crc32(chat_id.encode("utf-8")) % LOCK_STRIPES
+        return FileLock(os.path.join(self.data_dir, ".locks", f"{stripe:02d}.lock"))
+
+    # ------------------------------
+    # Turn records
+    # ------------------------------
+    def _encode_turn(self, messages, history):
+        history = [_content_to_dict(c) for c in history]
+        compact = self._compact_messages(messages)
+        if compact is None:
+            return {"messages": list(messages), "history": history}
+        if history == [_text_content(ROLES[role], text) for role, text in compact]:
+            return compact
+        return {"m": compact, "h": history}
+
+    def _compact_messages(self, messages):
+        """[[role, text], ...] if nothing else needs storing, otherwise None."""
+        compact = []
+        for message in messages:
+            role = message.get("role")
+            if (
+                role not in ROLES
+                or not isinstance(message.get("content"), str)
+                or set(message) - {"role", "content", "avatar"}
+                or message.get("avatar") != self.avatars.get(role)
+            ):
+                return None
+            compact.append([ROLES.index(role), message["content"]])
+        return compact
+
+    def _decode_turn(self, record, messages, history):
+        # Opening a saved chat is the one thing before a first send that needs
+        # the SDK; a new session does not load it (see build_client)
+        from google.genai import types
+
+        if isinstance(record, list):
+            for role, text in record:
+                messages.append(self._message(ROLES[role], text))
+                history.append(types.Content(
+                    role=GEMINI_ROLES[ROLES[role]], parts=[types.Part(text=text)]
+                ))
+        elif "m" in record:
+            messages.extend(self._message(ROLES[role], text) for role, text in record["m"])
+            history.extend(types.Content.model_validate(c) for c in record["h"])
+        else:
+            messages.extend(record["messages"])
+            history.extend(types.Content.model_validate(c) for c in record["history"])
+
+    def _message(self, role, text):
+        message = dict(role=role, content=text)
+        if role in self.avatars:
+            message["avatar"] = self.avatars[role]
+        return message
+
+    def _write(self, chat_id, records):
+        """Atomically replace a chat's file with `records` in a single frame."""
+        path = self._path(chat_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, CODECS[self.codec]))
+            f.write(_frame(FORMAT_VERSION, self.codec, records))
+            f.flush()
+            # The new file must be on disk before it replaces the old one
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    # ------------------------------
+    # One-time migration from the JSONL logs and the joblib pickles
+    # ------------------------------
+    def _migrate(self, chat_id):
+        jsonl_path = self._jsonl_path(chat_id)
+        if os.path.exists(jsonl_path):
+            records = []
+            with open(jsonl_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        turn = json.loads(line)
+                        records.append(
+                            self._encode_turn(turn.get("messages", []), turn.get("history", []))
+                        )
+            self._write(chat_id, records)
+            os.replace(jsonl_path, jsonl_path + ".migrated")
+            return
+
+        st_path, gemini_path = self._legacy_paths(chat_id)
+        if not (os.path.exists(st_path) and os.path.exists(gemini_path)):
+            return
+        import joblib
+
+        messages = joblib.load(st_path)
+        history = joblib.load(gemini_path)
+        self._write(chat_id, [self._encode_turn(messages, history)])
+
+        # Keep the old files around, but out of the way
+        os.replace(st_path, st_path + ".migrated")
+        os.replace(gemini_path, gemini_path + ".migrated")
+
+
+class FileLock:
+    """Exclusive lock on a file, between threads and between processes."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after about 10 seconds
+                    continue
+        return self
+
+    def __exit__(self, *exc):
+        # Closing the file releases the lock
+        if fcntl is None:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+
+
+def _backup_path(path):
+    return f"{path}.corrupt-{time.time_ns()}"
+
+
+def _parse_header(data):
+    """(version, codec) from the start of a chat file."""
+    if len(data) < _HEADER.size:
+        raise ValueError("Chat file header is truncated")
+    magic, version, codec = _HEADER.unpack_from(data)
+    if magic != MAGIC or version not in _FRAME_HEADERS or codec not in CODEC_NAMES:
+        raise ValueError("Not a chat file, or written by a newer version")
+    return version, CODEC_NAMES[codec]
+
+
+def _read_frames(data, version):
+    """([compressed frames, None for damaged ones], end of the last complete frame)."""
+    frame_header = _FRAME_HEADERS[version]
+    frames = []
+    offset = _HEADER.size
+    while offset + frame_header.size <= len(data):
+        length, *checksum = frame_header.unpack_from(data, offset)
+        start = offset + frame_header.size
+        if start + length > len(data):
+            break
+        frame = data[start:start + length]
+        frames.append(None if checksum and zlib.crc32(frame) != checksum[0] else frame)
+        offset = start + length
+    return frames, offset
+
+
+def _frames_end(f, version):
+    """End of the last complete frame, reading only the frame headers."""
+    frame_header = _FRAME_HEADERS[version]
+    size = f.seek(0, os.SEEK_END)
+    offset = _HEADER.size
+    while offset + frame_header.size <= size:
+        f.seek(offset)
+        (length, *_) = frame_header.unpack(f.read(frame_header.size))
+        if offset + frame_header.size + length > size:
+            break
+        offset += frame_header.size + length
+    return offset
+
+
+def _frame(version, codec, records):
+    payload = json.dumps(records, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    compressed = _compress(codec, payload)
+    if version == 1:
+        return _FRAME_HEADERS[1].pack(len(compressed)) + compressed
+    return _FRAME_HEADERS[2].pack(len(compressed), zlib.crc32(compressed)) + compressed
+
+
+def _compress(codec, payload):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(payload)
+    if codec == "zlib":
+        return zlib.compress(payload, 6)
+    return payload
+
+
+def _decompress(codec, frame):
+    if frame is None:
+        raise ValueError("Frame checksum mismatch")
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This chat is zstd-compressed; install the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(frame)
+    if codec == "zlib":
+        return zlib.decompress(frame)
+    return frame
+
+
+def _text_content(role, text):
+    return {"parts": [{"text": text}], "role": GEMINI_ROLES[role]}
+
+
+def _content_to_dict(content):
+    if isinstance(content, dict):
+        return content
+    return content.model_dump(mode="json", exclude_none=True)
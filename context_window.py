@@ -0,0 +1,167 @@
+import os
+
+# ------------------------------
+# Context window policies
+# ------------------------------
+# The full Gemini history always stays on disk; this module only decides how
+# much of it is sent with the next message. Policies (CONTEXT_POLICY):
+#
+#   full     send everything (previous behaviour)
+#   sliding  send the last CONTEXT_MAX_TURNS turns
+#   budget   send as many recent turns as fit in CONTEXT_TOKEN_BUDGET
+#   summary  like "budget", plus a compact local summary of the dropped turns
+#            passed as system instruction
+#
+# Token counts are local estimates (about 4 characters per token), so no
+# extra API call is needed.
+
+CONTEXT_POLICY = os.environ.get("CONTEXT_POLICY", "full")
+CONTEXT_MAX_TURNS = int(os.environ.get("CONTEXT_MAX_TURNS", 20))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 32000))
+SUMMARY_TOKEN_BUDGET = int(os.environ.get("SUMMARY_TOKEN_BUDGET", 1000))
+
+CHARS_PER_TOKEN = 4
+SUMMARY_SNIPPET_CHARS = 200
+
+POLICIES = ("full", "sliding", "budget", "summary")
+
+
+def content_text(content):
+    """Concatenated text of all parts of a Gemini `Content`."""
+    return "".join(part.text or "" for part in (content.parts or []))
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class ContextWindow:
+    """The part of the history to send, plus what it saved."""
+
+    def __init__(self, history, config, raw_tokens, sent_tokens, dropped):
+        self.history = history
+        self.config = config
+        self.raw_tokens = raw_tokens
+        self.sent_tokens = sent_tokens
+        self.dropped = dropped
+
+    @property
+    def trimmed(self):
+        return self.dropped > 0
+
+    @property
+    def saved_tokens(self):
+        return self.raw_tokens - self.sent_tokens
+
+    @property
+    def turns(self):
+        """Number of turns in the window."""
+        return len([c for c in self.history if c.role == "user" and content_text(c)])
+
+    def with_instruction(self, text):
+        """Config for one request: the window's config plus `text` as system instruction.
+
+        The tokens of `text` are counted as sent.
+        """
+        if not text:
+            return self.config
+        from google.genai import types  # the request is about to be sent anyway
+
+        previous = self.config.system_instruction if self.config is not None else None
+        if previous:
+            text = f"{previous}\n\n{text}"
+        self.sent_tokens += estimate_tokens(text) - estimate_tokens(previous or "")
+        return types.GenerateContentConfig(system_instruction=text)
+
+    def stats(self):
+        return {
+            "raw_tokens": self.raw_tokens,
+            "sent_tokens": self.sent_tokens,
+            "saved_tokens": self.saved_tokens,
+            "dropped_contents": self.dropped,
+        }
+
+
+class ContextWindowManager:
+    """Applies a context window policy to a full Gemini history."""
+
+    def __init__(self, policy=None, max_turns=None, token_budget=None,
+                 summary_budget=None):
+        self.policy = policy or CONTEXT_POLICY
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown context policy: {self.policy!r}")
+        self.max_turns = CONTEXT_MAX_TURNS if max_turns is None else max_turns
+        self.token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+        self.summary_budget = SUMMARY_TOKEN_BUDGET if summary_budget is None else summary_budget
+
+    def apply(self, history):
+        """Return the ContextWindow to send for this history."""
+        tokens = [estimate_tokens(content_text(c)) for c in history]
+        raw_tokens = sum(tokens)
+
+        if self.policy == "full" or not history:
+            return ContextWindow(list(history), None, raw_tokens, raw_tokens, 0)
+
+        starts = _turn_starts(history)
+        if self.policy == "sliding":
+            start = starts[-self.max_turns] if len(starts) > self.max_turns else 0
+        else:
+            start = self._budget_start(tokens, starts)
+
+        window = list(history[start:])
+        sent_tokens = sum(tokens[start:])
+
+        config = None
+        if self.policy == "summary" and start > 0:
+            summary = self._summarize(history[:start])
+            from google.genai import types
+
+            config = types.GenerateContentConfig(system_instruction=summary)
+            sent_tokens += estimate_tokens(summary)
+
+        return ContextWindow(window, config, raw_tokens, sent_tokens, start)
+
+    def _budget_start(self, tokens, starts):
+        # Walk back turn by turn while the newest turns still fit the budget;
+        # the most recent turn is always kept.
+        budget = self.token_budget
+        if self.policy == "summary":
+            budget -= self.summary_budget
+        start = starts[-1]
+        used = sum(tokens[start:])
+        for turn_start in reversed(starts[:-1]):
+            turn_tokens = sum(tokens[turn_start:start])
+            if used + turn_tokens > budget:
+                break
+            used += turn_tokens
+            start = turn_start
+        return start
+
+    def _summarize(self, dropped):
+        # Extractive summary: the beginning of every dropped message, newest
+        # first until the summary budget is used, then put back in order.
+        lines, used = [], estimate_tokens("Summary of the earlier conversation:\n")
+        for content in reversed(dropped):
+            text = " ".join(content_text(content).split())
+            if not text:
+                continue
+            if len(text) > SUMMARY_SNIPPET_CHARS:
+                text = text[:SUMMARY_SNIPPET_CHARS].rstrip() + "…"
+            speaker = "User" if content.role == "user" else "Assistant"
+            line = f"- {speaker}: {text}"
+            if used + estimate_tokens(line) > self.summary_budget:
+                break
+            lines.append(line)
+            used += estimate_tokens(line)
+        lines.reverse()
+        return "Summary of the earlier conversation:\n" + "\n".join(lines)
+
+
+def _turn_starts(history):
+    # A turn starts at a user message that carries text (function responses
+    # are also sent with the "user" role but belong to the previous turn).
+    starts = [
+        i for i, c in enumerate(history)
+        if c.role == "user" and content_text(c)
+    ]
+    return starts or [0]
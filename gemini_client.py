@@ -0,0 +1,179 @@
+import os
+import socket
+import threading
+
+import httpx
+import streamlit as st
+
+# ------------------------------
+# Shared Gemini client
+# ------------------------------
+# One `genai.Client` per process, shared by every Streamlit session, so all
+# users reuse the same HTTP connection pool (and its TLS connections) instead
+# of opening a new pool per browser tab. Pool limits come from the
+# environment:
+#
+#   GEMINI_MAX_CONNECTIONS   total connections in the pool   (default 20)
+#   GEMINI_MAX_KEEPALIVE     idle connections kept open      (default 10)
+#   GEMINI_KEEPALIVE_EXPIRY  seconds an idle connection lives (default 30)
+#   GEMINI_TIMEOUT           request timeout in seconds       (default 120)
+#
+# abort_requests() cuts the responses a thread is reading, so a cancelled
+# reply gives its worker back at once instead of after GEMINI_TIMEOUT.
+
+
+def _env_number(name, default, cast=int):
+    value = os.environ.get(name)
+    return cast(value) if value else default
+
+
+class PoolStats:
+    """Thread-safe counters describing how busy the connection pool is."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests_total = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.errors_total = 0
+
+    def begin(self):
+        with self._lock:
+            self.requests_total += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def end(self, error=False):
+        with self._lock:
+            self.in_flight -= 1
+            if error:
+                self.errors_total += 1
+
+
+# Thread ident -> response bodies that thread has open, for abort_requests()
+_open_streams = {}
+_open_streams_lock = threading.Lock()
+
+
+class _CountingStream(httpx.SyncByteStream):
+    """Response body wrapper that reports when a (streamed) response is done."""
+
+    def __init__(self, stream, on_close, network_stream=None):
+        self._stream = stream
+        self._on_close = on_close
+        self._network_stream = network_stream
+        self._closed = False
+        self._thread = threading.get_ident()
+        with _open_streams_lock:
+            _open_streams.setdefault(self._thread, set()).add(self)
+
+    def __iter__(self):
+        yield from self._stream
+
+    def abort(self):
+        """Make a read blocked on this response fail; safe from any thread."""
+        sock = self._network_stream and self._network_stream.get_extra_info("socket")
+        if sock is None:
+            return
+        try:
+            # Unlike close(), shutdown() wakes a thread waiting in recv()
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # already closed
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if not self._closed:
+                self._closed = True
+                with _open_streams_lock:
+                    streams = _open_streams.get(self._thread, set())
+                    streams.discard(self)
+                    if not streams:
+                        _open_streams.pop(self._thread, None)
+                self._on_close()
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    """HTTP transport that tracks in-flight requests on the shared pool."""
+
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request):
+        self.stats.begin()
+        try:
+            response = super().handle_request(request)
+        except Exception:
+            self.stats.end(error=True)
+            raise
+        # Streamed responses keep the connection busy until the body is closed
+        response.stream = _CountingStream(
+            response.stream, self.stats.end, response.extensions.get("network_stream")
+        )
+        return response
+
+    def connection_counts(self):
+        """Return (open, idle) connection counts of the underlying pool."""
+        connections = list(getattr(self._pool, "connections", []))
+        idle = sum(1 for c in connections if c.is_idle())
+        return len(connections), idle
+
+
+def build_client(api_key):
+    """Create a Gemini client with its own counted connection pool."""
+    # The SDK takes ~0.3 s to import, so that is left to the first send
+    from google import genai
+    from google.genai import types
+
+    limits = httpx.Limits(
+        max_connections=_env_number("GEMINI_MAX_CONNECTIONS", 20),
+        max_keepalive_connections=_env_number("GEMINI_MAX_KEEPALIVE", 10),
+        keepalive_expiry=_env_number("GEMINI_KEEPALIVE_EXPIRY", 30.0, float),
+    )
+    transport = _CountingTransport(PoolStats(), limits=limits)
+    timeout = _env_number("GEMINI_TIMEOUT", 120.0, float)
+
+    client = genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(
+            timeout=int(timeout * 1000),  # milliseconds
+            client_args={"transport": transport},
+        ),
+    )
+    client._pool_transport = transport
+    return client
+
+
+def abort_requests(thread_id):
+    """Cut every response the thread `thread_id` is reading (see _CountingStream.abort)."""
+    with _open_streams_lock:
+        streams = list(_open_streams.get(thread_id, ()))
+    for stream in streams:
+        stream.abort()
+
+
+@st.cache_resource(show_spinner=False)
+def get_client(api_key):
+    """Return the process-wide Gemini client for this API key."""
+    return build_client(api_key)
+
+
+def pool_stats(client):
+    """Snapshot of the shared pool's utilisation counters as a dict."""
+    transport = getattr(client, "_pool_transport", None)
+    if transport is None:
+        return {}
+    stats = transport.stats
+    open_connections, idle_connections = transport.connection_counts()
+    return {
+        "requests_total": stats.requests_total,
+        "in_flight": stats.in_flight,
+        "peak_in_flight": stats.peak_in_flight,
+        "errors_total": stats.errors_total,
+        "open_connections": open_connections,
+        "idle_connections": idle_connections,
+        "max_connections": _env_number("GEMINI_MAX_CONNECTIONS", 20),
+    }
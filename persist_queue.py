@@ -0,0 +1,445 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+from retrieval_memory import RETRIEVAL_MEMORY, RetrievalMemory
+from search_index import SearchIndex
+from storage_backend import open_catalog, open_transcripts, turn_feed
+from user_storage import USER_OPEN_STORES
+
+# ------------------------------
+# Write-behind persistence
+# ------------------------------
+# Saving a turn (chat log, catalog count, search index and, with
+# RETRIEVAL_MEMORY, the retrieval memory) is handed to one background
+# thread, so the reply is interactive as soon as it has streamed. Turns
+# waiting for the same chat are coalesced into a single frame, and every
+# flush updates the catalog and the search index in one transaction each,
+# whatever the number of chats in it.
+#
+#   PERSIST_MODE            sync, async or interval       (default async)
+#   PERSIST_FLUSH_INTERVAL  seconds between interval flushes (default 1)
+#   PERSIST_MAX_ATTEMPTS    tries before a turn is given up  (default 5)
+#
+#   sync      the script waits until the turn is written; nothing is lost
+#             if the process is killed
+#   async     the turn is written as soon as the thread is free; a killed
+#             process loses only the turns still queued (normally a few ms)
+#   interval  turns are written at most every PERSIST_FLUSH_INTERVAL
+#             seconds, so busy chats share writes; a killed process can lose
+#             that many seconds of turns
+#
+# Pending turns are always written before a chat is read from disk, so every
+# session of the process sees its own turns, and when the process exits.
+# One queue serves every data directory (each user's, see user_storage.py);
+# a chat is identified by its directory and ID. With STORAGE_BACKEND=redis
+# the search index and retrieval memory are not written here: each flush
+# goes to the turn feed, which every replica's index reads
+# (see storage_backend.py).
+#
+# A chat whose log cannot be written is retried on its own every
+# RETRY_DELAY seconds while the other chats are written. After
+# PERSIST_MAX_ATTEMPTS failures its turns are logged, appended to
+# <data_dir>/unsaved_turns.jsonl and dropped, and the sessions holding them
+# read the chat again. A failed catalog, search index, retrieval memory or
+# turn feed update is queued the same way, per data directory and store,
+# with the updates of later turns appended to it; after as many failures it
+# is given up with an error in the log.
+
+PERSIST_MODE = os.environ.get("PERSIST_MODE", "async")
+PERSIST_FLUSH_INTERVAL = float(os.environ.get("PERSIST_FLUSH_INTERVAL", 1))
+PERSIST_MAX_ATTEMPTS = int(os.environ.get("PERSIST_MAX_ATTEMPTS", 5))
+MODES = ("sync", "async", "interval")
+
+RETRY_DELAY = 1.0
+SYNC_TIMEOUT = 30  # longest a sync submit waits for its turn to be written
+WRITTEN_ENTRIES = 4096  # chats whose last write saved_version() remembers
+UNSAVED_FILE = "unsaved_turns.jsonl"
+
+log = logging.getLogger("chat.persist")
+
+
+class PersistQueue:
+    """Write-behind queue of saved turns, written by a background thread."""
+
+    def __init__(self, data_dir="data", mode=None, interval=None, avatars=None):
+        self.data_dir = data_dir
+        self.mode = mode or PERSIST_MODE
+        if self.mode not in MODES:
+            raise ValueError(f"PERSIST_MODE must be one of {', '.join(MODES)}, not {self.mode!r}")
+        self.interval = PERSIST_FLUSH_INTERVAL if interval is None else interval
+        self.avatars = avatars
+        self._cond = threading.Condition()
+        self._pending = {}  # (data_dir, chat_id) -> [(seq, owner, messages, history, start), ...]
+        self._in_flight = {}
+        self._oldest = None  # when the oldest pending turn was submitted
+        self._seq = 0
+        self._retry_at = {}  # (data_dir, chat_id) -> when its failed turns are tried again
+        self._attempts = {}  # (data_dir, chat_id) -> failed writes of its queued turns
+        self._updates = {}  # (data_dir, store) -> (payload, failed attempts, when it is tried again)
+        self._updating = {}
+        self._written = OrderedDict()  # (data_dir, chat_id) -> (file version, owners of the last write)
+        self._urgent = False
+        self._closed = False
+        self._counters = dict(submitted=0, written=0, coalesced=0, flushes=0, errors=0, dropped=0)
+        self._flush_seconds = dict(last=0.0, total=0.0, max=0.0)
+        self._thread = threading.Thread(target=self._run, name="persist", daemon=True)
+        self._thread.start()
+
+    def submit(self, chat_id, messages, history, start, owner=None, data_dir=None):
+        """Queue one turn: its messages (number `start` on) and Gemini contents."""
+        key = (data_dir or self.data_dir, chat_id)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The persist queue is closed")
+            self._seq += 1
+            seq = self._seq
+            turns = self._pending.setdefault(key, [])
+            if turns:
+                self._counters["coalesced"] += 1
+            turns.append((seq, owner, messages, history, start))
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._counters["submitted"] += 1
+            if self.mode == "sync":
+                self._urgent = True
+            self._cond.notify_all()
+            if self.mode == "sync" and not self._cond.wait_for(lambda: not self._queued(key), SYNC_TIMEOUT):
+                log.warning("Turn of chat %s still queued after %d s", chat_id, SYNC_TIMEOUT)
+        return seq
+
+    def flush(self, chat_id=None, timeout=30, data_dir=None):
+        """Wait until the queued turns (of `chat_id`, or all) are written or given up.
+
+        Returns False if they are still queued after `timeout` seconds.
+        """
+        key = (data_dir or self.data_dir, chat_id)
+        with self._cond:
+            if not self._queued(key):
+                return True
+            self._urgent = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._queued(key), timeout)
+
+    def saved_version(self, chat_id, owner, data_dir=None):
+        """File version left by the last write of `chat_id`, once nothing is queued for it.
+
+        None while turns of the chat are still queued, False if the chat has
+        to be read again: the last write also held turns of other owners,
+        its turns were given up, or it is too long ago to be remembered.
+        """
+        key = (data_dir or self.data_dir, chat_id)
+        with self._cond:
+            if self._queued(key):
+                return None
+            version, owners = self._written.get(key, (False, ()))
+            return version if set(owners) <= {owner} else False
+
+    def close(self, timeout=30):
+        """Write everything still queued and stop the thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            flushes = self._counters["flushes"]
+            return dict(
+                self._counters,
+                mode=self.mode,
+                queue_depth=sum(len(turns) for turns in self._pending.values()),
+                queued_chats=len(self._pending),
+                retrying_chats=len(self._retry_at),
+                retrying_updates=len(self._updates),
+                last_flush_ms=round(self._flush_seconds["last"] * 1000, 2),
+                avg_flush_ms=round(self._flush_seconds["total"] * 1000 / flushes, 2) if flushes else None,
+                max_flush_ms=round(self._flush_seconds["max"] * 1000, 2),
+            )
+
+    def prometheus(self):
+        """Queue metrics in Prometheus text format (added to METRICS_FILE)."""
+        stats = self.stats()
+        with self._cond:
+            total = self._flush_seconds["total"]
+        return "\n".join([
+            "# HELP chat_persist_queue_depth Turns waiting to be written.",
+            "# TYPE chat_persist_queue_depth gauge",
+            f"chat_persist_queue_depth {stats['queue_depth']}",
+            "# HELP chat_persist_turns_written_total Turns written by the persist thread.",
+            "# TYPE chat_persist_turns_written_total counter",
+            f"chat_persist_turns_written_total {stats['written']}",
+            "# HELP chat_persist_errors_total Failed writes (retried).",
+            "# TYPE chat_persist_errors_total counter",
+            f"chat_persist_errors_total {stats['errors']}",
+            "# HELP chat_persist_turns_dropped_total Turns given up after PERSIST_MAX_ATTEMPTS failed writes.",
+            "# TYPE chat_persist_turns_dropped_total counter",
+            f"chat_persist_turns_dropped_total {stats['dropped']}",
+            "# HELP chat_persist_flush_seconds Time to write one batch of turns.",
+            "# TYPE chat_persist_flush_seconds summary",
+            f"chat_persist_flush_seconds_sum {total:.6f}",
+            f"chat_persist_flush_seconds_count {stats['flushes']}",
+        ]) + "\n"
+
+    # ------------------------------
+    # Background thread
+    # ------------------------------
+    def _stores(self, data_dir, open_stores):
+        """(transcripts, catalog, search index, retrieval memory, turn feed) of a data directory.
+
+        The thread keeps its own, for the USER_OPEN_STORES directories it
+        wrote to most recently. With a turn feed, the index and memory are None.
+        """
+        stores = open_stores.pop(data_dir, None)
+        if stores is None:
+            feed = turn_feed(data_dir)
+            stores = (
+                open_transcripts(data_dir, avatars=self.avatars),
+                open_catalog(data_dir),
+                SearchIndex(data_dir) if feed is None else None,
+                RetrievalMemory(data_dir) if RETRIEVAL_MEMORY and feed is None else None,
+                feed,
+            )
+        open_stores[data_dir] = stores
+        while len(open_stores) > USER_OPEN_STORES:
+            open_stores.popitem(last=False)
+        return stores
+
+    def _queued(self, key):
+        """Whether turns of `key` are not yet written; with chat_id None, whether anything is queued."""
+        if key[1] is None:
+            return bool(self._pending or self._in_flight or self._updates or self._updating)
+        return key in self._pending or key in self._in_flight
+
+    def _take_batch(self):
+        """Wait for queued turns and store updates that are due and take them.
+
+        Returns (turns, store updates), or None once closed and drained.
+        """
+        while True:
+            if self._closed and not self._pending and not self._updates:
+                return None
+            now = time.monotonic()
+            due = [
+                key for key in self._pending
+                if self._closed or self._retry_at.get(key, now) <= now
+            ]
+            wait = None
+            if due and self.mode == "interval" and self._oldest is not None and not (self._urgent or self._closed):
+                remaining = self._oldest + self.interval - now
+                if remaining > 0:
+                    due, wait = [], remaining
+            updates = [key for key, (_, _, retry_at) in self._updates.items() if self._closed or retry_at <= now]
+            if due or updates:
+                batch = {key: self._pending.pop(key) for key in due}
+                for key in due:
+                    self._retry_at.pop(key, None)
+                self._in_flight = batch
+                self._updating = {key: self._updates.pop(key) for key in updates}
+                if due:
+                    self._oldest = None
+                    self._urgent = False
+                return batch, self._updating
+            retries = [self._retry_at[key] for key in self._pending if key in self._retry_at]
+            retries += [retry_at for _, _, retry_at in self._updates.values()]
+            if retries:
+                wait = min(min(retries) - now, wait if wait is not None else RETRY_DELAY)
+            self._cond.wait(wait)
+
+    def _run(self):
+        open_stores = OrderedDict()
+        while True:
+            with self._cond:
+                taken = self._take_batch()
+                if taken is None:
+                    return
+            batch, updates = taken
+
+            started = time.perf_counter()
+            versions, failed, failed_updates, deferred = self._write(batch, updates, open_stores)
+            elapsed = time.perf_counter() - started
+
+            given_up = {}
+            with self._cond:
+                for key, turns in batch.items():
+                    if key not in failed:
+                        self._attempts.pop(key, None)
+                        self._remember(key, versions[key], {turn[1] for turn in turns})
+                        self._counters["written"] += len(turns)
+                        continue
+                    attempts = self._attempts.pop(key, 0) + 1
+                    if attempts < PERSIST_MAX_ATTEMPTS:
+                        # Tried again on its own; turns queued meanwhile go in the same frame
+                        self._attempts[key] = attempts
+                        self._pending[key] = turns + self._pending.get(key, [])
+                        self._retry_at[key] = time.monotonic() + RETRY_DELAY
+                    else:
+                        given_up[key] = turns
+                        self._remember(key, False, ())
+                        self._counters["dropped"] += len(turns)
+                for (data_dir, name), (payload, attempts, error) in failed_updates.items():
+                    if attempts < PERSIST_MAX_ATTEMPTS:
+                        self._updates[data_dir, name] = (payload, attempts, time.monotonic() + RETRY_DELAY)
+                    else:
+                        log.error("Updating the %s of %s failed %d times (%s); given up",
+                                  name, data_dir, attempts, error)
+                for key, payload in deferred.items():
+                    earlier, attempts, retry_at = self._updates[key]
+                    self._updates[key] = (_merge(earlier, payload), attempts, retry_at)
+                self._in_flight = given_up  # flush() returns once they are kept on disk
+                self._updating = {}
+                self._counters["errors"] += len(failed) + len(failed_updates)
+                self._counters["flushes"] += 1
+                self._flush_seconds["last"] = elapsed
+                self._flush_seconds["total"] += elapsed
+                self._flush_seconds["max"] = max(self._flush_seconds["max"], elapsed)
+                self._cond.notify_all()
+            if given_up:
+                for key, turns in given_up.items():
+                    self._give_up(key, turns, failed[key])
+                with self._cond:
+                    self._in_flight = {}
+                    self._cond.notify_all()
+
+    def _remember(self, key, version, owners):
+        # Only the sessions that just wrote a chat ask for it; older entries are
+        # forgotten, and saved_version() then has the chat read again
+        self._written[key] = (version, owners)
+        self._written.move_to_end(key)
+        while len(self._written) > WRITTEN_ENTRIES:
+            self._written.popitem(last=False)
+
+    def _write(self, batch, updates, open_stores):
+        """Write the turns of `batch`, then the store updates they need and those of `updates`.
+
+        Returns ({key: file version}, {key: error} of the chats that failed,
+        {(data_dir, store): (payload, attempts, error)} of the updates that
+        failed, {(data_dir, store): payload} of the updates left to a retry
+        that is not due yet).
+        """
+        with self._cond:
+            waiting = set(self._updates)
+        versions, failed, failed_updates, deferred = {}, {}, {}, {}
+        by_dir = {}
+        for (data_dir, chat_id), turns in batch.items():
+            by_dir.setdefault(data_dir, {})[chat_id] = turns
+        for data_dir, _ in updates:
+            by_dir.setdefault(data_dir, {})
+        for data_dir, chats in by_dir.items():
+            retried = {name: update for (update_dir, name), update in updates.items() if update_dir == data_dir}
+            try:
+                stores = self._stores(data_dir, open_stores)
+            except Exception as e:
+                log.exception("Opening the stores of %s failed", data_dir)
+                failed.update({(data_dir, chat_id): e for chat_id in chats})
+                for name, (payload, attempts, _) in retried.items():
+                    failed_updates[data_dir, name] = (payload, attempts + 1, e)
+                continue
+            transcripts = stores[0]
+
+            written = {}
+            for chat_id, turns in chats.items():
+                try:
+                    transcripts.append_turns(chat_id, [(messages, history) for _, _, messages, history, _ in turns])
+                except Exception as e:
+                    log.exception("Saving chat %s failed", chat_id)
+                    failed[data_dir, chat_id] = e
+                    continue
+                written[chat_id] = turns
+                try:
+                    versions[data_dir, chat_id] = transcripts.version(chat_id)
+                except Exception:
+                    versions[data_dir, chat_id] = False  # the sessions read the chat again
+
+            for name, payload in self._store_updates(stores, written).items():
+                if (data_dir, name) in waiting:
+                    deferred[data_dir, name] = payload  # after the earlier ones, when they are retried
+                elif name in retried:
+                    # Still failing updates go first, so the turn feed stays in order
+                    earlier, attempts, error = retried[name]
+                    retried[name] = (_merge(earlier, payload), attempts, error)
+                else:
+                    retried[name] = (payload, 0, None)
+            for name, (payload, attempts, _) in retried.items():
+                try:
+                    self._update(stores, name, payload)
+                except Exception as e:
+                    log.exception("Updating the %s of %s failed (attempt %d of %d)",
+                                  name, data_dir, attempts + 1, PERSIST_MAX_ATTEMPTS)
+                    failed_updates[data_dir, name] = (payload, attempts + 1, e)
+        return versions, failed, failed_updates, deferred
+
+    @staticmethod
+    def _store_updates(stores, written):
+        """{store name: payload} that the chats just `written` need."""
+        if not written:
+            return {}
+        _, _, search_index, memory, feed = stores
+        batches = [
+            (chat_id, start, messages)
+            for chat_id, turns in written.items()
+            for _, _, messages, _, start in turns
+        ]
+        updates = {"catalog": {
+            chat_id: sum(len(messages) for _, _, messages, _, _ in turns)
+            for chat_id, turns in written.items()
+        }}
+        if feed is not None:
+            updates["turn feed"] = batches
+        if search_index is not None:
+            updates["search index"] = batches
+        if memory is not None:
+            updates["retrieval memory"] = batches
+        return updates
+
+    @staticmethod
+    def _update(stores, name, payload):
+        _, catalog, search_index, memory, feed = stores
+        if name == "catalog":
+            catalog.record_turns(payload)
+        elif name == "turn feed":
+            feed.publish(payload)
+        elif name == "search index":
+            search_index.add_many(payload)
+        else:
+            memory.add_many(payload)
+
+    def _give_up(self, key, turns, error):
+        data_dir, chat_id = key
+        path = os.path.join(data_dir, UNSAVED_FILE)
+        log.error("Chat %s could not be saved after %d attempts (%s); %d turn(s) kept in %s",
+                  chat_id, PERSIST_MAX_ATTEMPTS, error, len(turns), path)
+        try:
+            os.makedirs(data_dir, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                for _, _, messages, _, start in turns:
+                    f.write(json.dumps(
+                        {"chat_id": chat_id, "start": start, "messages": messages, "ts": round(time.time(), 3)},
+                        ensure_ascii=False,
+                    ) + "\n")
+        except (OSError, TypeError, ValueError):
+            log.exception("Keeping the unsaved turns of chat %s failed", chat_id)
+
+
+def _merge(earlier, later):
+    """Two payloads of one store update: catalog counts add up, batches are appended."""
+    if isinstance(earlier, dict):
+        merged = dict(earlier)
+        for chat_id, count in later.items():
+            merged[chat_id] = merged.get(chat_id, 0) + count
+        return merged
+    return earlier + later
+
+
+@st.cache_resource(show_spinner=False)
+def get_persist_queue(data_dir="data", avatars=None):
+    """The process-wide queue shared by all sessions; drained at exit."""
+    persist_queue = PersistQueue(data_dir, avatars=avatars)
+    atexit.register(persist_queue.close)
+    return persist_queue
@@ -0,0 +1,272 @@
+import os
+import random
+import threading
+import time
+
+import httpx
+import streamlit as st
+
+from context_window import estimate_tokens
+from gemini_client import abort_requests
+
+# ------------------------------
+# Rate limiting and retries for Gemini calls
+# ------------------------------
+# One token-bucket limiter per process, shared by every session, keeps the
+# request rate and the (estimated) token rate under the API quota:
+#
+#   GEMINI_RPM          requests per minute, 0 = unlimited     (default 0)
+#   GEMINI_TPM          tokens per minute, 0 = unlimited       (default 0)
+#   GEMINI_MAX_RETRIES  retries after a transient error        (default 4)
+#   GEMINI_RETRY_BASE   first backoff delay in seconds         (default 1)
+#   GEMINI_RETRY_MAX    longest backoff delay in seconds       (default 30)
+#
+# Transient errors (429, 5xx, network errors) are retried with jittered
+# exponential backoff. If a reply fails after part of it has been streamed,
+# the retry asks the model to continue from where it stopped instead of
+# starting over.
+
+GEMINI_RPM = float(os.environ.get("GEMINI_RPM", 0))
+GEMINI_TPM = float(os.environ.get("GEMINI_TPM", 0))
+GEMINI_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", 4))
+GEMINI_RETRY_BASE = float(os.environ.get("GEMINI_RETRY_BASE", 1.0))
+GEMINI_RETRY_MAX = float(os.environ.get("GEMINI_RETRY_MAX", 30.0))
+
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+CONTINUE_PROMPT = (
+    "Your previous answer was cut off. Continue it exactly where it stopped, "
+    "without repeating anything and without any preamble."
+)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate_per_minute`."""
+
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.clock = clock
+        self._level = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        """Take `amount` now and return how long the caller must wait first.
+
+        The bucket may go into debt, so callers queue up fairly in the order
+        they reserved.
+        """
+        with self._lock:
+            now = self.clock()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            self._level -= min(amount, self.capacity)
+            if self._level >= 0:
+                return 0.0
+            return -self._level / self.rate
+
+    def charge(self, amount):
+        """Take `amount` without waiting (for usage only known afterwards)."""
+        with self._lock:
+            self._level -= amount
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for the process."""
+
+    def __init__(self, rpm=None, tpm=None, sleep=time.sleep):
+        rpm = GEMINI_RPM if rpm is None else rpm
+        tpm = GEMINI_TPM if tpm is None else tpm
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+
+    def acquire(self, tokens=0):
+        """Block until one request with about `tokens` input tokens may go."""
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if wait > 0:
+            with self._lock:
+                self.throttled += 1
+                self.throttled_seconds += wait
+            self.sleep(wait)
+
+    def charge_tokens(self, tokens):
+        if self.tokens is not None and tokens:
+            self.tokens.charge(tokens)
+
+
+class RetryPolicy:
+    """Which errors to retry and how long to back off."""
+
+    def __init__(self, max_retries=None, base_delay=None, max_delay=None,
+                 rng=random.random):
+        self.max_retries = GEMINI_MAX_RETRIES if max_retries is None else max_retries
+        self.base_delay = GEMINI_RETRY_BASE if base_delay is None else base_delay
+        self.max_delay = GEMINI_RETRY_MAX if max_delay is None else max_delay
+        self.rng = rng
+
+    def is_transient(self, error):
+        # The SDK is imported on first use; an error means it already was
+        from google.genai import errors
+
+        if isinstance(error, errors.APIError):
+            return error.code in TRANSIENT_STATUS_CODES
+        return isinstance(error, httpx.TransportError)
+
+    def delay(self, attempt, error=None):
+        """Backoff before retry number `attempt` (1-based), full jitter."""
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return ceiling * self.rng()
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ResilientSender:
+    """Sends a chat message under the shared limiter, retrying transient errors."""
+
+    def __init__(self, client, model, limiter, policy=None, sleep=None):
+        self.client = client
+        self.model = model
+        self.limiter = limiter
+        self.policy = policy or RetryPolicy()
+        self.sleep = sleep  # called with each backoff instead of waiting (tests)
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.resumed = 0
+        self.failures = 0
+
+    def stream(self, chat, prompt, context_tokens=0, config=None):
+        """Like chat.send_message_stream(prompt), with retries.
+
+        Returns a SendStream; iterate it for the chunks and check its
+        `resumed` flag afterwards: a resumed reply is not recorded in the
+        chat's own history.
+        """
+        return SendStream(self, chat, prompt, context_tokens, config)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        return {
+            "retries": self.retries,
+            "resumed": self.resumed,
+            "failures": self.failures,
+            "throttled": self.limiter.throttled,
+            "throttled_seconds": round(self.limiter.throttled_seconds, 3),
+        }
+
+
+class SendStream:
+    """Iterator of chunks for one message, including any retries."""
+
+    def __init__(self, sender, chat, prompt, context_tokens, config):
+        self.sender = sender
+        self.chat = chat
+        self.prompt = prompt
+        self.context_tokens = context_tokens
+        self.config = config
+        self.resumed = False
+        self.attempts = 0
+        self._cancelled = threading.Event()
+        self._received = []
+        self._current = None
+        self._thread = None
+
+    def __iter__(self):
+        sender = self.sender
+        input_tokens = self.context_tokens + estimate_tokens(self.prompt)
+        self._thread = threading.get_ident()
+        while not self.cancelled:
+            self.attempts += 1
+            sender.limiter.acquire(input_tokens)
+            try:
+                self._current = self._open()
+                for chunk in self._current:
+                    self._received.append(chunk.text or "")
+                    yield chunk
+                sender.limiter.charge_tokens(estimate_tokens("".join(self._received)))
+                return
+            except Exception as e:
+                retry = self.attempts - 1
+                if self.cancelled:
+                    raise
+                if retry >= sender.policy.max_retries or not sender.policy.is_transient(e):
+                    sender._count("failures")
+                    raise
+                sender._count("retries")
+                delay = sender.policy.delay(retry + 1, e)
+                if sender.sleep is not None:
+                    sender.sleep(delay)
+                elif self._cancelled.wait(delay):
+                    raise  # cancelled while backing off
+            finally:
+                self.close_current()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Stop the reply from another thread: the response being read is cut
+        (see gemini_client.abort_requests), a backoff ends at once and
+        nothing is retried."""
+        self._cancelled.set()
+        if self._thread is not None:
+            abort_requests(self._thread)
+
+    def close(self):
+        self.close_current()
+
+    def close_current(self):
+        close = getattr(self._current, "close", None)
+        self._current = None
+        if close is not None:
+            close()
+
+    def _open(self):
+        if not "".join(self._received):
+            return self.chat.send_message_stream(self.prompt, config=self.config)
+
+        # Part of the reply already reached the user: ask for the rest
+        if not self.resumed:
+            self.resumed = True
+            self.sender._count("resumed")
+        partial = "".join(self._received)
+        from google.genai import types
+
+        contents = self.chat.get_history() + [
+            types.Content(role="user", parts=[types.Part(text=self.prompt)]),
+            types.Content(role="model", parts=[types.Part(text=partial)]),
+            types.Content(role="user", parts=[types.Part(text=CONTINUE_PROMPT)]),
+        ]
+        return self.sender.client.models.generate_content_stream(
+            model=self.sender.model, contents=contents, config=self.config
+        )
+
+
+@st.cache_resource(show_spinner=False)
+def get_sender(_client, model):
+    """The process-wide sender (and limiter) shared by all sessions."""
+    return ResilientSender(_client, model, RateLimiter())
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+# ------------------------------
+# Response cache
+# ------------------------------
+# Optional cache in front of send_message_stream (RESPONSE_CACHE=1). A reply
+# is keyed by model name, normalized prompt and a hash of the context that
+# is sent with it, so the same opening question asked in many new chats is
+# answered once. Two tiers, both with TTL and size limits:
+#
+#   memory  LRU of RESPONSE_CACHE_MEMORY_ENTRIES replies  (default 256)
+#   disk    data/response_cache, RESPONSE_CACHE_DISK_ENTRIES (default 5000)
+#
+# Entries expire after RESPONSE_CACHE_TTL seconds (default 86400).
+
+RESPONSE_CACHE = os.environ.get("RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_MEMORY_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MEMORY_ENTRIES", 256))
+RESPONSE_CACHE_DISK_ENTRIES = int(os.environ.get("RESPONSE_CACHE_DISK_ENTRIES", 5000))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 86400))
+
+
+def normalize_prompt(prompt):
+    return " ".join(prompt.split()).casefold()
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + disk) cache of model replies."""
+
+    def __init__(self, data_dir="data", memory_entries=None, disk_entries=None,
+                 ttl=None):
+        self.dir = os.path.join(data_dir, "response_cache")
+        os.makedirs(self.dir, exist_ok=True)
+        self.memory_entries = RESPONSE_CACHE_MEMORY_ENTRIES if memory_entries is None else memory_entries
+        self.disk_entries = RESPONSE_CACHE_DISK_ENTRIES if disk_entries is None else disk_entries
+        self.ttl = RESPONSE_CACHE_TTL if ttl is None else ttl
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (created_at, text)
+        self._disk_count = len(self._disk_files())
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, model, prompt, history=(), config=None):
+        """Cache key for a prompt sent with the given context."""
+        context = [c.model_dump(mode="json", exclude_none=True) for c in history]
+        if config is not None:
+            context.append(config.model_dump(mode="json", exclude_none=True))
+        context_hash = hashlib.sha256(
+            json.dumps(context, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        raw = "\0".join([model, normalize_prompt(prompt), context_hash])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached reply text, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits_memory += 1
+                    return entry[1]
+                del self._memory[key]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None or now - entry[0] >= self.ttl:
+                self.misses += 1
+                return None
+            self.hits_disk += 1
+            self._remember(key, entry)
+        return entry[1]
+
+    def put(self, key, text):
+        """Cache a reply; empty and whitespace-only replies are not kept."""
+        if not text or not text.strip():
+            return
+        entry = (time.time(), text)
+        with self._lock:
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def stats(self):
+        hits = self.hits_memory + self.hits_disk
+        total = hits + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": self._disk_count,
+            "evictions": self.evictions,
+        }
+
+    # ------------------------------
+    # Memory tier
+    # ------------------------------
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    # ------------------------------
+    # Disk tier
+    # ------------------------------
+    def _path(self, key):
+        return os.path.join(self.dir, key[:2], key + ".json")
+
+    def _disk_files(self):
+        files = []
+        for root, _, names in os.walk(self.dir):
+            files.extend(os.path.join(root, n) for n in names if n.endswith(".json"))
+        return files
+
+    def _read_disk(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                data = json.load(f)
+            return data["created_at"], data["text"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_disk(self, key, entry):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        existed = os.path.exists(path)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created_at": entry[0], "text": entry[1]}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if not existed:
+                self._disk_count += 1
+            over_limit = self._disk_count > self.disk_entries
+        if over_limit:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        # Drop expired entries, then the oldest ones down to 90% of the limit
+        files = []
+        now = time.time()
+        for path in self._disk_files():
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        files.sort()
+        keep = int(self.disk_entries * 0.9)
+        removed = 0
+        for i, (mtime, path) in enumerate(files):
+            if now - mtime < self.ttl and len(files) - i <= keep:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_count = max(len(files) - removed, 0)
+            self.evictions += removed
+
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache(data_dir="data"):
+    """Process-wide response cache, or None when RESPONSE_CACHE is off."""
+    if not RESPONSE_CACHE:
+        return None
+    return ResponseCache(data_dir)
+
+
+def turn_contents(prompt, reply):
+    """Gemini history entries for a turn answered from the cache."""
+    # The SDK may not be loaded yet when a cached reply is the session's first
+    from google.genai import types
+
+    return [
+        types.Content(role="user", parts=[types.Part(text=prompt)]),
+        types.Content(role="model", parts=[types.Part(text=reply)]),
+    ]
@@ -0,0 +1,426 @@
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+
+import streamlit as st
+
+from chat_store import FileLock
+from storage_backend import TurnFeed, open_catalog, open_transcripts, turn_feed
+from user_storage import USER_NAMESPACES, USER_OPEN_STORES
+
+# ------------------------------
+# Retrieval memory over past chats
+# ------------------------------
+# Optional (RETRIEVAL_MEMORY=1). Every saved message is split into passages
+# of about RETRIEVAL_CHUNK_CHARS characters, and each passage is turned into
+# a hashed bag-of-words vector (its words hashed into RETRIEVAL_DIMENSIONS
+# buckets: CPU only, no model to download). Vectors are appended to
+# data/memory/ when a turn is saved, so the index is never rebuilt. Before a
+# message is sent, the passages of every chat most similar to the prompt
+# (TF-IDF cosine similarity, with word rarity taken from the whole index at
+# lookup time) are passed as system instruction, so relevant history reaches
+# the model without sending whole chats. Use it with CONTEXT_POLICY sliding
+# or budget to keep prompts short.
+#
+#   RETRIEVAL_MEMORY       1 to enable                           (default off)
+#   RETRIEVAL_TOP_K        passages sent with a message          (default 4)
+#   RETRIEVAL_MIN_SCORE    similarity a passage needs to be sent (default 0.15)
+#   RETRIEVAL_CHUNK_CHARS  passage length                        (default 600)
+#   RETRIEVAL_DIMENSIONS   vector size of a new index            (default 1024)
+#   RETRIEVAL_MEMORY_SHARED  1 to allow it without USER_NAMESPACES (default off)
+#
+# Files in memory/ of the data directory:
+#
+#   index.json     vector size; written once every existing chat is indexed
+#   vectors.f16    one float16 row per passage, appended
+#   entries.jsonl  row number, chat ID, message position, role and text
+#   feed.json      last turn feed entry added (STORAGE_BACKEND=redis)
+#
+# Writers append under a file lock, entries before vectors, so a row is
+# only used once both are complete; every process reads only the rows
+# added since its last lookup. Passages of the chat being answered that
+# are sent anyway (inside its context window) are never picked. With
+# STORAGE_BACKEND=redis each host keeps its own memory, and a lookup first
+# adds the turns saved on any replica from the turn feed (see storage_backend.py).
+#
+# A memory holds the chats of one data directory. With USER_NAMESPACES=1
+# that is one user's. Without it, data/ holds every visitor's chats, and a
+# reply can quote any of them. That is fine where they are listed to every
+# visitor anyway (one user, or a team sharing the app), but it has to be
+# asked for: RETRIEVAL_MEMORY=1 without USER_NAMESPACES=1 needs
+# RETRIEVAL_MEMORY_SHARED=1, otherwise it is refused with a warning and the
+# memory stays off. numpy (requirements-optional.txt) is imported by the
+# first memory opened; with the memory off the app never loads it.
+
+RETRIEVAL_MEMORY = os.environ.get("RETRIEVAL_MEMORY", "0") == "1"
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", 4))
+RETRIEVAL_MIN_SCORE = float(os.environ.get("RETRIEVAL_MIN_SCORE", 0.15))
+RETRIEVAL_CHUNK_CHARS = int(os.environ.get("RETRIEVAL_CHUNK_CHARS", 600))
+RETRIEVAL_DIMENSIONS = int(os.environ.get("RETRIEVAL_DIMENSIONS", 1024))
+RETRIEVAL_MEMORY_SHARED = os.environ.get("RETRIEVAL_MEMORY_SHARED", "0") == "1"
+
+log = logging.getLogger("chat.memory")
+
+if RETRIEVAL_MEMORY and not USER_NAMESPACES and not RETRIEVAL_MEMORY_SHARED:
+    log.warning("RETRIEVAL_MEMORY=1 needs USER_NAMESPACES=1, or RETRIEVAL_MEMORY_SHARED=1 for "
+                "one memory of every chat in data/; the retrieval memory is off")
+    RETRIEVAL_MEMORY = False
+
+DATA_DIR = "data"
+INDEX_VERSION = 1
+SCORE_BLOCK_ROWS = 16384  # rows weighted at a time, to bound temporary arrays
+IDF_REFRESH_GROWTH = 1.25  # word rarity is recomputed when the index grows by this much
+
+_WORD = re.compile(r"\w\w+")
+
+
+@functools.lru_cache(maxsize=65536)
+def _word_hash(word):
+    # Accents are dropped, so "Šibenik" and "sibenik" are the same word
+    if not word.isascii():
+        word = "".join(c for c in unicodedata.normalize("NFKD", word) if not unicodedata.combining(c))
+    return zlib.crc32(word.encode("utf-8"))
+
+
+def embed(text, dimensions):
+    """Unit vector of the hashed words of `text` (zero if it has none)."""
+    import numpy as np
+
+    vector = np.zeros(dimensions, dtype=np.float32)
+    found = _WORD.findall(text.casefold())
+    if not found:
+        return vector
+    hashes = np.fromiter(map(_word_hash, found), dtype=np.uint32, count=len(found))
+    signs = np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32)
+    np.add.at(vector, hashes % dimensions, signs)
+    # Repeated words count less than distinct ones
+    vector = np.sign(vector) * np.log1p(np.abs(vector))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def chunks(text, size):
+    """`text` with collapsed whitespace, cut into passages of about `size` characters."""
+    text = " ".join(text.split())
+    passages = []
+    while len(text) > size:
+        cut = text.rfind(" ", size // 2, size)
+        cut = size if cut < 0 else cut
+        passages.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text:
+        passages.append(text)
+    return passages
+
+
+class RetrievalMemory:
+    """Vector index of every saved message, stored in data/memory/."""
+
+    def __init__(self, data_dir=DATA_DIR, top_k=None, min_score=None, chunk_chars=None,
+                 dimensions=None):
+        import numpy as np
+
+        self.data_dir = data_dir
+        self.dir = os.path.join(data_dir, "memory")
+        os.makedirs(self.dir, exist_ok=True)
+        self.top_k = RETRIEVAL_TOP_K if top_k is None else top_k
+        self.min_score = RETRIEVAL_MIN_SCORE if min_score is None else min_score
+        self.chunk_chars = RETRIEVAL_CHUNK_CHARS if chunk_chars is None else chunk_chars
+        self.index_path = os.path.join(self.dir, "index.json")
+        self.vectors_path = os.path.join(self.dir, "vectors.f16")
+        self.entries_path = os.path.join(self.dir, "entries.jsonl")
+        self.feed_path = os.path.join(self.dir, "feed.json")
+        self._file_lock = FileLock(os.path.join(self.dir, "write.lock"))
+        self.feed = turn_feed(data_dir)
+
+        self.dimensions = self._index_existing(RETRIEVAL_DIMENSIONS if dimensions is None else dimensions)
+        self._row_bytes = self.dimensions * 2
+
+        # Rows read so far (loaded lazily, on the first lookup)
+        self._lock = threading.RLock()
+        self._vectors = np.zeros((0, self.dimensions), dtype=np.float32)
+        self._rows = 0
+        self._entries = []
+        self._entries_offset = 0
+        self._document_frequency = np.zeros(self.dimensions, dtype=np.int64)
+        # Word rarity and, per row, 1 / length of the row weighted by it
+        self._idf = None
+        self._idf_rows = 0
+        self._inverse_norms = np.zeros(0, dtype=np.float32)
+        self._weighted_rows = 0
+        self._counters = dict(lookups=0, recalled=0)
+        self._lookup_seconds = 0.0
+        self._feed_cursor = self._read_cursor() if self.feed is not None else None
+
+    # ------------------------------
+    # Indexing
+    # ------------------------------
+    def add_messages(self, chat_id, start, messages):
+        """Index `messages`, the first of which is message number `start`."""
+        self.add_many([(chat_id, start, messages)])
+
+    def add_many(self, batches):
+        """add_messages for [(chat_id, start, messages), ...] in one append."""
+        passages, vectors = self._embed(batches, self.dimensions)
+        if passages:
+            with self._file_lock:
+                self._append(passages, vectors)
+
+    def _embed(self, batches, dimensions):
+        """(passages, their vectors) of [(chat_id, start, messages), ...]."""
+        passages = [
+            (chat_id, start + i, message.get("role"), passage)
+            for chat_id, start, messages in batches
+            for i, message in enumerate(messages)
+            for passage in chunks(message.get("content") or "", self.chunk_chars)
+        ]
+        if not passages:
+            return [], None
+        import numpy as np
+
+        return passages, np.stack([embed(passage, dimensions) for *_, passage in passages])
+
+    def _append(self, passages, vectors):
+        # Called under the file lock. A writer killed half way may have left
+        # a torn vector row (cut off here) or entries without vectors (their
+        # rows are numbered again below, and readers keep the last entry).
+        with open(self.vectors_path, "ab") as f:
+            size = f.tell()
+            first_row = size // self._row_bytes
+            if size % self._row_bytes:
+                f.truncate(first_row * self._row_bytes)
+        lines = []
+        if os.path.exists(self.entries_path) and os.path.getsize(self.entries_path):
+            with open(self.entries_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    lines.append("")  # ends the torn line, which readers skip
+        for row, (chat_id, position, role, passage) in enumerate(passages, first_row):
+            lines.append(json.dumps(
+                {"row": row, "chat_id": chat_id, "position": position, "role": role, "text": passage},
+                ensure_ascii=False,
+            ))
+        with open(self.entries_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.vectors_path, "ab") as f:
+            f.write(vectors.astype("float16").tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    # ------------------------------
+    # Lookup
+    # ------------------------------
+    def search(self, query, limit=None, exclude=None):
+        """Passages most similar to `query`: [(score, entry), ...], best first.
+
+        `exclude` is (chat_id, position): passages of that chat from that
+        message on are skipped.
+        """
+        import numpy as np
+
+        limit = self.top_k if limit is None else limit
+        query_vector = embed(query, self.dimensions)
+        if limit <= 0 or not query_vector.any():
+            return []
+        if self.feed is not None:
+            self._catch_up()
+        with self._lock:
+            self._refresh()
+            if not self._rows:
+                return []
+            self._weigh()
+            weighted = query_vector * self._idf
+            norm = np.linalg.norm(weighted)
+            if not norm:
+                return []
+            weighted *= self._idf / norm
+            scores = (self._vectors[:self._rows] @ weighted) * self._inverse_norms[:self._rows]
+            # A few more candidates than needed, for the excluded ones
+            candidates = min(limit * 4 + 16, self._rows)
+            candidates = np.argpartition(-scores, candidates - 1)[:candidates]
+            candidates = candidates[np.argsort(-scores[candidates])]
+            results = []
+            for row in candidates:
+                if scores[row] < self.min_score:
+                    break
+                entry = self._entries[row]
+                if exclude is not None and entry["chat_id"] == exclude[0] and entry["position"] >= exclude[1]:
+                    continue
+                results.append((float(scores[row]), entry))
+                if len(results) == limit:
+                    break
+        return results
+
+    def recall(self, prompt, exclude=None):
+        """System instruction text with the passages relevant to `prompt`, or None."""
+        started = time.perf_counter()
+        results = self.search(prompt, exclude=exclude)
+        with self._lock:
+            self._counters["lookups"] += 1
+            self._counters["recalled"] += len(results)
+            self._lookup_seconds += time.perf_counter() - started
+        if not results:
+            return None
+        lines = []
+        for _, entry in results:
+            speaker = "User" if entry["role"] == "user" else "Assistant"
+            lines.append(f"- {speaker}: {entry['text']}")
+        return "Relevant messages from earlier conversations:\n" + "\n".join(lines)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["lookups"]
+            return dict(
+                self._counters,
+                passages=self._rows,
+                dimensions=self.dimensions,
+                resident_bytes=self._vectors.nbytes,
+                avg_lookup_ms=round(self._lookup_seconds * 1000 / lookups, 2) if lookups else None,
+            )
+
+    def _weigh(self):
+        # Words found in most passages say little about what is asked. Their
+        # weights are recomputed once the index has grown by a quarter; rows
+        # added in between are weighted with the current ones.
+        import numpy as np
+
+        if self._idf is None or self._rows > self._idf_rows * IDF_REFRESH_GROWTH:
+            self._idf = np.log((1 + self._rows) / (1 + self._document_frequency)).astype(np.float32)
+            self._idf_rows = self._rows
+            self._weighted_rows = 0
+        squared_idf = self._idf * self._idf
+        for i in range(self._weighted_rows, self._rows, SCORE_BLOCK_ROWS):
+            block = self._vectors[i:min(i + SCORE_BLOCK_ROWS, self._rows)]
+            norms = np.sqrt(np.square(block) @ squared_idf)
+            self._inverse_norms[i:i + len(block)] = 1 / np.maximum(norms, 1e-12)
+        self._weighted_rows = self._rows
+
+    def _refresh(self):
+        # Read the entries and vectors appended since the last lookup
+        try:
+            size = os.path.getsize(self.entries_path)
+        except FileNotFoundError:
+            return
+        if size > self._entries_offset:
+            with open(self.entries_path, "rb") as f:
+                f.seek(self._entries_offset)
+                data = f.read(size - self._entries_offset)
+            data = data[:data.rfind(b"\n") + 1]  # a line still being written waits
+            self._entries_offset += len(data)
+            for line in data.splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn by a killed writer
+                row = entry.pop("row")
+                if row < len(self._entries):
+                    self._entries[row] = entry
+                elif row == len(self._entries):
+                    self._entries.append(entry)
+
+        available = min(len(self._entries), os.path.getsize(self.vectors_path) // self._row_bytes)
+        if available <= self._rows:
+            return
+        import numpy as np
+
+        new = np.fromfile(
+            self.vectors_path, dtype=np.float16,
+            count=(available - self._rows) * self.dimensions,
+            offset=self._rows * self._row_bytes,
+        ).reshape(-1, self.dimensions)
+        if available > len(self._vectors):
+            grown = np.zeros((max(available, 2 * len(self._vectors)), self.dimensions), dtype=np.float32)
+            grown[:self._rows] = self._vectors[:self._rows]
+            self._vectors = grown
+            self._inverse_norms = np.resize(self._inverse_norms, len(grown))
+        self._vectors[self._rows:available] = new
+        self._document_frequency += np.count_nonzero(new, axis=0)
+        self._rows = available
+
+    # ------------------------------
+    # Turns saved on other replicas (STORAGE_BACKEND=redis)
+    # ------------------------------
+    def _read_cursor(self):
+        try:
+            with open(self.feed_path, encoding="utf-8") as f:
+                return json.load(f)["cursor"]
+        except FileNotFoundError:
+            return TurnFeed.START
+
+    def _write_cursor(self, cursor):
+        tmp_path = f"{self.feed_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"cursor": cursor}, f)
+        os.replace(tmp_path, self.feed_path)
+
+    def _catch_up(self):
+        # Nothing new since this process last looked: one round trip, no lock
+        if self.feed.read(self._feed_cursor, count=1)[0] == self._feed_cursor:
+            return
+        with self._file_lock:
+            # Other processes of this host may have added some of them
+            cursor = self._read_cursor()
+            while True:
+                new_cursor, batches = self.feed.read(cursor)
+                if new_cursor == cursor:
+                    break
+                passages, vectors = self._embed(batches, self.dimensions)
+                if passages:
+                    self._append(passages, vectors)
+                self._write_cursor(new_cursor)
+                cursor = new_cursor
+        self._feed_cursor = cursor
+
+    # ------------------------------
+    # One-time indexing of the chats saved before the index existed
+    # ------------------------------
+    def _index_existing(self, dimensions):
+        """The index's vector size; indexes every saved chat if it is new."""
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                return json.load(f)["dimensions"]
+        with self._file_lock:
+            # The lock is held by a process building the index; if it got that
+            # far, its index is used as it is
+            if os.path.exists(self.index_path):
+                with open(self.index_path, encoding="utf-8") as f:
+                    return json.load(f)["dimensions"]
+            self.dimensions, self._row_bytes = dimensions, dimensions * 2
+            # Left by an interrupted run, if any
+            for path in (self.vectors_path, self.entries_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            # Turns saved after this point are read from the feed
+            if self.feed is not None:
+                self._write_cursor(self.feed.last_id())
+            catalog = open_catalog(self.data_dir)
+            transcripts = open_transcripts(self.data_dir)
+            for chat_id, _ in catalog.recent(catalog.count()):
+                try:
+                    messages, _ = transcripts.load(chat_id)
+                except Exception:
+                    continue  # unreadable chats are skipped, not fatal
+                passages, vectors = self._embed([(chat_id, 0, messages)], dimensions)
+                if passages:
+                    self._append(passages, vectors)
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "dimensions": dimensions}, f)
+            os.replace(tmp_path, self.index_path)
+        return dimensions
+
+
+@st.cache_resource(show_spinner=False, max_entries=USER_OPEN_STORES)
+def get_retrieval_memory(data_dir=DATA_DIR):
+    """Retrieval memory of `data_dir` shared by the process, or None when RETRIEVAL_MEMORY is off."""
+    if not RETRIEVAL_MEMORY:
+        return None
+    return RetrievalMemory(data_dir)
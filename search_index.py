@@ -0,0 +1,212 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+from chat_catalog import SQLITE_BUSY_TIMEOUT
+from chat_store import CorruptChatError
+from storage_backend import TurnFeed, open_catalog, open_transcripts, turn_feed
+from user_storage import USER_OPEN_STORES
+
+# ------------------------------
+# Full-text search over all chats (SQLite FTS5)
+# ------------------------------
+# Every saved message is added to "data/search.db" when its turn is saved,
+# so the index is never rebuilt. A search returns the best matching
+# messages (BM25 ranking) with their chat ID and position in the chat.
+# Chats that existed before the index are indexed once when it is created.
+# A message is indexed once per chat ID, position and text: adding it
+# again, for example a turn saved while the existing chats were being
+# indexed, does nothing. (Two sessions or replicas writing to one chat at
+# once can give different messages the same position; both are kept.)
+#
+#   SEARCH_MAX_CANDIDATES  newest matches ranked per search (default 2000)
+#
+# Ranking every match of a word that appears in most messages would cost
+# time proportional to the whole index, so only the newest
+# SEARCH_MAX_CANDIDATES matches are ranked; rarer words are ranked in full.
+#
+# With STORAGE_BACKEND=redis the index is kept by each host and filled from
+# the turn feed (see storage_backend.py): a search first adds the turns
+# saved on any replica since the last one.
+
+DATA_DIR = "data"
+SEARCH_MAX_CANDIDATES = int(os.environ.get("SEARCH_MAX_CANDIDATES", 2000))
+
+# 1: existing chats indexed; 2: what identifies each indexed message kept
+INDEX_VERSION = 2
+
+_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+    text,
+    chat_id UNINDEXED,
+    position UNINDEXED,
+    role UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS indexed (
+    chat_id  TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    digest   BLOB NOT NULL,
+    PRIMARY KEY (chat_id, position, digest)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS feed (
+    id     INTEGER PRIMARY KEY CHECK (id = 0),
+    cursor TEXT NOT NULL
+);
+"""
+
+
+def match_expression(query):
+    """FTS5 query matching every word of `query`, the last one as a prefix."""
+    words = [w.replace('"', '""') for w in query.split()]
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"  # results while the last word is still being typed
+    return " ".join(terms)
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+
+class SearchIndex:
+    """Incremental full-text index of the messages of every chat."""
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.path = os.path.join(self.data_dir, "search.db")
+        # One connection shared by every session of the process, used under a lock
+        self._conn = sqlite3.connect(
+            self.path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False
+        )
+        self._lock = threading.RLock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self.feed = turn_feed(data_dir)
+        self._index_existing()
+
+    def add_messages(self, chat_id, start, messages):
+        """Index `messages`, the first of which is message number `start`."""
+        self.add_many([(chat_id, start, messages)])
+
+    def add_many(self, batches):
+        """add_messages for [(chat_id, start, messages), ...] in one transaction."""
+        with self._lock, self._conn:
+            for chat_id, start, messages in batches:
+                self._insert(chat_id, start, messages)
+
+    def _insert(self, chat_id, start, messages):
+        for position, message in enumerate(messages, start):
+            if not message.get("content"):
+                continue
+            added = self._conn.execute(
+                "INSERT OR IGNORE INTO indexed VALUES (?, ?, ?)",
+                (chat_id, position, _digest(message["content"])),
+            ).rowcount
+            if added:
+                self._conn.execute(
+                    "INSERT INTO messages (text, chat_id, position, role) VALUES (?, ?, ?, ?)",
+                    (message["content"], chat_id, position, message.get("role")),
+                )
+
+    def search(self, query, limit=10):
+        """Best matches first: [(chat_id, position, role, snippet), ...]."""
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        if self.feed is not None:
+            self._catch_up()
+        with self._lock:
+            oldest = self._conn.execute(
+                "SELECT MIN(rowid) FROM (SELECT rowid FROM messages WHERE messages MATCH ? "
+                "ORDER BY rowid DESC LIMIT ?)",
+                (expression, SEARCH_MAX_CANDIDATES),
+            ).fetchone()[0]
+            if oldest is None:
+                return []
+            rows = self._conn.execute(
+                "SELECT chat_id, position, role, "
+                "snippet(messages, 0, '**', '**', '…', 12) "
+                "FROM messages WHERE messages MATCH ? AND rowid >= ? ORDER BY rank LIMIT ?",
+                (expression, oldest, limit),
+            ).fetchall()
+        return [(chat_id, int(position), role, snippet) for chat_id, position, role, snippet in rows]
+
+    def timed_search(self, query, limit=10):
+        """(results, milliseconds) for the sidebar."""
+        started = time.perf_counter()
+        results = self.search(query, limit)
+        return results, (time.perf_counter() - started) * 1000
+
+    # ------------------------------
+    # Turns saved on other replicas (STORAGE_BACKEND=redis)
+    # ------------------------------
+    def _cursor(self):
+        row = self._conn.execute("SELECT cursor FROM feed").fetchone()
+        return row[0] if row else TurnFeed.START
+
+    def _catch_up(self):
+        with self._lock:
+            while True:
+                cursor = self._cursor()
+                new_cursor, batches = self.feed.read(cursor)
+                if new_cursor == cursor:
+                    return
+                with self._conn:
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    # Another process of this host may have added them meanwhile
+                    if self._cursor() != cursor:
+                        continue
+                    for chat_id, start, messages in batches:
+                        self._insert(chat_id, start, messages)
+                    self._conn.execute("INSERT OR REPLACE INTO feed VALUES (0, ?)", (new_cursor,))
+
+    # ------------------------------
+    # One-time indexing of the chats saved before the index existed
+    # ------------------------------
+    def _index_existing(self):
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] >= INDEX_VERSION:
+            return
+        with self._conn:
+            # Waits for an indexing run in another process; user_version then says
+            # whether it got to the end
+            self._conn.execute("BEGIN IMMEDIATE")
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= INDEX_VERSION:
+                return
+            if version == 1:
+                # Indexed before the messages were identified: those indexed twice are dropped
+                rows = self._conn.execute("SELECT rowid, chat_id, position, text FROM messages").fetchall()
+                for rowid, chat_id, position, text in rows:
+                    if not self._conn.execute(
+                        "INSERT OR IGNORE INTO indexed VALUES (?, ?, ?)", (chat_id, position, _digest(text))
+                    ).rowcount:
+                        self._conn.execute("DELETE FROM messages WHERE rowid = ?", (rowid,))
+                self._conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+                return
+            # Turns saved after this point are read from the feed
+            if self.feed is not None:
+                self._conn.execute("INSERT OR REPLACE INTO feed VALUES (0, ?)", (self.feed.last_id(),))
+            catalog = open_catalog(self.data_dir)
+            transcripts = open_transcripts(self.data_dir)
+            for chat_id, _ in catalog.recent(catalog.count()):
+                try:
+                    messages, _ = transcripts.load(chat_id)
+                except CorruptChatError as e:
+                    messages = e.messages  # what was left once the damaged frames were dropped
+                except Exception:
+                    continue  # unreadable chats are skipped, not fatal
+                self._insert(chat_id, 0, messages)
+            self._conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+
+
+@st.cache_resource(show_spinner=False, max_entries=USER_OPEN_STORES)
+def get_search_index(data_dir=DATA_DIR):
+    """The search index of `data_dir`, shared by all sessions of the process."""
+    return SearchIndex(data_dir)
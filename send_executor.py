@@ -0,0 +1,182 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+# ------------------------------
+# Gemini send executor
+# ------------------------------
+# Streaming requests run on a process-wide worker pool instead of the
+# Streamlit script thread. Chunks are handed back through a queue, so the
+# script thread only waits (with a timeout) and can abandon a request at any
+# time. The pool is bounded so concurrency stays within the API quota:
+#
+#   GEMINI_WORKERS          requests streaming at the same time  (default 8)
+#   GEMINI_QUEUE_DEPTH      requests allowed to wait for a worker (default 32)
+#   GEMINI_CHUNK_TIMEOUT    max seconds to wait for the next chunk (default 60)
+#   GEMINI_REQUEST_TIMEOUT  max seconds for a whole reply          (default 300)
+
+GEMINI_WORKERS = int(os.environ.get("GEMINI_WORKERS", 8))
+GEMINI_QUEUE_DEPTH = int(os.environ.get("GEMINI_QUEUE_DEPTH", 32))
+GEMINI_CHUNK_TIMEOUT = float(os.environ.get("GEMINI_CHUNK_TIMEOUT", 60))
+GEMINI_REQUEST_TIMEOUT = float(os.environ.get("GEMINI_REQUEST_TIMEOUT", 300))
+
+
+class QueueFull(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class RequestTimeout(Exception):
+    """Raised when a reply stalls or takes longer than allowed."""
+
+
+class RequestCancelled(Exception):
+    """Raised when reading from a request that has been cancelled."""
+
+
+_CHUNK, _DONE, _ERROR = "chunk", "done", "error"
+
+
+class StreamRequest:
+    """Handle to one streaming request running on the executor."""
+
+    def __init__(self, executor, on_cancel=None):
+        self._executor = executor
+        self._on_cancel = on_cancel
+        self._queue = queue.Queue()
+        self._cancelled = threading.Event()
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished = False
+
+    def cancel(self):
+        """Ask the worker to stop.
+
+        The worker checks between chunks; `on_cancel` (given to submit) is
+        called as well, to interrupt a read that is waiting for upstream.
+        """
+        if not self.finished and not self._cancelled.is_set():
+            self._cancelled.set()
+            self._executor._count("cancelled")
+            if self._on_cancel is not None:
+                self._on_cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def chunks(self, chunk_timeout=None, request_timeout=None):
+        """Yield the text of each streamed chunk as it arrives."""
+        chunk_timeout = GEMINI_CHUNK_TIMEOUT if chunk_timeout is None else chunk_timeout
+        request_timeout = GEMINI_REQUEST_TIMEOUT if request_timeout is None else request_timeout
+        deadline = self.submitted_at + request_timeout
+        completed = False
+        try:
+            while True:
+                if self.cancelled:
+                    raise RequestCancelled("Request cancelled")
+                wait = min(chunk_timeout, deadline - time.monotonic())
+                if wait <= 0:
+                    raise self._timeout()
+                try:
+                    kind, value = self._queue.get(timeout=wait)
+                except queue.Empty:
+                    raise self._timeout() from None
+                if kind == _CHUNK:
+                    yield value
+                    continue
+                completed = True
+                if kind == _ERROR:
+                    raise value
+                return
+        finally:
+            # Stop the worker if the reader goes away early (timeout, rerun)
+            if not completed:
+                self.cancel()
+
+    def _timeout(self):
+        self.cancel()
+        self._executor._count("timeouts")
+        return RequestTimeout("No response from Gemini within the time limit")
+
+    # Runs on a worker thread
+    def _run(self, send, args, kwargs):
+        self.started_at = time.monotonic()
+        response = None
+        try:
+            if self.cancelled:
+                return
+            response = send(*args, **kwargs)
+            for chunk in response:
+                if self.cancelled:
+                    return
+                self._queue.put((_CHUNK, chunk.text))
+            self._queue.put((_DONE, None))
+        except Exception as e:
+            self._queue.put((_ERROR, e))
+        finally:
+            self.finished = True
+            close = getattr(response, "close", None)
+            if close is not None:
+                close()
+
+
+class SendExecutor:
+    """Bounded thread pool for streaming Gemini requests."""
+
+    def __init__(self, workers=None, queue_depth=None):
+        self.workers = GEMINI_WORKERS if workers is None else workers
+        self.queue_depth = GEMINI_QUEUE_DEPTH if queue_depth is None else queue_depth
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="gemini-send"
+        )
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_depth)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._counters = dict(submitted=0, rejected=0, timeouts=0, cancelled=0)
+
+    def submit(self, send, *args, on_cancel=None, **kwargs):
+        """Run `send(*args, **kwargs)` (a chunk iterator) on the pool.
+
+        `on_cancel` is called from the thread that cancels the request.
+        """
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise QueueFull("Too many requests in progress, please try again shortly")
+        with self._lock:
+            self._in_use += 1
+            self._counters["submitted"] += 1
+
+        request = StreamRequest(self, on_cancel)
+        future = self._pool.submit(request._run, send, args, kwargs)
+        future.add_done_callback(self._release)
+        return request
+
+    def stats(self):
+        with self._lock:
+            running = min(self._in_use, self.workers)
+            return dict(
+                self._counters,
+                running=running,
+                queued=self._in_use - running,
+                workers=self.workers,
+                queue_depth=self.queue_depth,
+            )
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+
+@st.cache_resource(show_spinner=False)
+def get_send_executor():
+    """The process-wide executor shared by all sessions."""
+    return SendExecutor()
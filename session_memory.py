@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+
+import streamlit as st
+
+from chat_registry import ChatRegistry, history_bytes
+
+# ------------------------------
+# Session memory
+# ------------------------------
+# Every browser session holds its chat's messages, the Gemini history and
+# its live chat objects (see chat_registry.py). To keep memory bounded by
+# the number of sessions rather than by users times chat length:
+#
+#   - a session keeps only its newest turns, up to SESSION_MAX_BYTES of
+#     text; older turns stay on disk and are read back when the user asks
+#     for earlier messages. The Gemini history is only cut where it is not
+#     sent anyway (CONTEXT_POLICY sliding or budget), so replies are the
+#     same as with the whole chat in memory.
+#   - a process-wide sweeper releases the messages, history and live chats
+#     of sessions that have been idle for SESSION_IDLE_SECONDS; such a
+#     session reloads its chat from disk on its next run.
+#
+#   SESSION_MAX_BYTES       text kept per session (default 4 MB)
+#   SESSION_IDLE_SECONDS    idle time before a session is released (default 1800)
+#   SESSION_SWEEP_INTERVAL  seconds between sweeps (default 60)
+#
+# Sizes are UTF-8 bytes of message text, the same estimate the live chat
+# registry uses; Python objects around the text are not counted.
+
+SESSION_MAX_BYTES = int(os.environ.get("SESSION_MAX_BYTES", 4 * 1024 * 1024))
+SESSION_IDLE_SECONDS = float(os.environ.get("SESSION_IDLE_SECONDS", 1800))
+SESSION_SWEEP_INTERVAL = float(os.environ.get("SESSION_SWEEP_INTERVAL", 60))
+
+# Policies that never send the oldest turns, so they need not be in memory
+HISTORY_TRIM_POLICIES = ("sliding", "budget")
+
+
+def messages_bytes(messages):
+    return sum(len(m.get("content", "").encode("utf-8")) for m in messages)
+
+
+def trim_start(sizes, max_bytes, limit, is_start):
+    """How many leading items to drop so the rest fits in `max_bytes`.
+
+    At most `limit` items are dropped (never all of them), and only up to an
+    item for which is_start(i) holds, so whole turns are dropped.
+    """
+    used = sum(sizes)
+    if used <= max_bytes:
+        return 0
+    cut = 0
+    for i in range(1, min(limit, len(sizes) - 1) + 1):
+        used -= sizes[i - 1]
+        if not is_start(i):
+            continue
+        cut = i
+        if used <= max_bytes:
+            break
+    return cut
+
+
+class SessionSlot:
+    """What one session holds in memory, as seen by the sweeper."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.live_chats = ChatRegistry()
+        self.messages = []
+        self.history = []
+        self.last_seen = time.monotonic()
+        self.released = False
+        self._sizes = (0, 0, 0, 0)  # len(messages), len(history), their bytes
+
+    def attach(self, messages, history):
+        """Remember the lists the session is using this run."""
+        self.messages = messages
+        self.history = history
+
+    def resident_bytes(self):
+        messages, history = self._measure()
+        return {
+            "messages": messages,
+            "history": history,
+            "live_chats": self.live_chats.resident_bytes,
+            "total": messages + history + self.live_chats.resident_bytes,
+        }
+
+    def _measure(self):
+        # Only the lists' lengths change between runs, so sizes are cached
+        count, history_count, messages, history = self._sizes
+        if (count, history_count) != (len(self.messages), len(self.history)):
+            messages = messages_bytes(self.messages)
+            history = history_bytes(self.history)
+            self._sizes = (len(self.messages), len(self.history), messages, history)
+        return messages, history
+
+    def release(self):
+        # The lists are emptied in place: the session's state still refers to them
+        self.released = True
+        self.live_chats.clear()
+        self.messages.clear()
+        self.history.clear()
+        self._sizes = (0, 0, 0, 0)
+
+
+class SessionMemory:
+    """Process-wide registry of session slots with an idle sweeper."""
+
+    def __init__(self, max_bytes=None, idle_seconds=None, sweep_interval=None):
+        self.max_bytes = SESSION_MAX_BYTES if max_bytes is None else max_bytes
+        self.idle_seconds = SESSION_IDLE_SECONDS if idle_seconds is None else idle_seconds
+        self.sweep_interval = SESSION_SWEEP_INTERVAL if sweep_interval is None else sweep_interval
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._counters = dict(released_sessions=0, trimmed_messages=0, trimmed_history=0)
+        self._sweeper = None
+
+    def slot(self, session_id):
+        """The session's slot (a new one after it was released)."""
+        with self._lock:
+            slot = self._slots.get(session_id)
+            if slot is None:
+                slot = self._slots[session_id] = SessionSlot(session_id)
+            slot.last_seen = time.monotonic()
+            if self._sweeper is None and self.idle_seconds > 0:
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="session-sweeper", daemon=True)
+                self._sweeper.start()
+        return slot
+
+    def trim(self, slot, keep_messages, history_limit):
+        """Drop the oldest turns beyond max_bytes from the slot's lists.
+
+        The newest `keep_messages` messages and the history from index
+        `history_limit` on are always kept; the history, which is not
+        shown, gives way first. Returns (messages dropped, history
+        entries dropped).
+        """
+        messages, history = slot.messages, slot.history
+        messages_size, history_size = slot._measure()
+        if messages_size + history_size <= self.max_bytes:
+            return 0, 0
+
+        history_cut = 0
+        if history_limit:
+            kept_messages = messages_bytes(messages[-keep_messages:]) if keep_messages else 0
+            history_cut = trim_start(
+                [history_bytes([c]) for c in history],
+                self.max_bytes - kept_messages,
+                history_limit,
+                lambda i: history[i].role == "user",
+            )
+            del history[:history_cut]
+
+        message_cut = 0
+        if len(messages) > keep_messages:
+            message_cut = trim_start(
+                [len(m.get("content", "").encode("utf-8")) for m in messages],
+                self.max_bytes - slot._measure()[1],
+                len(messages) - keep_messages,
+                lambda i: messages[i]["role"] == "user",
+            )
+            del messages[:message_cut]
+
+        if message_cut or history_cut:
+            with self._lock:
+                self._counters["trimmed_messages"] += message_cut
+                self._counters["trimmed_history"] += history_cut
+        return message_cut, history_cut
+
+    def sweep(self, now=None):
+        """Release the sessions idle for longer than idle_seconds."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [
+                slot for slot in self._slots.values()
+                if now - slot.last_seen > self.idle_seconds
+            ]
+            for slot in idle:
+                del self._slots[slot.session_id]
+            self._counters["released_sessions"] += len(idle)
+        for slot in idle:
+            slot.release()
+        return len(idle)
+
+    def stats(self):
+        with self._lock:
+            slots = list(self._slots.values())
+            counters = dict(self._counters)
+        sizes = [slot.resident_bytes()["total"] for slot in slots]
+        return dict(
+            counters,
+            sessions=len(slots),
+            resident_bytes=sum(sizes),
+            largest_session_bytes=max(sizes, default=0),
+            max_bytes_per_session=self.max_bytes,
+        )
+
+    def prometheus(self):
+        """Session metrics in Prometheus text format (added to METRICS_FILE)."""
+        stats = self.stats()
+        return "\n".join([
+            "# HELP chat_sessions Sessions holding chat data in memory.",
+            "# TYPE chat_sessions gauge",
+            f"chat_sessions {stats['sessions']}",
+            "# HELP chat_session_resident_bytes Message text held by all sessions.",
+            "# TYPE chat_session_resident_bytes gauge",
+            f"chat_session_resident_bytes {stats['resident_bytes']}",
+            "# HELP chat_session_resident_bytes_max Message text held by the largest session.",
+            "# TYPE chat_session_resident_bytes_max gauge",
+            f"chat_session_resident_bytes_max {stats['largest_session_bytes']}",
+            "# HELP chat_sessions_released_total Idle sessions released by the sweeper.",
+            "# TYPE chat_sessions_released_total counter",
+            f"chat_sessions_released_total {stats['released_sessions']}",
+        ]) + "\n"
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            self.sweep()
+
+
+@st.cache_resource(show_spinner=False)
+def get_session_memory():
+    """The process-wide session memory shared by all sessions."""
+    return SessionMemory()
@@ -0,0 +1,533 @@
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import streamlit as st
+
+import chat_store
+from chat_catalog import SQLITE_BUSY_TIMEOUT, ChatCatalog
+from chat_store import (
+    CODEC_NAMES,
+    CODECS,
+    CorruptChatError,
+    TranscriptStore,
+    _compress,
+    _decompress,
+    _ZstdError,
+)
+from user_storage import USER_OPEN_STORES
+
+# ------------------------------
+# Storage backends
+# ------------------------------
+# Chat logs and the chat catalog are kept by one of three backends:
+#
+#   STORAGE_BACKEND      files, sqlite or redis                  (default files)
+#   REDIS_URL            server of the redis backend (default redis://localhost:6379/0)
+#   REDIS_PREFIX         prefix of every key it writes           (default "chat:")
+#   STORAGE_FEED_LENGTH  flushes kept in the turn feed           (default 100000)
+#
+#   files   data/<chat_id>.chat files and data/chats.db (see chat_store.py)
+#   sqlite  chat logs as rows of data/chats.db, next to the catalog: one
+#           file per data directory, every write a transaction
+#   redis   chat logs and catalog in a Redis-compatible server, so several
+#           app replicas behind a load balancer serve any chat without
+#           sticky sessions or a shared disk. REDIS_URL=fakeredis:// keeps
+#           them in an in-process fakeredis server (tests and benchmarks).
+#
+# All backends store the same compressed turn records; chats saved by the
+# files backend are imported the first time they are opened (the file is
+# kept with a .migrated suffix), and so is the catalog of a directory. The
+# import happens once per chat and goes in front of any turn another
+# replica appended in the meantime.
+#
+# The search index and the retrieval memory are derived from the saved
+# turns and stay on each host's disk. With redis every flush of the persist
+# queue also adds its turns to a capped stream of the data directory (the
+# turn feed), and each replica adds the turns it has not seen to its index
+# and memory before using them. A replica that falls more than
+# STORAGE_FEED_LENGTH flushes behind misses the oldest ones; one starting
+# with no index builds it from the shared chats.
+#
+# The redis package (and fakeredis) are only imported with STORAGE_BACKEND=redis.
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "files")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = os.environ.get("REDIS_PREFIX", "chat:")
+STORAGE_FEED_LENGTH = int(os.environ.get("STORAGE_FEED_LENGTH", 100000))
+BACKENDS = ("files", "sqlite", "redis")
+
+DATA_DIR = "data"
+FEED_READ_COUNT = 500  # feed entries read per round trip
+
+_FRAMES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    frame   BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS frames_chat_id ON frames (chat_id, seq);
+CREATE TABLE IF NOT EXISTS imported_files (
+    chat_id TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS damaged_frames (
+    chat_id  TEXT NOT NULL,
+    frame    BLOB NOT NULL,
+    saved_at REAL NOT NULL
+);
+"""
+
+
+def _backend(backend):
+    backend = backend or STORAGE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"STORAGE_BACKEND must be one of {', '.join(BACKENDS)}, not {backend!r}")
+    return backend
+
+
+def open_transcripts(data_dir=DATA_DIR, avatars=None, backend=None):
+    """The chat log store of `data_dir` for the configured backend."""
+    backend = _backend(backend)
+    if backend == "sqlite":
+        return SqliteTranscriptStore(data_dir, avatars=avatars)
+    if backend == "redis":
+        return RedisTranscriptStore(data_dir, avatars=avatars)
+    return TranscriptStore(data_dir, avatars=avatars)
+
+
+def open_catalog(data_dir=DATA_DIR, backend=None):
+    """The chat catalog of `data_dir` for the configured backend."""
+    if _backend(backend) == "redis":
+        return RedisCatalog(data_dir)
+    return ChatCatalog(data_dir)
+
+
+def turn_feed(data_dir=DATA_DIR, backend=None):
+    """The turn feed of `data_dir`, or None when turns are not shared between hosts."""
+    if _backend(backend) == "redis":
+        return TurnFeed(data_dir)
+    return None
+
+
+@st.cache_resource(show_spinner=False, max_entries=USER_OPEN_STORES)
+def get_catalog(data_dir=DATA_DIR):
+    """The catalog of `data_dir`, shared by all sessions of the process."""
+    return open_catalog(data_dir)
+
+
+@functools.lru_cache(maxsize=None)
+def redis_client(url=None):
+    """One client (and connection pool) per URL and process."""
+    url = url or REDIS_URL
+    if url.startswith("fakeredis://"):
+        import fakeredis
+
+        return fakeredis.FakeRedis()
+    import redis
+
+    return redis.Redis.from_url(url)
+
+
+def namespace(data_dir):
+    """Prefix of the Redis keys of a data directory."""
+    return f"{REDIS_PREFIX}{os.path.normpath(data_dir).replace(os.sep, '/')}:"
+
+
+@functools.lru_cache(maxsize=USER_OPEN_STORES)
+def _sqlite_database(path):
+    # One connection per database and process, used under a lock
+    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_FRAMES_SCHEMA)
+    return conn, threading.RLock()
+
+
+class _DatabaseTranscripts(TranscriptStore):
+    """Turn records and file import shared by the database backends.
+
+    A frame is one byte string: the codec number, then the compressed
+    records. The database keeps it whole, so frames carry no length or CRC.
+    """
+
+    def _pack(self, records):
+        payload = json.dumps(records, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return bytes([CODECS[self.codec]]) + _compress(self.codec, payload)
+
+    def _records(self, frames):
+        """(records, damaged frames) of a chat's frames."""
+        records, damaged = [], []
+        for frame in frames:
+            try:
+                records.extend(json.loads(_decompress(CODEC_NAMES[frame[0]], frame[1:])))
+            except (IndexError, KeyError, ValueError, _ZstdError, zlib.error):
+                damaged.append(frame)
+        return records, damaged
+
+    def _rebuild(self, chat_id, records, damaged, backup_path):
+        messages, history = [], []
+        for record in records:
+            self._decode_turn(record, messages, history)
+        if damaged:
+            raise CorruptChatError(chat_id, messages, history, len(damaged), backup_path)
+        return messages, history
+
+    def _saved_file(self, chat_id):
+        """Frame holding a chat saved by the files backend, or None."""
+        paths = (self._path(chat_id), self._jsonl_path(chat_id), *self._legacy_paths(chat_id))
+        if not any(os.path.exists(path) for path in paths):
+            return None
+        # Also converts the JSONL logs and joblib pickles to a .chat file
+        messages, history = TranscriptStore(self.data_dir, self.codec, self.avatars).load(chat_id)
+        return self._pack([self._encode_turn(messages, history)]) if messages else None
+
+    def _retire_file(self, chat_id):
+        path = self._path(chat_id)
+        if os.path.exists(path):
+            os.replace(path, path + ".migrated")
+
+
+class SqliteTranscriptStore(_DatabaseTranscripts):
+    """Chat logs as rows of data/chats.db, one row per saved frame."""
+
+    def __init__(self, data_dir=DATA_DIR, compression=None, avatars=None):
+        super().__init__(data_dir, compression, avatars)
+        self.path = os.path.join(self.data_dir, "chats.db")
+        self._conn, self._db_lock = _sqlite_database(self.path)
+
+    def version(self, chat_id):
+        """Change marker for a chat's log: its newest row number, or None."""
+        with self._db_lock:
+            return self._conn.execute(
+                "SELECT MAX(seq) FROM frames WHERE chat_id = ?", (chat_id,)
+            ).fetchone()[0]
+
+    def load(self, chat_id):
+        with self._db_lock:
+            frames = self._frames(chat_id)
+            if not frames:
+                frame = self._saved_file(chat_id)
+                if frame is None:
+                    return [], []
+                with self._conn:
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    # Once per chat, whichever replica gets here first; turns another
+                    # one appended since the read above go after the imported ones
+                    if self._conn.execute(
+                        "INSERT OR IGNORE INTO imported_files VALUES (?)", (chat_id,)
+                    ).rowcount:
+                        appended = self._frames(chat_id)
+                        self._conn.execute("DELETE FROM frames WHERE chat_id = ?", (chat_id,))
+                        for saved in (frame, *appended):
+                            self._insert(chat_id, saved)
+                self._retire_file(chat_id)
+                frames = self._frames(chat_id)
+
+            self.loads += 1
+            records, damaged = self._records(frames)
+            if damaged or len(frames) > chat_store.CHAT_COMPACT_FRAMES:
+                with self._conn:
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    # Turns saved since the read are part of the rewrite
+                    frames = self._frames(chat_id)
+                    records, damaged = self._records(frames)
+                    self._conn.executemany(
+                        "INSERT INTO damaged_frames VALUES (?, ?, ?)",
+                        [(chat_id, frame, time.time()) for frame in damaged],
+                    )
+                    self._conn.execute("DELETE FROM frames WHERE chat_id = ?", (chat_id,))
+                    self._insert(chat_id, self._pack(records))
+        return self._rebuild(chat_id, records, damaged, f"{self.path} (damaged_frames)")
+
+    def append_turns(self, chat_id, turns):
+        records = [self._encode_turn(messages, history) for messages, history in turns]
+        frame = self._pack(records)
+        with self._db_lock, self._conn:
+            self._insert(chat_id, frame)
+
+    def _frames(self, chat_id):
+        return [row[0] for row in self._conn.execute(
+            "SELECT frame FROM frames WHERE chat_id = ? ORDER BY seq", (chat_id,)
+        )]
+
+    def _insert(self, chat_id, frame):
+        self._conn.execute("INSERT INTO frames (chat_id, frame) VALUES (?, ?)", (chat_id, frame))
+
+
+class RedisTranscriptStore(_DatabaseTranscripts):
+    """Chat logs as Redis lists of frames, with a revision counter per chat."""
+
+    def __init__(self, data_dir=DATA_DIR, compression=None, avatars=None, client=None):
+        super().__init__(data_dir, compression, avatars)
+        self._redis = client or redis_client()
+        self._prefix = namespace(data_dir)
+
+    def _key(self, kind, chat_id):
+        return f"{self._prefix}{kind}:{chat_id}"
+
+    def version(self, chat_id):
+        """Change marker for a chat's log: its revision, or None."""
+        revision = self._redis.get(self._key("rev", chat_id))
+        return int(revision) if revision is not None else None
+
+    def load(self, chat_id):
+        log = self._key("log", chat_id)
+        frames, revision = self._read(chat_id)
+        if not frames:
+            frame = self._saved_file(chat_id)
+            if frame is None:
+                return [], []
+            self._import_file(chat_id, frame)
+            self._retire_file(chat_id)
+            frames, revision = self._read(chat_id)
+
+        self.loads += 1
+        records, damaged = self._records(frames)
+        backup_key = None
+        if damaged:
+            backup_key = f"{log}:corrupt-{time.time_ns()}"
+        if damaged or len(frames) > chat_store.CHAT_COMPACT_FRAMES:
+            self._replace(chat_id, revision, [self._pack(records)], damaged, backup_key)
+        return self._rebuild(chat_id, records, damaged, backup_key)
+
+    def append_turns(self, chat_id, turns):
+        records = [self._encode_turn(messages, history) for messages, history in turns]
+        pipe = self._redis.pipeline()
+        pipe.rpush(self._key("log", chat_id), self._pack(records))
+        pipe.incr(self._key("rev", chat_id))
+        pipe.execute()
+
+    def _read(self, chat_id):
+        pipe = self._redis.pipeline()
+        pipe.lrange(self._key("log", chat_id), 0, -1)
+        pipe.get(self._key("rev", chat_id))
+        return pipe.execute()
+
+    def _import_file(self, chat_id, frame):
+        """Put the frame of a chat saved by the files backend in front of its log, once.
+
+        Turns another replica appended since the log was read stay after it.
+        """
+        from redis.exceptions import WatchError
+
+        imported = self._key("imported", chat_id)
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(imported)
+                    if pipe.exists(imported):
+                        return  # by another replica
+                    pipe.multi()
+                    pipe.lpush(self._key("log", chat_id), frame)
+                    pipe.set(imported, 1)
+                    pipe.incr(self._key("rev", chat_id))
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue  # another replica imported it meanwhile: checked again
+
+    def _replace(self, chat_id, revision, frames, damaged=(), backup_key=None):
+        """Replace the log with `frames` unless it changed since `revision` was read.
+
+        Skipped when another replica wrote in between; the next load tries again.
+        """
+        from redis.exceptions import WatchError
+
+        log, rev = self._key("log", chat_id), self._key("rev", chat_id)
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(rev)
+                if pipe.get(rev) != revision:
+                    return
+                pipe.multi()
+                if damaged:
+                    pipe.rpush(backup_key, *damaged)
+                pipe.delete(log)
+                pipe.rpush(log, *frames)
+                pipe.incr(rev)
+                pipe.execute()
+            except WatchError:
+                pass
+
+
+class RedisCatalog:
+    """The chat catalog in Redis: a hash per chat and a sorted set by last update."""
+
+    def __init__(self, data_dir=DATA_DIR, client=None):
+        self.data_dir = data_dir
+        self._redis = client or redis_client()
+        self._prefix = namespace(data_dir)
+        self._by_update = self._prefix + "chats"
+        self._import_local()
+
+    def _meta(self, chat_id):
+        return f"{self._prefix}chat:{chat_id}"
+
+    def recent(self, limit, offset=0):
+        """Return [(chat_id, title), ...] ordered by most recent activity."""
+        if limit <= 0:
+            return []
+        chat_ids = [c.decode("utf-8") for c in self._redis.zrevrange(self._by_update, offset, offset + limit - 1)]
+        pipe = self._redis.pipeline(transaction=False)
+        for chat_id in chat_ids:
+            pipe.hget(self._meta(chat_id), "title")
+        titles = pipe.execute() if chat_ids else []
+        return [
+            (chat_id, title.decode("utf-8"))
+            for chat_id, title in zip(chat_ids, titles)
+            if title is not None
+        ]
+
+    def count(self):
+        return self._redis.zcard(self._by_update)
+
+    def get(self, chat_id):
+        """Return the catalog entry for a chat as a dict, or None."""
+        fields = self._redis.hgetall(self._meta(chat_id))
+        if not fields:
+            return None
+        fields = {k.decode("utf-8"): v.decode("utf-8") for k, v in fields.items()}
+        return dict(
+            chat_id=chat_id,
+            title=fields["title"],
+            created_at=float(fields["created_at"]),
+            updated_at=float(fields["updated_at"]),
+            message_count=int(fields["message_count"]),
+        )
+
+    def title(self, chat_id, default=None):
+        title = self._redis.hget(self._meta(chat_id), "title")
+        return title.decode("utf-8") if title is not None else default
+
+    def __contains__(self, chat_id):
+        return self.title(chat_id) is not None
+
+    def create(self, chat_id, title, message_count=0):
+        """Register a new chat. Does nothing if the chat already exists."""
+        now = time.time()
+        self._create_many([dict(
+            chat_id=chat_id, title=title, created_at=now, updated_at=now, message_count=message_count,
+        )])
+
+    def rename(self, chat_id, title):
+        if self._redis.exists(self._meta(chat_id)):
+            self._redis.hset(self._meta(chat_id), "title", title)
+
+    def replace_titles(self, titles):
+        """Rename {chat_id: (old title, new title), ...} in one transaction.
+
+        Chats no longer called by their old title (renamed meanwhile) are
+        left alone. Returns the number of chats renamed.
+        """
+        from redis.exceptions import WatchError
+
+        metas = {chat_id: self._meta(chat_id) for chat_id in titles}
+        if not metas:
+            return 0
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(*metas.values())
+                    current = [pipe.hget(meta, "title") for meta in metas.values()]
+                    renamed = [
+                        chat_id for chat_id, title in zip(metas, current)
+                        if title is not None and title.decode("utf-8") == titles[chat_id][0]
+                    ]
+                    pipe.multi()
+                    for chat_id in renamed:
+                        pipe.hset(metas[chat_id], "title", titles[chat_id][1])
+                    pipe.execute()
+                    return len(renamed)
+                except WatchError:
+                    continue  # one of them changed meanwhile: compare again
+
+    def record_turn(self, chat_id, new_messages):
+        """Bump the update time and message count after a saved turn."""
+        self.record_turns({chat_id: new_messages})
+
+    def record_turns(self, new_messages):
+        """record_turn for {chat_id: new message count, ...} in one transaction."""
+        now = time.time()
+        chat_ids = list(new_messages)
+        pipe = self._redis.pipeline(transaction=False)
+        for chat_id in chat_ids:
+            pipe.exists(self._meta(chat_id))
+        exists = pipe.execute() if chat_ids else []
+        pipe = self._redis.pipeline()
+        for chat_id, known in zip(chat_ids, exists):
+            if known:
+                pipe.hincrby(self._meta(chat_id), "message_count", new_messages[chat_id])
+                pipe.hset(self._meta(chat_id), "updated_at", now)
+                pipe.zadd(self._by_update, {chat_id: now})
+        pipe.execute()
+
+    def _create_many(self, rows):
+        """Add catalog entries, each only if its chat is not there yet."""
+        from redis.exceptions import WatchError
+
+        for row in rows:
+            meta = self._meta(row["chat_id"])
+            with self._redis.pipeline() as pipe:
+                try:
+                    pipe.watch(meta)
+                    if pipe.exists(meta):
+                        continue
+                    pipe.multi()
+                    pipe.hset(meta, mapping={k: v for k, v in row.items() if k != "chat_id"})
+                    pipe.zadd(self._by_update, {row["chat_id"]: row["updated_at"]})
+                    pipe.execute()
+                except WatchError:
+                    pass  # created by another replica
+
+    # ------------------------------
+    # One-time import of the directory's SQLite catalog
+    # ------------------------------
+    def _import_local(self):
+        imported = self._prefix + "catalog-imported"
+        local_files = [os.path.join(self.data_dir, name) for name in ("chats.db", "past_chats_list")]
+        if not any(os.path.exists(path) for path in local_files) or self._redis.exists(imported):
+            return
+        local = ChatCatalog(self.data_dir)  # also imports data/past_chats_list
+        self._create_many([local.get(chat_id) for chat_id, _ in local.recent(local.count())])
+        self._redis.set(imported, 1)
+
+
+class TurnFeed:
+    """Turns saved in a data directory, as a capped Redis stream.
+
+    Each entry holds the turns of one flush of a persist queue; search
+    indexes and retrieval memories remember the ID of the last entry they
+    added.
+    """
+
+    START = "0-0"
+
+    def __init__(self, data_dir=DATA_DIR, client=None):
+        self._redis = client or redis_client()
+        self.key = namespace(data_dir) + "turns"
+
+    def publish(self, batches):
+        """Add [(chat_id, start, messages), ...] saved together."""
+        self._redis.xadd(
+            self.key, {"turns": json.dumps(batches, ensure_ascii=False)},
+            maxlen=STORAGE_FEED_LENGTH, approximate=True,
+        )
+
+    def last_id(self):
+        """ID of the newest entry, to read from after indexing every saved chat."""
+        entries = self._redis.xrevrange(self.key, count=1)
+        return entries[0][0].decode("ascii") if entries else self.START
+
+    def read(self, after, count=FEED_READ_COUNT):
+        """(ID of the last entry read, [(chat_id, start, messages), ...]) after entry `after`."""
+        result = self._redis.xread({self.key: after}, count=count)
+        if not result:
+            return after, []
+        batches = []
+        for entry_id, fields in result[0][1]:
+            batches.extend(tuple(batch) for batch in json.loads(fields[b"turns"]))
+            after = entry_id.decode("ascii")
+        return after, batches
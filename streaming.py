@@ -0,0 +1,76 @@
+import io
+import os
+import time
+
+# ------------------------------
+# Streaming renderer
+# ------------------------------
+# Collects streamed text in a buffer and redraws the placeholder at most
+# STREAM_FPS times per second (or every STREAM_BATCH_CHUNKS chunks), instead
+# of once per word. The optional typing cursor is drawn on intermediate
+# frames only and never adds a delay.
+
+STREAM_FPS = float(os.environ.get("STREAM_FPS", 15))
+STREAM_BATCH_CHUNKS = int(os.environ.get("STREAM_BATCH_CHUNKS", 0))
+TYPING_CURSOR = os.environ.get("TYPING_EFFECT", "1") != "0"
+CURSOR = "▌"
+
+
+class StreamRenderer:
+    """Incrementally draws streamed text into a Streamlit placeholder.
+
+    `fps` limits how often the placeholder is redrawn; `batch_chunks`, when
+    greater than zero, also forces a redraw after that many chunks. Set
+    `fps` to 0 to redraw only on batch boundaries and at the end.
+    """
+
+    def __init__(self, container, fps=None, batch_chunks=None, cursor=None,
+                 clock=time.monotonic):
+        self.container = container
+        self.fps = STREAM_FPS if fps is None else fps
+        self.batch_chunks = STREAM_BATCH_CHUNKS if batch_chunks is None else batch_chunks
+        self.cursor = TYPING_CURSOR if cursor is None else cursor
+        self.clock = clock
+
+        self._buffer = io.StringIO()
+        self._pending = 0
+        self._interval = 1.0 / self.fps if self.fps > 0 else None
+        self._last_flush = clock()
+        self.frames = 0
+        self.render_seconds = 0.0  # time spent redrawing the placeholder
+
+    def write(self, text):
+        """Add a chunk of streamed text, redrawing if a frame is due."""
+        if not text:
+            return
+        self._buffer.write(text)
+        self._pending += 1
+
+        if self.batch_chunks and self._pending >= self.batch_chunks:
+            self.flush()
+        elif self._interval is not None and self.clock() - self._last_flush >= self._interval:
+            self.flush()
+
+    def flush(self):
+        """Redraw the placeholder with everything received so far."""
+        text = self._buffer.getvalue()
+        self._draw(text + CURSOR if self.cursor else text)
+        self._pending = 0
+        self._last_flush = self.clock()
+        self.frames += 1
+
+    def finish(self):
+        """Draw the final text (without cursor) and return it."""
+        text = self._buffer.getvalue()
+        self._draw(text)
+        self.frames += 1
+        return text
+
+    def _draw(self, text):
+        started = time.perf_counter()
+        self.container.write(text)
+        self.render_seconds += time.perf_counter() - started
+
+    @property
+    def text(self):
+        return self._buffer.getvalue()
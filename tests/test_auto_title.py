@@ -0,0 +1,49 @@
+import threading
+
+from auto_title import TitleQueue, keyword_title
+from chat_catalog import ChatCatalog
+
+PROMPT = "How do I prune tomato plants in a greenhouse?"
+REPLY = "Prune the tomato side shoots weekly and keep the greenhouse airy."
+
+
+def test_new_chat_gets_its_keyword_title(tmp_path):
+    data_dir = str(tmp_path)
+    catalog = ChatCatalog(data_dir)
+    catalog.create("c", "How do I prune...")
+    queue = TitleQueue(mode="keywords")
+    queue.submit(data_dir, "c", "How do I prune...", PROMPT, REPLY)
+    assert queue.flush()
+    queue.close()
+    assert catalog.title("c") == keyword_title(PROMPT, REPLY)
+    assert queue.stats()["renamed"] == 1
+
+
+def test_rename_while_queued_is_kept(tmp_path, monkeypatch):
+    data_dir = str(tmp_path)
+    catalog = ChatCatalog(data_dir)
+    catalog.create("renamed", "How do I prune...")
+    catalog.create("untouched", "How do I prune...")
+    # The thread takes the chats and then waits until they have been renamed
+    taken, release = threading.Event(), threading.Event()
+    title = TitleQueue.title
+
+    def held_title(self, prompt, reply, sender=None):
+        taken.set()
+        release.wait(5)
+        return title(self, prompt, reply, sender)
+
+    monkeypatch.setattr(TitleQueue, "title", held_title)
+    queue = TitleQueue(mode="keywords")
+    with queue._cond:  # both in one batch
+        queue.submit(data_dir, "renamed", "How do I prune...", PROMPT, REPLY)
+        queue.submit(data_dir, "untouched", "How do I prune...", PROMPT, REPLY)
+    assert taken.wait(5)
+    catalog.rename("renamed", "Tomatoes")
+    release.set()
+    assert queue.flush()
+    queue.close()
+    assert catalog.title("renamed") == "Tomatoes"
+    assert catalog.title("untouched") == keyword_title(PROMPT, REPLY)
+    stats = queue.stats()
+    assert (stats["renamed"], stats["kept"], stats["writes"]) == (1, 1, 1)
@@ -0,0 +1,84 @@
+import json
+import sys
+
+import batch_chat
+from batch_chat import BatchRunner, ResultWriter, completed_ids
+from benchmarks.fake_gemini import FakeClient
+from rate_limit import RateLimiter, ResilientSender
+
+
+def result(conversation_id, reply, error=None):
+    return {"id": conversation_id, "turns": [{"prompt": "p", "reply": reply}], "error": error}
+
+
+def test_resume_after_a_line_torn_inside_a_character(tmp_path):
+    path = tmp_path / "results.jsonl"
+    done = json.dumps(result("q1", "Dobar dan"), ensure_ascii=False) + "\n"
+    failed = json.dumps(result("q2", "", error="ServerError: 500")) + "\n"
+    torn = json.dumps(result("q3", "Idem kući"), ensure_ascii=False).encode("utf-8")
+    torn = torn[:torn.index("ć".encode("utf-8")) + 1]  # ends with half of "ć"
+    path.write_bytes(done.encode("utf-8") + failed.encode("utf-8") + torn)
+
+    assert completed_ids(str(path)) == {"q1"}
+    writer = ResultWriter(str(path))
+    writer.write(result("q3", "Idem kući"))
+    writer.close()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["id"] for line in lines] == ["q1", "q2", "q3"]
+    assert completed_ids(str(path)) == {"q1", "q3"}
+
+
+def test_complete_line_without_newline_is_redone(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_text(json.dumps(result("q1", "ok")))
+    assert completed_ids(str(path)) == set()
+    ResultWriter(str(path)).close()
+    assert path.read_bytes() == b""
+
+
+def test_conversations_run_like_the_app():
+    client = FakeClient(reply_words=20)
+    sender = ResilientSender(client, "fake", RateLimiter(rpm=0, tpm=0))
+    outcome = BatchRunner(client, "fake", sender).run("c7", ["first", "second"])
+    assert outcome["error"] is None
+    assert [turn["reply"] for turn in outcome["turns"]] == [
+        client.reply_for("first"), client.reply_for("second"),
+    ]
+
+
+def test_bad_input_lines_become_error_results(tmp_path, monkeypatch, capsys):
+    source = tmp_path / "prompts.jsonl"
+    source.write_bytes(b"\n".join([
+        b'{"id": "q1", "prompt": "hello"}',
+        b'{"id": "q2", "prompt": "unfinished',
+        b'{"id": "q3", "question": "no prompt"}',
+        b'{"turns": "not a list"}',
+        b'"just a string"',
+        b'{"id": "q6", "prompt": "\xff"}',
+        b'{"id": "boom", "prompt": "not written"}',
+        b'{"id": "q8", "turns": ["one", "two"]}',
+    ]) + b"\n")
+    output = tmp_path / "results.jsonl"
+    write = ResultWriter.write
+
+    def write_or_fail(self, result):
+        if result["id"] == "boom":
+            raise OSError("disk full")
+        write(self, result)
+
+    monkeypatch.setattr(ResultWriter, "write", write_or_fail)
+    monkeypatch.setattr(batch_chat, "build_client", lambda api_key: FakeClient(reply_words=5))
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    monkeypatch.setattr(sys, "argv", ["batch_chat.py", str(source), str(output), "--workers", "2"])
+    batch_chat.main()
+
+    results = {r["id"]: r for r in map(json.loads, output.read_text(encoding="utf-8").splitlines())}
+    assert sorted(results) == ["line-2", "line-4", "line-5", "line-6", "q1", "q3", "q8"]
+    assert results["q1"]["error"] is None and len(results["q8"]["turns"]) == 2
+    assert results["line-2"]["error"].startswith("Invalid input line 2: JSONDecodeError")
+    assert results["q3"]["error"] == "Invalid input line 3: KeyError: 'prompt'"
+    assert "turns must be a list" in results["line-4"]["error"]
+    assert "AttributeError" in results["line-5"]["error"]
+    assert "UnicodeDecodeError" in results["line-6"]["error"]
+    assert "boom: not saved: OSError: disk full" in capsys.readouterr().err
+    assert completed_ids(str(output)) == {"q1", "q8"}
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+import streamlit as st
+from google import genai
+from google.genai import errors
+from streamlit.testing.v1 import AppTest
+
+from auto_title import get_title_queue
+from benchmarks.fake_gemini import FakeChat, FakeClient
+from chat_core import AI_AVATAR_ICON, MODEL_ROLE
+from persist_queue import PersistQueue, get_persist_queue
+from search_index import SearchIndex
+from storage_backend import open_transcripts
+from turn_metrics import get_turn_metrics
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app_chat.py")
+
+
+def _drain():
+    """Write everything the app queued, then forget the process-wide objects."""
+    get_persist_queue("data", avatars={MODEL_ROLE: AI_AVATAR_ICON}).close()
+    title_queue = get_title_queue()
+    if title_queue is not None:
+        title_queue.close()
+    get_turn_metrics().close()
+    st.cache_resource.clear()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """A fresh app in an empty directory, answered by the fake backend."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    monkeypatch.setattr(genai, "Client", lambda *args, **kwargs: FakeClient(reply_words=20))
+    st.cache_resource.clear()
+    yield lambda: AppTest.from_file(APP, default_timeout=60).run()
+    _drain()
+
+
+def test_failed_send_is_not_saved(app, monkeypatch):
+    send = FakeChat.send_message_stream
+
+    def send_or_fail(self, message, config=None):
+        if message == "fail":
+            raise errors.ClientError(400, {"error": {"code": 400, "message": "bad request"}})
+        return send(self, message, config)
+
+    monkeypatch.setattr(FakeChat, "send_message_stream", send_or_fail)
+    at = app()
+    at.chat_input[0].set_value("first question").run()
+    at.chat_input[0].set_value("fail").run()
+    assert at.error
+    at.chat_input[0].set_value("second question").run()
+    assert not at.exception
+    chat_id = at.session_state.chat_id
+    assert [m["content"] for m in at.session_state.messages if m["role"] == "user"] == [
+        "first question", "second question",
+    ]
+    _drain()
+
+    messages, _ = open_transcripts("data").load(chat_id)
+    assert [m["content"] for m in messages if m["role"] == "user"] == [
+        "first question", "second question",
+    ]
+    # Search hits point at the message as it is stored
+    [(hit_chat_id, position, role, _)] = SearchIndex("data").search("second question")
+    assert (hit_chat_id, position, role) == (chat_id, 2, "user")
+
+
+def test_earlier_messages_still_being_saved_are_not_skipped(app, monkeypatch):
+    at = app()
+    for prompt in ("one", "two", "three"):
+        at.chat_input[0].set_value(prompt).run()
+    assert get_persist_queue("data", avatars={MODEL_ROLE: AI_AVATAR_ICON}).flush()
+    # The oldest turn was dropped from memory, and reading it back has to
+    # wait for a write that is still being retried
+    monkeypatch.setattr(PersistQueue, "flush", lambda self, *args, **kwargs: False)
+    messages = at.session_state.messages
+    at.session_state.messages = messages[2:]
+    at.session_state.gemini_history = at.session_state.gemini_history[2:]
+    at.session_state.messages_offset = 2
+    at.session_state.history_offset = 2
+    at.run()
+    assert not at.exception
+    assert [m.markdown[0].value for m in at.chat_message][::2] == ["two", "three"]
+    assert at.button(key="load_earlier").label == "Load earlier messages (2 hidden)"
@@ -0,0 +1,135 @@
+import glob
+import multiprocessing
+
+import pytest
+
+from chat_store import CorruptChatError, TranscriptStore
+from response_cache import turn_contents
+
+
+def save_turn(store, chat_id, prompt):
+    reply = f"reply to {prompt}"
+    messages = [dict(role="user", content=prompt), dict(role="ai", content=reply, avatar="✨")]
+    store.append_turn(chat_id, messages, turn_contents(prompt, reply))
+
+
+def prompts(messages):
+    return [m["content"] for m in messages if m["role"] == "user"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TranscriptStore(str(tmp_path), compression="zlib")
+
+
+def test_turns_round_trip(store):
+    for prompt in ("one", "two", "tri"):
+        save_turn(store, "c", prompt)
+    messages, history = store.load("c")
+    assert prompts(messages) == ["one", "two", "tri"]
+    assert [c.role for c in history] == ["user", "model"] * 3
+    assert store.load("never saved") == ([], [])
+
+
+def test_frame_cut_short_by_a_crash_is_dropped(store):
+    save_turn(store, "c", "one")
+    save_turn(store, "c", "two")
+    path = store._path("c")
+    with open(path, "rb") as f:
+        data = f.read()
+    save_turn(store, "c", "lost")
+    with open(path, "rb") as f:
+        third_frame = f.read()[len(data):]
+    # The process died halfway through writing the third frame
+    with open(path, "wb") as f:
+        f.write(data + third_frame[:len(third_frame) // 2])
+
+    assert prompts(store.load("c")[0]) == ["one", "two"]
+    save_turn(store, "c", "three")
+    assert prompts(store.load("c")[0]) == ["one", "two", "three"]
+    assert not glob.glob(path + ".corrupt-*")
+
+
+def test_torn_frame_is_dropped_by_the_next_append(store):
+    save_turn(store, "c", "one")
+    with open(store._path("c"), "ab") as f:
+        f.write(b"\x00\x00\x01\x00partial")
+    save_turn(store, "c", "two")
+    assert prompts(store.load("c")[0]) == ["one", "two"]
+
+
+def test_damaged_frame_is_skipped_and_kept(store):
+    for prompt in ("one", "two", "three"):
+        save_turn(store, "c", prompt)
+    path = store._path("c")
+    with open(path, "rb") as f:
+        data = bytearray(f.read())
+    data[-3] ^= 0xFF  # inside the last frame, so its CRC no longer matches
+    with open(path, "wb") as f:
+        f.write(data)
+
+    with pytest.raises(CorruptChatError) as caught:
+        store.load("c")
+    assert caught.value.skipped == 1
+    assert prompts(caught.value.messages) == ["one", "two"]
+    with open(caught.value.backup_path, "rb") as f:
+        assert f.read() == bytes(data)
+    # The chat was rewritten from the readable frames
+    assert prompts(store.load("c")[0]) == ["one", "two"]
+
+
+def test_damaged_header_on_load(store):
+    save_turn(store, "c", "one")
+    path = store._path("c")
+    with open(path, "r+b") as f:
+        f.write(b"JUNK")
+
+    with pytest.raises(CorruptChatError) as caught:
+        store.load("c")
+    assert caught.value.skipped == 0 and caught.value.messages == []
+    with open(caught.value.backup_path, "rb") as f:
+        assert f.read(4) == b"JUNK"
+    assert store.load("c") == ([], [])
+    save_turn(store, "c", "again")
+    assert prompts(store.load("c")[0]) == ["again"]
+
+
+def test_damaged_header_on_append(store):
+    save_turn(store, "c", "one")
+    path = store._path("c")
+    with open(path, "r+b") as f:
+        f.write(b"JUNK")
+
+    save_turn(store, "c", "two")
+    assert prompts(store.load("c")[0]) == ["two"]
+    [backup] = glob.glob(path + ".corrupt-*")
+    with open(backup, "rb") as f:
+        assert f.read(4) == b"JUNK"
+
+
+def test_header_cut_short_is_a_new_chat(store):
+    with open(store._path("c"), "wb") as f:
+        f.write(b"GC")
+    assert store.load("c") == ([], [])
+    save_turn(store, "c", "one")
+    assert prompts(store.load("c")[0]) == ["one"]
+
+
+def _writer(data_dir, number, turns):
+    store = TranscriptStore(data_dir, compression="zlib")
+    for turn in range(turns):
+        save_turn(store, "shared", f"p{number}-{turn}")
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_processes_appending_to_one_chat_lose_nothing(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_writer, args=(str(tmp_path), n, 50)) for n in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+
+    saved = prompts(TranscriptStore(str(tmp_path), compression="zlib").load("shared")[0])
+    assert sorted(saved) == sorted(f"p{n}-{t}" for n in range(4) for t in range(50))
@@ -0,0 +1,77 @@
+import pytest
+
+from context_window import ContextWindowManager, estimate_tokens
+from response_cache import turn_contents
+
+
+def history(*prompts, reply_chars=40):
+    """A history of one turn per prompt; every reply is `reply_chars` long."""
+    contents = []
+    for prompt in prompts:
+        contents += turn_contents(prompt, "r" * reply_chars)
+    return contents
+
+
+def prompts(window):
+    return [c.parts[0].text for c in window.history if c.role == "user"]
+
+
+def test_full_sends_everything():
+    chat = history("one", "two", "three")
+    window = ContextWindowManager("full").apply(chat)
+    assert window.history == chat and window.dropped == 0 and window.config is None
+    assert window.sent_tokens == window.raw_tokens
+
+
+def test_sliding_keeps_the_last_turns():
+    window = ContextWindowManager("sliding", max_turns=2).apply(history("one", "two", "three", "four"))
+    assert prompts(window) == ["three", "four"]
+    assert window.dropped == 4 and window.turns == 2
+    assert window.saved_tokens == 2 * (estimate_tokens("one") + estimate_tokens("r" * 40))
+
+    window = ContextWindowManager("sliding", max_turns=5).apply(history("one", "two"))
+    assert window.dropped == 0 and not window.trimmed
+
+
+def test_budget_keeps_the_turns_that_fit():
+    # Each turn is 1 + 10 tokens
+    window = ContextWindowManager("budget", token_budget=25).apply(history("one", "two", "tri", "for"))
+    assert prompts(window) == ["tri", "for"]
+    assert window.dropped == 4 and window.sent_tokens == 22
+
+
+def test_budget_always_keeps_the_newest_turn():
+    chat = history("one", "two", reply_chars=400)  # 101 tokens a turn
+    window = ContextWindowManager("budget", token_budget=50).apply(chat)
+    assert prompts(window) == ["two"]
+    assert window.dropped == 2 and window.sent_tokens > 50
+
+
+def test_summary_replaces_the_dropped_turns():
+    chat = history("first question", "second question", "third question")
+    window = ContextWindowManager("summary", token_budget=40, summary_budget=30).apply(chat)
+    assert prompts(window) == ["third question"] and window.dropped == 4
+    summary = window.config.system_instruction
+    # Only the newest dropped messages fit in the summary budget
+    assert summary == "Summary of the earlier conversation:\n- User: second question\n- Assistant: " + "r" * 40
+    assert window.sent_tokens == window.raw_tokens - window.saved_tokens
+    assert window.sent_tokens == sum(estimate_tokens(t) for t in ("third question", "r" * 40, summary))
+
+
+def test_summary_too_small_for_any_message():
+    chat = history("first question", "second question", reply_chars=400)
+    window = ContextWindowManager("summary", token_budget=200, summary_budget=20).apply(chat)
+    assert prompts(window) == ["second question"]
+    assert window.config.system_instruction == "Summary of the earlier conversation:\n"
+
+
+def test_summary_without_dropped_turns_sends_no_instruction():
+    window = ContextWindowManager("summary", token_budget=1000, summary_budget=100).apply(history("one", "two"))
+    assert window.dropped == 0 and window.config is None
+    assert window.with_instruction(None) is None
+    assert window.with_instruction("Remember this").system_instruction == "Remember this"
+
+
+def test_unknown_policy_is_refused():
+    with pytest.raises(ValueError):
+        ContextWindowManager("everything")
@@ -0,0 +1,146 @@
+import json
+import time
+
+import pytest
+
+import persist_queue
+from chat_store import TranscriptStore
+from persist_queue import PersistQueue
+from response_cache import turn_contents
+from search_index import SearchIndex
+from storage_backend import open_catalog
+
+
+def turn(prompt):
+    reply = f"reply to {prompt}"
+    return [dict(role="user", content=prompt), dict(role="ai", content=reply)], turn_contents(prompt, reply)
+
+
+def submit(queue, chat_id, prompt, start=0, owner="s1"):
+    messages, history = turn(prompt)
+    queue.submit(chat_id, messages, history, start, owner=owner)
+
+
+def prompts(data_dir, chat_id):
+    messages, _ = TranscriptStore(data_dir).load(chat_id)
+    return [m["content"] for m in messages if m["role"] == "user"]
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(persist_queue, "RETRY_DELAY", 0.05)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def unwritable(monkeypatch):
+    """Chats named "bad..." cannot be written."""
+    append_turns = TranscriptStore.append_turns
+
+    def append_or_fail(self, chat_id, turns):
+        if chat_id.startswith("bad"):
+            raise OSError("disk says no")
+        return append_turns(self, chat_id, turns)
+
+    monkeypatch.setattr(TranscriptStore, "append_turns", append_or_fail)
+
+
+def test_turns_of_a_chat_are_coalesced(data_dir):
+    queue = PersistQueue(data_dir, mode="interval", interval=60)
+    for i in range(3):
+        submit(queue, "c", f"question {i}", start=2 * i)
+    assert queue.stats()["coalesced"] == 2
+    assert queue.flush("c", data_dir=data_dir)
+    assert prompts(data_dir, "c") == ["question 0", "question 1", "question 2"]
+    assert queue.stats()["flushes"] == 1
+    assert sorted(hit[1] for hit in SearchIndex(data_dir).search("question")) == [0, 1, 2, 3, 4, 5]
+    queue.close()
+
+
+def test_a_chat_that_cannot_be_written_does_not_hold_up_the_others(data_dir, unwritable):
+    queue = PersistQueue(data_dir)
+    open_catalog(data_dir).create("good", "good")
+    submit(queue, "bad", "lost")
+    submit(queue, "good", "first")
+    assert queue.flush("good", timeout=3, data_dir=data_dir)
+    submit(queue, "good", "second", start=2)
+    assert queue.flush("good", timeout=3, data_dir=data_dir)
+    assert prompts(data_dir, "good") == ["first", "second"]
+    assert open_catalog(data_dir).get("good")["message_count"] == 4
+
+    # Given up after PERSIST_MAX_ATTEMPTS tries, kept for a person to look at
+    assert queue.flush("bad", timeout=5, data_dir=data_dir)
+    stats = queue.stats()
+    assert stats["dropped"] == 1 and stats["errors"] == persist_queue.PERSIST_MAX_ATTEMPTS
+    assert queue.saved_version("bad", "s1", data_dir=data_dir) is False
+    with open(f"{data_dir}/unsaved_turns.jsonl", encoding="utf-8") as f:
+        [unsaved] = [json.loads(line) for line in f]
+    assert unsaved["chat_id"] == "bad" and unsaved["messages"][0]["content"] == "lost"
+    queue.close()
+
+
+def test_sync_submit_waits_a_bounded_time(data_dir, unwritable, monkeypatch):
+    monkeypatch.setattr(persist_queue, "RETRY_DELAY", 10)
+    monkeypatch.setattr(persist_queue, "SYNC_TIMEOUT", 0.2)
+    queue = PersistQueue(data_dir, mode="sync")
+    started = time.monotonic()
+    submit(queue, "bad", "stuck")
+    assert time.monotonic() - started < 2
+    assert not queue.flush("bad", timeout=0.1, data_dir=data_dir)
+    submit(queue, "good", "saved")
+    assert prompts(data_dir, "good") == ["saved"]
+
+
+def test_only_recent_writes_are_remembered(data_dir, monkeypatch):
+    monkeypatch.setattr(persist_queue, "WRITTEN_ENTRIES", 10)
+    queue = PersistQueue(data_dir)
+    for i in range(30):
+        submit(queue, f"c{i}", "hello")
+    assert queue.flush(data_dir=data_dir)
+    assert queue.saved_version("c29", "s1", data_dir=data_dir) not in (None, False)
+    # Forgotten: the session reads the chat again
+    assert queue.saved_version("c0", "s1", data_dir=data_dir) is False
+    assert len(queue._written) == 10
+    queue.close()
+
+
+def test_a_failing_store_is_retried_without_holding_up_the_chats(data_dir, monkeypatch):
+    monkeypatch.setattr(persist_queue, "RETRY_DELAY", 10)
+    add_many = SearchIndex.add_many
+    failures = []
+
+    def add_or_fail(self, batches):
+        if len(failures) < 2:
+            failures.append(batches)
+            raise OSError("database is locked")
+        add_many(self, batches)
+
+    monkeypatch.setattr(SearchIndex, "add_many", add_or_fail)
+    queue = PersistQueue(data_dir)
+    started = time.monotonic()
+    submit(queue, "a", "apple pie")
+    assert queue.flush("a", timeout=3, data_dir=data_dir)
+    submit(queue, "b", "apple cake")
+    assert queue.flush("b", timeout=3, data_dir=data_dir)
+    assert time.monotonic() - started < 3
+    assert prompts(data_dir, "a") == ["apple pie"] and prompts(data_dir, "b") == ["apple cake"]
+    stats = queue.stats()
+    assert stats["retrying_updates"] == 1 and stats["errors"] == 1
+    # The update for b waits behind the one for a; closing tries them at once
+    queue.close()
+    assert [[chat_id for chat_id, _, _ in batches] for batches in failures] == [["a"], ["a", "b"]]
+    assert sorted(hit[0] for hit in SearchIndex(data_dir).search("apple")) == ["a", "a", "b", "b"]
+
+
+def test_a_store_update_is_given_up_after_the_last_attempt(data_dir, monkeypatch):
+    def fail(self, batches):
+        raise OSError("disk says no")
+
+    monkeypatch.setattr(SearchIndex, "add_many", fail)
+    queue = PersistQueue(data_dir)
+    open_catalog(data_dir).create("c", "c")
+    submit(queue, "c", "hello")
+    assert queue.flush(timeout=5, data_dir=data_dir)
+    assert queue.stats()["errors"] == persist_queue.PERSIST_MAX_ATTEMPTS
+    assert open_catalog(data_dir).get("c")["message_count"] == 2
+    queue.close()
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+from google.genai import errors
+
+from benchmarks.fake_gemini import FakeClient
+from rate_limit import RateLimiter, ResilientSender, RetryPolicy, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def sender_for(client, max_retries=4, **limits):
+    """A sender that records its backoff instead of waiting."""
+    backoff = []
+    sender = ResilientSender(
+        client, "fake", RateLimiter(**{"rpm": 0, "tpm": 0, **limits}),
+        RetryPolicy(max_retries=max_retries, base_delay=1, max_delay=8, rng=lambda: 1.0),
+        sleep=backoff.append,
+    )
+    return sender, backoff
+
+
+def reply(sender, client, prompt):
+    chat = client.chats.create(model="fake")
+    stream = sender.stream(chat, prompt)
+    return "".join(chunk.text for chunk in stream), stream
+
+
+def test_token_bucket_makes_callers_wait_in_turn():
+    clock = Clock()
+    bucket = TokenBucket(60, clock=clock)  # one per second, 60 at once
+    assert all(bucket.reserve(1) == 0 for _ in range(60))
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    assert bucket.reserve(1) == pytest.approx(2.0)
+    clock.sleep(10)
+    assert bucket.reserve(1) == 0
+
+
+def test_limiter_is_shared_by_requests_and_tokens():
+    clock = Clock()
+    limiter = RateLimiter(rpm=600, tpm=6000, sleep=clock.sleep)
+    limiter.requests, limiter.tokens = TokenBucket(600, clock=clock), TokenBucket(6000, clock=clock)
+    for _ in range(600):
+        limiter.acquire(1)
+    assert limiter.throttled == 0
+    limiter.acquire(1)
+    assert limiter.throttled == 1 and clock.now == pytest.approx(0.1)
+
+    # A large request waits for its tokens: 601 were taken, 10 refilled
+    limiter.acquire(6000)
+    assert limiter.throttled == 2 and clock.now == pytest.approx(0.1 + 5.91)
+
+
+def test_transient_errors_are_retried_with_backoff():
+    client = FakeClient(reply_words=50, error_rate=0.5, seed=3)
+    sender, backoff = sender_for(client, max_retries=10)
+    for i in range(20):
+        text, _ = reply(sender, client, f"question {i}")
+        assert text == client.reply_for(f"question {i}")
+    assert sender.retries == client.errors_injected > 0
+    assert sender.failures == 0
+    # Full jitter under an exponential ceiling: 1, 2, 4, 8, 8, ...
+    assert set(backoff) <= {1, 2, 4, 8}
+
+
+def test_interrupted_reply_is_resumed_where_it_stopped():
+    client = FakeClient(reply_words=40, chunk_words=20, midstream_rate=1.0)
+    sender, _ = sender_for(client)
+    text, stream = reply(sender, client, "tell me a story")
+    assert text == client.reply_for("tell me a story")
+    assert stream.resumed and sender.resumed == 1
+    assert client.requests == 2
+
+
+def test_permanent_errors_and_exhausted_retries_raise():
+    client = FakeClient(error_rate=1.0, seed=1)
+    sender, backoff = sender_for(client, max_retries=3)
+    with pytest.raises(errors.APIError):
+        reply(sender, client, "hello")
+    assert len(backoff) == 3 and sender.failures == 1
+
+    class BadRequest(FakeClient):
+        def _stream(self, text):
+            raise errors.ClientError(400, {"error": {"code": 400, "message": "bad request"}})
+
+    client = BadRequest()
+    sender, backoff = sender_for(client)
+    with pytest.raises(errors.ClientError):
+        reply(sender, client, "hello")
+    assert backoff == [] and sender.failures == 1
+
+
+def test_cancel_ends_the_backoff():
+    client = FakeClient(error_rate=1.0, seed=1)
+    sender = ResilientSender(
+        client, "fake", RateLimiter(rpm=0, tpm=0),
+        RetryPolicy(max_retries=5, base_delay=30, max_delay=30, rng=lambda: 1.0),
+    )
+    stream = sender.stream(client.chats.create(model="fake"), "hello")
+    raised = []
+
+    def read():
+        try:
+            list(stream)
+        except errors.APIError as e:
+            raised.append(e)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    while not sender.retries:
+        time.sleep(0.01)
+    started = time.monotonic()
+    stream.cancel()
+    reader.join(5)
+    assert not reader.is_alive() and time.monotonic() - started < 1
+    assert len(raised) == 1 and client.requests == 1 and stream.cancelled
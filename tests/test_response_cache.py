@@ -0,0 +1,19 @@
+from response_cache import ResponseCache
+
+
+def test_replies_are_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    key = cache.key("model", "Hello  there")
+    cache.put(key, "General Kenobi")
+    assert cache.get(cache.key("model", "hello there")) == "General Kenobi"
+    assert ResponseCache(str(tmp_path)).get(key) == "General Kenobi"
+
+
+def test_empty_replies_are_not_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    for i, text in enumerate(["", "  \n\t "]):
+        key = cache.key("model", f"prompt {i}")
+        cache.put(key, text)
+        assert cache.get(key) is None
+        assert ResponseCache(str(tmp_path)).get(key) is None
+    assert cache.stats()["disk_entries"] == 0
@@ -0,0 +1,15 @@
+from retrieval_memory import RetrievalMemory
+
+
+def test_saved_messages_are_recalled(tmp_path):
+    memory = RetrievalMemory(str(tmp_path), min_score=0.05, dimensions=256)
+    memory.add_many([
+        ("a", 0, [dict(role="user", content="My cat Mirko sleeps on the balcony")]),
+        ("b", 0, [dict(role="user", content="Plan a trip to Šibenik in June")]),
+    ])
+    [(_, entry)] = memory.search("Mirko on the balcony", limit=1)
+    assert entry["chat_id"] == "a" and entry["position"] == 0
+    assert memory.search("sibenik trip")[0][1]["chat_id"] == "b"
+    # From that chat's first message on, passages are left out
+    assert all(e["chat_id"] != "a" for _, e in memory.search("Mirko", exclude=("a", 0)))
+    assert "Mirko" in RetrievalMemory(str(tmp_path), min_score=0.05).recall("Mirko on the balcony")
@@ -0,0 +1,64 @@
+import sqlite3
+
+from chat_catalog import ChatCatalog
+from chat_store import TranscriptStore
+from response_cache import turn_contents
+from search_index import SearchIndex
+
+
+def turn(prompt):
+    reply = f"answer about {prompt}"
+    return [dict(role="user", content=prompt), dict(role="ai", content=reply)], turn_contents(prompt, reply)
+
+
+def hits(index, query):
+    return sorted((chat_id, position) for chat_id, position, _, _ in index.search(query))
+
+
+def test_a_message_is_indexed_once(tmp_path):
+    index = SearchIndex(str(tmp_path))
+    messages, _ = turn("zucchini soup")
+    index.add_messages("c", 0, messages)
+    # The same turn again, e.g. saved while the existing chats were indexed
+    index.add_many([("c", 0, messages), ("c", 2, messages)])
+    assert hits(index, "zucchini") == [("c", 0), ("c", 1), ("c", 2), ("c", 3)]
+    # Two sessions answered in the same chat at once: same positions, other messages
+    index.add_messages("c", 2, turn("zucchini bread")[0])
+    assert hits(index, "bread") == [("c", 2), ("c", 3)]
+
+
+def test_existing_chats_are_indexed_with_what_is_readable(tmp_path):
+    data_dir = str(tmp_path)
+    catalog, store = ChatCatalog(data_dir), TranscriptStore(data_dir)
+    for chat_id, prompts in (("ok", ["kayak trip"]), ("damaged", ["kayak rental", "lost turn"])):
+        catalog.create(chat_id, chat_id)
+        for prompt in prompts:
+            store.append_turn(chat_id, *turn(prompt))
+    path = store._path("damaged")
+    with open(path, "rb") as f:
+        data = bytearray(f.read())
+    data[-3] ^= 0xFF  # the last frame no longer matches its CRC
+    with open(path, "wb") as f:
+        f.write(data)
+
+    index = SearchIndex(data_dir)
+    assert hits(index, "kayak") == [("damaged", 0), ("damaged", 1), ("ok", 0), ("ok", 1)]
+    assert hits(index, "lost") == []
+
+
+def test_index_of_unidentified_messages_is_upgraded(tmp_path):
+    index = SearchIndex(str(tmp_path))
+    index.add_messages("c", 0, turn("zucchini soup")[0])
+    index._conn.close()
+    # As left by the previous version, with a turn indexed twice
+    conn = sqlite3.connect(index.path)
+    with conn:
+        conn.execute("DROP TABLE indexed")
+        conn.execute("INSERT INTO messages (text, chat_id, position, role) VALUES ('zucchini soup', 'c', 0, 'user')")
+        conn.execute("PRAGMA user_version = 1")
+    conn.close()
+
+    index = SearchIndex(str(tmp_path))
+    assert hits(index, "zucchini") == [("c", 0), ("c", 1)]
+    index.add_messages("c", 0, turn("zucchini soup")[0])
+    assert hits(index, "zucchini") == [("c", 0), ("c", 1)]
@@ -0,0 +1,85 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from benchmarks.fake_gemini import FakeChunk
+from gemini_client import PoolStats, _CountingTransport
+from rate_limit import RateLimiter, ResilientSender
+from send_executor import RequestCancelled, SendExecutor
+
+
+@pytest.fixture
+def stalling_server():
+    """HTTP server that streams one line, then sends nothing until the test ends."""
+    release = threading.Event()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.write(b"6\r\nfirst\n\r\n")
+            self.wfile.flush()
+            release.wait(30)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    yield f"http://{host}:{port}/"
+    release.set()
+    server.shutdown()
+
+
+class StallingChat:
+    """Chat whose reply comes from `url` over the counted transport, like the SDK's."""
+
+    def __init__(self, url):
+        self.url = url
+        self.http = httpx.Client(transport=_CountingTransport(PoolStats()), timeout=60)
+
+    def send_message_stream(self, message, config=None):
+        with self.http.stream("GET", self.url) as response:
+            for line in response.iter_lines():
+                yield FakeChunk(line)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_chunks_arrive_through_the_pool():
+    executor = SendExecutor(workers=1, queue_depth=0)
+    request = executor.submit(lambda: iter([FakeChunk("a"), FakeChunk("b")]))
+    assert list(request.chunks()) == ["a", "b"]
+    assert wait_until(lambda: executor.stats()["running"] == 0)
+
+
+def test_cancel_interrupts_a_stalled_stream(stalling_server):
+    executor = SendExecutor(workers=1, queue_depth=0)
+    sender = ResilientSender(None, "model", RateLimiter(rpm=0, tpm=0))
+    send_stream = sender.stream(StallingChat(stalling_server), "hello")
+    request = executor.submit(iter, send_stream, on_cancel=send_stream.cancel)
+    chunks = request.chunks()
+    assert next(chunks) == "first"
+
+    # The worker is now blocked reading a response that sends nothing more
+    started = time.monotonic()
+    request.cancel()
+    with pytest.raises(RequestCancelled):
+        next(chunks)
+    assert wait_until(lambda: executor.stats()["running"] == 0, timeout=5)
+    assert time.monotonic() - started < 5
+    assert sender.stats()["retries"] == 0
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_modules(code, **env):
+    """Modules in sys.modules after running `code` in a fresh interpreter at the repo root."""
+    output = subprocess.run(
+        [sys.executable, "-c", f"{code}\nimport sys\nprint('\\n'.join(sys.modules))"],
+        cwd=ROOT, capture_output=True, text=True, check=True, env=dict(os.environ, **env),
+    ).stdout
+    return set(output.split())
+
+
+def test_app_is_imported_without_the_sdk():
+    modules = imported_modules("import chat_core")
+    assert "chat_core" in modules
+    assert "google.genai" not in modules
+
+
+def test_app_is_imported_without_numpy_when_the_memory_is_off():
+    assert "numpy" not in imported_modules("import chat_core", RETRIEVAL_MEMORY="0")
+
+
+def test_shared_memory_has_to_be_asked_for():
+    check = "import retrieval_memory\nassert retrieval_memory.RETRIEVAL_MEMORY is {}"
+    imported_modules(check.format(False), RETRIEVAL_MEMORY="1", USER_NAMESPACES="0")
+    imported_modules(check.format(True), RETRIEVAL_MEMORY="1", USER_NAMESPACES="1")
+    imported_modules(check.format(True), RETRIEVAL_MEMORY="1", USER_NAMESPACES="0", RETRIEVAL_MEMORY_SHARED="1")
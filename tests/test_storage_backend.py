@@ -0,0 +1,202 @@
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+import chat_store
+import storage_backend
+from chat_catalog import ChatCatalog
+from chat_store import CorruptChatError, TranscriptStore
+from response_cache import turn_contents
+from storage_backend import RedisCatalog, RedisTranscriptStore, SqliteTranscriptStore, TurnFeed
+
+
+def save_turn(store, chat_id, prompt):
+    reply = f"reply to {prompt}"
+    messages = [dict(role="user", content=prompt), dict(role="ai", content=reply, avatar="✨")]
+    store.append_turn(chat_id, messages, turn_contents(prompt, reply))
+
+
+def prompts(messages):
+    return [m["content"] for m in messages if m["role"] == "user"]
+
+
+@pytest.fixture
+def redis_server():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeServer()
+
+
+def redis_client(server):
+    import fakeredis
+
+    return fakeredis.FakeRedis(server=server)
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def open_store(request, tmp_path):
+    """Opens stores of one data directory; each Redis store has its own connection."""
+    if request.param == "sqlite":
+        return lambda: SqliteTranscriptStore(str(tmp_path))
+    server = request.getfixturevalue("redis_server")
+    return lambda: RedisTranscriptStore(str(tmp_path), client=redis_client(server))
+
+
+def test_turns_round_trip(open_store):
+    store = open_store()
+    assert store.load("c") == ([], []) and store.version("c") is None
+    for prompt in ("one", "two"):
+        save_turn(store, "c", prompt)
+    version = store.version("c")
+    save_turn(store, "c", "three")
+    assert store.version("c") != version
+    messages, history = open_store().load("c")
+    assert prompts(messages) == ["one", "two", "three"]
+    assert [c.role for c in history] == ["user", "model"] * 3
+
+
+def test_long_logs_are_compacted(open_store, monkeypatch):
+    monkeypatch.setattr(chat_store, "CHAT_COMPACT_FRAMES", 3)
+    store = open_store()
+    for i in range(5):
+        save_turn(store, "c", f"p{i}")
+    assert prompts(store.load("c")[0]) == [f"p{i}" for i in range(5)]
+    save_turn(store, "c", "p5")
+    assert prompts(open_store().load("c")[0]) == [f"p{i}" for i in range(6)]
+
+
+def test_turns_appended_during_a_compaction_are_kept(tmp_path, redis_server, monkeypatch):
+    monkeypatch.setattr(chat_store, "CHAT_COMPACT_FRAMES", 2)
+    store = RedisTranscriptStore(str(tmp_path), client=redis_client(redis_server))
+    other = RedisTranscriptStore(str(tmp_path), client=redis_client(redis_server))
+    for i in range(3):
+        save_turn(store, "c", f"p{i}")
+    read = store._read
+
+    def read_then_append(chat_id):
+        frames = read(chat_id)
+        save_turn(other, chat_id, "appended meanwhile")  # before the rewrite
+        return frames
+
+    monkeypatch.setattr(store, "_read", read_then_append)
+    assert prompts(store.load("c")[0]) == ["p0", "p1", "p2"]
+    # The rewrite was skipped instead of dropping the new turn
+    monkeypatch.undo()
+    assert prompts(store.load("c")[0]) == ["p0", "p1", "p2", "appended meanwhile"]
+
+
+def test_damaged_frame_is_skipped_and_kept(open_store):
+    store = open_store()
+    for prompt in ("one", "two"):
+        save_turn(store, "c", prompt)
+    damaged = b"\x01not a zlib stream"
+    if isinstance(store, SqliteTranscriptStore):
+        with store._conn:
+            store._insert("c", damaged)
+    else:
+        store._redis.rpush(store._key("log", "c"), damaged)
+
+    with pytest.raises(CorruptChatError) as caught:
+        store.load("c")
+    assert caught.value.skipped == 1 and prompts(caught.value.messages) == ["one", "two"]
+    assert prompts(open_store().load("c")[0]) == ["one", "two"]
+
+
+def test_chat_saved_in_a_file_is_imported_once(open_store, tmp_path):
+    files = TranscriptStore(str(tmp_path))
+    for prompt in ("old one", "old two"):
+        save_turn(files, "c", prompt)
+    path = files._path("c")
+
+    store = open_store()
+    assert prompts(store.load("c")[0]) == ["old one", "old two"]
+    assert not os.path.exists(path) and os.path.exists(path + ".migrated")
+    save_turn(store, "c", "new")
+    assert prompts(open_store().load("c")[0]) == ["old one", "old two", "new"]
+
+
+def test_turn_appended_during_the_import_goes_after_it(open_store, tmp_path, monkeypatch):
+    files = TranscriptStore(str(tmp_path))
+    save_turn(files, "c", "old")
+    store, other = open_store(), open_store()
+    saved_file = store._saved_file
+
+    def read_file_then_append(chat_id):
+        frame = saved_file(chat_id)
+        save_turn(other, chat_id, "appended meanwhile")  # another replica's turn
+        return frame
+
+    monkeypatch.setattr(store, "_saved_file", read_file_then_append)
+    assert prompts(store.load("c")[0]) == ["old", "appended meanwhile"]
+    monkeypatch.undo()
+    assert prompts(open_store().load("c")[0]) == ["old", "appended meanwhile"]
+
+
+def test_threads_appending_to_one_chat_lose_nothing(open_store):
+    def writer(number):
+        store = open_store()
+        for turn in range(25):
+            save_turn(store, "shared", f"p{number}-{turn}")
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    saved = prompts(open_store().load("shared")[0])
+    assert sorted(saved) == sorted(f"p{n}-{t}" for n in range(4) for t in range(25))
+
+
+def _sqlite_writer(data_dir, number, turns):
+    storage_backend._sqlite_database.cache_clear()  # a connection of its own
+    store = SqliteTranscriptStore(data_dir)
+    for turn in range(turns):
+        save_turn(store, "shared", f"p{number}-{turn}")
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_processes_appending_to_one_sqlite_chat_lose_nothing(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_sqlite_writer, args=(str(tmp_path), n, 25)) for n in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+    saved = prompts(SqliteTranscriptStore(str(tmp_path)).load("shared")[0])
+    assert sorted(saved) == sorted(f"p{n}-{t}" for n in range(4) for t in range(25))
+
+
+def test_redis_catalog(tmp_path, redis_server):
+    local = ChatCatalog(str(tmp_path))
+    local.create("old", "Saved before redis", message_count=4)
+    catalog = RedisCatalog(str(tmp_path), client=redis_client(redis_server))
+    assert catalog.get("old")["message_count"] == 4
+
+    catalog.create("new", "New chat...")
+    catalog.create("new", "ignored")
+    catalog.record_turns({"new": 2, "missing": 2})
+    assert [chat_id for chat_id, _ in catalog.recent(10)] == ["new", "old"]
+    assert catalog.get("new")["message_count"] == 2 and "missing" not in catalog
+
+    catalog.rename("old", "Renamed by hand")
+    renamed = catalog.replace_titles({"new": ("New chat...", "Better"), "old": ("Saved before redis", "x")})
+    assert renamed == 1
+    assert catalog.title("new") == "Better" and catalog.title("old") == "Renamed by hand"
+    # Imported once: a second replica does not bring back the old entries
+    local.create("later", "Only on this disk")
+    assert "later" not in RedisCatalog(str(tmp_path), client=redis_client(redis_server))
+
+
+def test_turn_feed(tmp_path, redis_server):
+    feed = TurnFeed(str(tmp_path), client=redis_client(redis_server))
+    assert feed.last_id() == TurnFeed.START
+    assert feed.read(TurnFeed.START) == (TurnFeed.START, [])
+    message = [dict(role="user", content="hi")]
+    feed.publish([("a", 0, message)])
+    feed.publish([("b", 0, message), ("a", 2, message)])
+    cursor, batches = feed.read(TurnFeed.START)
+    assert cursor == feed.last_id()
+    assert [(chat_id, start) for chat_id, start, _ in batches] == [("a", 0), ("b", 0), ("a", 2)]
+    assert feed.read(cursor) == (cursor, [])
@@ -0,0 +1,44 @@
+import json
+import os
+
+from turn_metrics import TurnMetrics, TurnTimer
+
+
+def turn(source="api", total=0.3):
+    timer = TurnTimer(clock=iter([0.0, total]).__next__)
+    return timer.finish(output_tokens=10, source=source)
+
+
+def test_turns_reach_both_files_whole(tmp_path, monkeypatch):
+    path, log_path = tmp_path / "metrics.prom", tmp_path / "turns.jsonl"
+    metrics = TurnMetrics(str(path), str(log_path), interval=60)
+    written = []
+    real_replace = os.replace
+    monkeypatch.setattr(os, "replace", lambda src, dst: written.append(dst) or real_replace(src, dst))
+
+    metrics.observe(turn())
+    metrics.close()
+    text = path.read_text()
+    assert 'chat_turns_total{source="api"} 1' in text
+    assert 'chat_total_seconds_bucket{le="0.5"} 1' in text
+    assert [json.loads(line)["total"] for line in log_path.read_text().splitlines()] == [0.3]
+    assert written == [str(path)]
+    assert sorted(os.listdir(tmp_path)) == ["metrics.prom", "turns.jsonl"]
+
+
+def test_turns_arriving_together_share_a_write(tmp_path, monkeypatch):
+    path = tmp_path / "metrics.prom"
+    metrics = TurnMetrics(str(path), "", interval=60)
+    metrics.collectors.append(lambda: "chat_extra 1\n")
+    writes = []
+    real_replace = os.replace
+    monkeypatch.setattr(os, "replace", lambda src, dst: writes.append(dst) or real_replace(src, dst))
+
+    for _ in range(50):
+        metrics.observe(turn(source="cache"))
+    metrics.close()
+    text = path.read_text()
+    assert 'chat_turns_total{source="cache"} 50' in text
+    assert text.endswith("chat_extra 1\n")
+    # The first turn may be written on its own, the rest wait for the interval or close()
+    assert len(writes) <= 2
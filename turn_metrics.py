@@ -0,0 +1,233 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+import streamlit as st
+
+# ------------------------------
+# Per-turn performance metrics
+# ------------------------------
+# Every chat turn is timed phase by phase (TurnTimer) and reported three ways:
+#
+#   - one JSON line per turn to the "chat.metrics" logger, and to METRICS_LOG
+#     when it is set
+#   - Prometheus text format in METRICS_FILE, for the node_exporter textfile
+#     collector or any scraper that reads a file
+#   - the last METRICS_RECENT turns of the session in the CHAT_DEBUG sidebar
+#
+#   METRICS_FILE           Prometheus text file, "" disables  (default data/metrics.prom)
+#   METRICS_FILE_INTERVAL  least seconds between rewrites    (default 1)
+#   METRICS_LOG            JSON-lines file, "" = logger only   (default "")
+#   METRICS_RECENT         turns shown in the debug panel      (default 10)
+#
+# Both files are written by a background thread, so a turn never waits for
+# the disk: METRICS_FILE is replaced whole (a scraper never reads half of
+# it) at most every METRICS_FILE_INTERVAL seconds while turns arrive.
+#
+# Phases, in seconds:
+#
+#   history    reading the live chat's history (get_history)
+#   retrieval  retrieval memory lookup (see retrieval_memory.py)
+#   cache      response cache lookup
+#   queue      waiting for a send worker
+#   ttft       from sending the request to the first chunk
+#   stream     from the first to the last chunk
+#   render     redrawing the reply (part of stream)
+#   persist    handing the turn to the write-behind queue (see persist_queue.py)
+#   total      the whole turn, from the prompt to the saved turn
+
+METRICS_FILE = os.environ.get("METRICS_FILE", os.path.join("data", "metrics.prom"))
+METRICS_FILE_INTERVAL = float(os.environ.get("METRICS_FILE_INTERVAL", 1))
+METRICS_LOG = os.environ.get("METRICS_LOG", "")
+METRICS_RECENT = int(os.environ.get("METRICS_RECENT", 10))
+
+PHASES = ("history", "retrieval", "cache", "queue", "ttft", "stream", "render", "persist", "total")
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+log = logging.getLogger("chat.metrics")
+
+
+class TurnTimer:
+    """Collects the phase timings of one chat turn."""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.spans = {}
+        self.marks = {}
+
+    def span(self, name):
+        """Context manager that adds the time spent inside it to `name`."""
+        return _Span(self, name)
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def mark(self, name):
+        """Remember when `name` first happened in this turn."""
+        if name not in self.marks:
+            self.marks[name] = self.clock() - self.started
+
+    def finish(self, output_tokens=0, **fields):
+        """The turn's record: phase timings, tokens/sec and `fields`."""
+        record = dict(fields)
+        record["ts"] = round(time.time(), 3)
+        phases = dict(self.spans)
+        sent, first, last = (self.marks.get(m) for m in ("sent", "first_token", "last_token"))
+        if sent is not None and first is not None:
+            phases["ttft"] = first - sent
+        if first is not None and last is not None:
+            phases["stream"] = last - first
+        phases["total"] = self.clock() - self.started
+        record.update({name: round(phases[name], 4) for name in PHASES if name in phases})
+        record["output_tokens"] = output_tokens
+        stream = phases.get("stream", 0.0)
+        record["tokens_per_sec"] = round(output_tokens / stream, 1) if stream > 0 else None
+        return record
+
+
+class _Span:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = self.timer.clock()
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, self.timer.clock() - self.started)
+
+
+class TurnMetrics:
+    """Process-wide aggregates of turn records, exported as Prometheus text."""
+
+    def __init__(self, path=None, log_path=None, interval=None):
+        path = METRICS_FILE if path is None else path
+        log_path = METRICS_LOG if log_path is None else log_path
+        # Resolved once: the thread may still write after the working directory changed
+        self.path = os.path.abspath(path) if path else ""
+        self.log_path = os.path.abspath(log_path) if log_path else ""
+        self.interval = METRICS_FILE_INTERVAL if interval is None else interval
+        self._cond = threading.Condition()
+        self.turns = {}  # source -> count
+        self.output_tokens = 0
+        self.phase_sum = {name: 0.0 for name in PHASES}
+        self.phase_count = {name: 0 for name in PHASES}
+        self.buckets = {name: [0] * len(LATENCY_BUCKETS) for name in ("ttft", "total")}
+        # Functions returning more Prometheus text for METRICS_FILE
+        self.collectors = []
+        self._lines = []  # JSON lines not yet appended to log_path
+        self._dirty = False  # turns observed since the file was last written
+        self._closed = False
+        self._thread = None
+        if self.path or self.log_path:
+            self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+            self._thread.start()
+
+    def observe(self, record):
+        """Add one turn record and log it; the files are written in the background."""
+        line = json.dumps(record, ensure_ascii=False)
+        with self._cond:
+            source = record.get("source", "api")
+            self.turns[source] = self.turns.get(source, 0) + 1
+            self.output_tokens += record.get("output_tokens", 0)
+            for name in PHASES:
+                if record.get(name) is None:
+                    continue
+                self.phase_sum[name] += record[name]
+                self.phase_count[name] += 1
+                if name in self.buckets:
+                    for i, bound in enumerate(LATENCY_BUCKETS):
+                        if record[name] <= bound:
+                            self.buckets[name][i] += 1
+            if self.log_path:
+                self._lines.append(line)
+            self._dirty = True
+            self._cond.notify_all()
+        log.info(line)
+
+    def close(self, timeout=5):
+        """Write what is still pending and stop the thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def prometheus(self):
+        lines = [
+            "# HELP chat_turns_total Chat turns answered, by source (api or cache).",
+            "# TYPE chat_turns_total counter",
+        ]
+        for source, count in sorted(self.turns.items()):
+            lines.append(f'chat_turns_total{{source="{source}"}} {count}')
+        lines += [
+            "# HELP chat_output_tokens_total Estimated tokens in the replies.",
+            "# TYPE chat_output_tokens_total counter",
+            f"chat_output_tokens_total {self.output_tokens}",
+            "# HELP chat_turn_phase_seconds Time spent in each phase of a turn.",
+            "# TYPE chat_turn_phase_seconds summary",
+        ]
+        for name in PHASES:
+            lines.append(f'chat_turn_phase_seconds_sum{{phase="{name}"}} {self.phase_sum[name]:.6f}')
+            lines.append(f'chat_turn_phase_seconds_count{{phase="{name}"}} {self.phase_count[name]}')
+        for name, help_text in (
+            ("ttft", "Time to first token."),
+            ("total", "Whole turn latency."),
+        ):
+            metric = f"chat_{name}_seconds"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+            for bound, count in zip(LATENCY_BUCKETS, self.buckets[name]):
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {self.phase_count[name]}')
+            lines.append(f"{metric}_sum {self.phase_sum[name]:.6f}")
+            lines.append(f"{metric}_count {self.phase_count[name]}")
+        text = "\n".join(lines) + "\n"
+        return text + "".join(collector() for collector in self.collectors)
+
+    # ------------------------------
+    # Background thread
+    # ------------------------------
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if not self._dirty:
+                    return  # closed and nothing left
+                lines, self._lines = self._lines, []
+                self._dirty = False
+                text = self.prometheus() if self.path else None
+            try:
+                if lines:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write("".join(line + "\n" for line in lines))
+                if text is not None:
+                    _write_atomic(self.path, text)
+            except OSError:
+                log.exception("Writing the metrics files failed")
+            # Turns arriving meanwhile are written together
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed, self.interval)
+
+
+def _write_atomic(path, text):
+    # Scrapers never see a half-written file
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+@st.cache_resource(show_spinner=False)
+def get_turn_metrics():
+    """The process-wide metrics shared by all sessions; written out at exit."""
+    turn_metrics = TurnMetrics()
+    atexit.register(turn_metrics.close)
+    return turn_metrics
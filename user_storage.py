@@ -0,0 +1,132 @@
+import hashlib
+import os
+import secrets
+from http.cookies import CookieError, SimpleCookie
+
+import streamlit as st
+
+# ------------------------------
+# Per-user storage
+# ------------------------------
+# With USER_NAMESPACES=1 every user gets a directory of their own, holding
+# their chat files, catalog, search index and retrieval memory, so the
+# sidebar lists only their chats and listing or loading them costs the
+# same however many users the deployment has. Directories are sharded by
+# the first two hex digits of the user key, so no directory holds more
+# than a fraction of the users:
+#
+#   data/users/3f/3fa94c.../chats.db, search.db, memory/, [chat_id].chat
+#
+# The user is taken from the first of these that the request carries:
+#
+#   USER_HEADER       header set by an authenticating proxy, e.g. X-Forwarded-User
+#                     (default "", not used)
+#   USER_COOKIE       cookie set by your login, e.g. a session cookie (default "", not used)
+#   USER_QUERY_PARAM  private token in the URL (default "token"; "" to not use it)
+#
+# A session with no query token gets a new random one in its URL, so the
+# link is the key to its chats; bookmark it to come back. When the query
+# token is off and neither the header nor the cookie is present, the app
+# refuses to start instead of showing a shared space.
+#
+# The value is never used as a path: the user key is a SHA-256 of it (with
+# USER_KEY_SALT, default ""). Without USER_NAMESPACES everything stays in
+# data/ as before; chats saved there are not moved into a user's space.
+# The response cache and the metrics file are shared by all users.
+
+USER_NAMESPACES = os.environ.get("USER_NAMESPACES", "0") == "1"
+USER_HEADER = os.environ.get("USER_HEADER", "")
+USER_COOKIE = os.environ.get("USER_COOKIE", "")
+USER_QUERY_PARAM = os.environ.get("USER_QUERY_PARAM", "token")
+USER_KEY_SALT = os.environ.get("USER_KEY_SALT", "")
+
+# Users whose stores (SQLite connections, retrieval vectors) stay open per process
+USER_OPEN_STORES = int(os.environ.get("USER_OPEN_STORES", 256))
+
+DATA_DIR = "data"
+
+
+def user_key(source, value):
+    """Hex key of one user, from where the identity came from and its value."""
+    digest = hashlib.sha256(f"{USER_KEY_SALT}\0{source}\0{value}".encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def user_dir(key, root=DATA_DIR):
+    """The sharded directory of a user key."""
+    return os.path.join(root, "users", key[:2], key)
+
+
+def _headers():
+    context = getattr(st, "context", None)  # Streamlit >= 1.37
+    if context is not None:
+        return context.headers
+    try:
+        from streamlit.web.server.websocket_headers import _get_websocket_headers
+    except ImportError:
+        return {}
+    return _get_websocket_headers() or {}
+
+
+def _cookie(headers, name):
+    try:
+        cookie = SimpleCookie(headers.get("Cookie") or "")
+    except CookieError:
+        return None
+    morsel = cookie.get(name)
+    return morsel.value if morsel is not None else None
+
+
+def _query_token():
+    try:
+        return st.query_params.get(USER_QUERY_PARAM)
+    except AttributeError:
+        # Streamlit < 1.30
+        return (st.experimental_get_query_params().get(USER_QUERY_PARAM) or [None])[0]
+
+
+def _set_query_token(token):
+    try:
+        st.query_params[USER_QUERY_PARAM] = token
+    except AttributeError:
+        # Streamlit < 1.30
+        params = st.experimental_get_query_params()
+        params[USER_QUERY_PARAM] = token
+        st.experimental_set_query_params(**params)
+
+
+def session_identity():
+    """(source, value) identifying this session's user, or None.
+
+    Gives the session a new query token when that is the only source.
+    """
+    headers = _headers()
+    if USER_HEADER and headers.get(USER_HEADER):
+        return "header", headers.get(USER_HEADER)
+    if USER_COOKIE:
+        value = _cookie(headers, USER_COOKIE)
+        if value:
+            return "cookie", value
+    if USER_QUERY_PARAM:
+        token = _query_token()
+        if not token:
+            token = secrets.token_urlsafe(24)
+            _set_query_token(token)
+        return "token", token
+    return None
+
+
+def session_data_dir(root=DATA_DIR):
+    """Directory of this session's chats; None if the user is unknown.
+
+    Resolved once per session: headers and cookies do not change while a
+    session is open, and a different token in the URL starts a new one.
+    """
+    if not USER_NAMESPACES:
+        return root
+    if "data_dir" not in st.session_state:
+        identity = session_identity()
+        if identity is None:
+            return None
+        st.session_state.data_dir = user_dir(user_key(*identity), root)
+    return st.session_state.data_dir